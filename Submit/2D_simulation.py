@@ -0,0 +1,243 @@
+import imgui
+import numpy as np
+from OpenGL.GL import *
+import glfw
+import pyopencl as cl
+
+from game_engine import GameEngine
+from pixel_buffer_uploader import PixelBufferUploader
+from shader_program import ShaderProgram
+from simulation_data import SETTINGS_2D_DTYPE, SPORE_2D_DTYPE
+
+# Colour ramp of the trails from empty to full, RGBA, must have PALETTE_SIZE stops of Shaders/2d_simulation.cl
+TRAIL_PALETTE = np.array([
+    [0.0, 0.0, 0.0, 1.0],
+    [0.05, 0.1, 0.45, 1.0],
+    [0.2, 0.75, 0.85, 1.0],
+    [1.0, 1.0, 0.9, 1.0],
+], dtype=np.float32)
+
+
+class Simulation2D(GameEngine):
+    """
+    The 2D slime mold on a single channel float trail map with diffusion.
+
+    The map is coloured on the device, straight into the displayed texture when OpenCL can share it with GL, or
+    through a ring of pixel buffers otherwise. The map has its own resolution, the texture is stretched to the window.
+    """
+
+    def __init__(self, window_width, window_height, simulation_width=None, simulation_height=None,
+                 spore_count=1_000_000, title="Slime Mold Sim 2D", target_framerate=60, gl_sharing=True):
+        super().__init__(window_width, window_height, title, "Shaders/2d_simulation.cl", target_framerate,
+                         gl_sharing=gl_sharing)
+        # Set basic values
+        self.simulation_width = simulation_width or window_width
+        self.simulation_height = simulation_height or window_height
+        self.spore_count = spore_count
+
+        self.spore_speed = 60
+        self.decay_speed = 0.3
+        self.turn_speed = 2
+        self.sensor_distance = 9
+        self.diffuse_speed = 3
+
+        # Settings Buffer
+        self.settings_dtype = SETTINGS_2D_DTYPE
+        self.settings_buffer = self.initialize_buffer(self.get_settings())
+        self.palette_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR,
+                                        hostbuf=TRAIL_PALETTE)
+
+        # Spores are spawned on the device, millions don't have to be built on the host
+        self.spores_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE,
+                                       size=max(spore_count, 1) * SPORE_2D_DTYPE.itemsize)
+        map_shape = (self.simulation_width, self.simulation_height)
+        self.initialize_spores_launcher = self.create_kernel_launcher("initialize_spores", (max(spore_count, 1),),
+                                                                      self.spores_buffer, self.settings_buffer,
+                                                                      np.uint32(0))
+        self.initialize_spores()
+
+        # Trail maps, diffusion reads one and writes the other
+        map_bytes = self.simulation_width * self.simulation_height * np.dtype(np.float32).itemsize
+        self.trail_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=map_bytes)
+        self.next_trail_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=map_bytes)
+        cl.enqueue_fill_buffer(self.cl_queue, self.trail_buffer, np.float32(0), 0, map_bytes)
+
+        # Kernel launchers, the trail maps are bound again after every swap
+        self.move_spores_launcher = self.create_kernel_launcher("move_spores", (max(spore_count, 1),),
+                                                                self.spores_buffer, self.trail_buffer,
+                                                                self.settings_buffer, np.float32(0))
+        self.draw_spores_launcher = self.create_kernel_launcher("draw_spores", (max(spore_count, 1),),
+                                                                self.trail_buffer, self.spores_buffer,
+                                                                self.settings_buffer)
+        self.diffuse_trails_launcher = self.create_kernel_launcher("diffuse_trails", map_shape, self.trail_buffer,
+                                                                   self.next_trail_buffer, self.settings_buffer,
+                                                                   np.float32(0))
+        for launcher in (self.move_spores_launcher, self.draw_spores_launcher, self.diffuse_trails_launcher):
+            self.work_group_tuner.apply(launcher, (self.spores_buffer, self.trail_buffer, self.next_trail_buffer))
+
+        # Texture the trails are shown with, written by OpenCL directly or filled from the pixel buffers
+        self.shader_program = ShaderProgram("Shaders/2D_vertex_shader.glsl", "Shaders/2D_fragment_shader.glsl")
+        self.texture_location = glGetUniformLocation(self.shader_program.program, "texture1")
+        self.texture = self.initialize_texture(self.simulation_width, self.simulation_height)
+        self.vao, self.vbo = self.setup_rendering()
+
+        if self.gl_sharing:
+            self.shared_texture = cl.GLTexture(self.cl_context, cl.mem_flags.WRITE_ONLY, GL_TEXTURE_2D, 0,
+                                               self.texture, 2)
+            self.colorize_launcher = self.create_kernel_launcher("colorize_trails_image", map_shape,
+                                                                 self.trail_buffer, self.settings_buffer,
+                                                                 self.palette_buffer, self.shared_texture)
+            self.uploader = None
+        else:
+            self.pixels_buffer = cl.Buffer(self.cl_context, cl.mem_flags.WRITE_ONLY,
+                                           size=self.simulation_width * self.simulation_height * 4)
+            self.colorize_launcher = self.create_kernel_launcher("colorize_trails", map_shape, self.trail_buffer,
+                                                                 self.settings_buffer, self.palette_buffer,
+                                                                 self.pixels_buffer)
+            self.uploader = PixelBufferUploader(self.cl_queue, self.texture, self.simulation_width,
+                                                self.simulation_height)
+        print("Showing the trails through", "a shared texture" if self.gl_sharing else "pixel buffers")
+
+    def get_settings(self):
+        return np.array([(self.spore_count, self.simulation_width, self.simulation_height, self.spore_speed,
+                          self.decay_speed, self.turn_speed, self.sensor_distance, self.diffuse_speed)],
+                        dtype=self.settings_dtype)
+
+    def initialize_spores(self, seed=None):
+        """Spawns every spore on the device"""
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 32 - 1, dtype=np.uint32)
+        self.initialize_spores_launcher.set_arg(2, np.uint32(seed))
+        self.initialize_spores_launcher()
+
+    @staticmethod
+    def initialize_texture(width, height):
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture
+
+    def setup_rendering(self):
+        """A quad as large as the window allows at the simulation's aspect ratio"""
+        framebuffer_width, framebuffer_height = glfw.get_framebuffer_size(self.window)
+        aspect_ratio = (self.simulation_width / self.simulation_height) / (framebuffer_width / framebuffer_height)
+        half_width, half_height = min(1.0, aspect_ratio), min(1.0, 1.0 / aspect_ratio)
+
+        vertex_data = np.array([
+            -half_width, -half_height, 0.0, 0.0,  # Triangle 1, Bottom-left
+            half_width, -half_height, 1.0, 0.0,  # Triangle 1, Bottom-right
+            -half_width, half_height, 0.0, 1.0,  # Triangle 1, Top-left
+            half_width, -half_height, 1.0, 0.0,  # Triangle 2, Bottom-right
+            -half_width, half_height, 0.0, 1.0,  # Triangle 2, Top-left
+            half_width, half_height, 1.0, 1.0  # Triangle 2, Top-right
+        ], dtype=np.float32)
+
+        vao = glGenVertexArrays(1)
+        glBindVertexArray(vao)
+
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
+
+        # Position attribute
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(0)
+        # Texture coordinate attribute
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(2 * vertex_data.itemsize))
+        glEnableVertexAttribArray(1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindVertexArray(0)
+
+        return vao, vbo
+
+    def simulate(self, delta_time):
+        """Moves the spores, lays their trails and diffuses the map"""
+        delta_time = np.float32(delta_time)
+
+        self.move_spores_launcher.set_arg(3, delta_time)
+        self.move_spores_launcher()
+        self.draw_spores_launcher()
+
+        self.diffuse_trails_launcher.set_arg(3, delta_time)
+        self.diffuse_trails_launcher()
+
+        # The diffused map is the current one from here on
+        self.trail_buffer, self.next_trail_buffer = self.next_trail_buffer, self.trail_buffer
+        self.move_spores_launcher.set_arg(1, self.trail_buffer)
+        self.draw_spores_launcher.set_arg(0, self.trail_buffer)
+        self.diffuse_trails_launcher.set_args(self.trail_buffer, self.next_trail_buffer, self.settings_buffer,
+                                              delta_time)
+        self.colorize_launcher.set_arg(0, self.trail_buffer)
+
+    def colorize(self):
+        """Colours the map into the texture"""
+        if self.gl_sharing:
+            # GL must be done with the texture before OpenCL takes it, and the other way round
+            glFinish()
+            cl.enqueue_acquire_gl_objects(self.cl_queue, [self.shared_texture])
+            self.colorize_launcher()
+            cl.enqueue_release_gl_objects(self.cl_queue, [self.shared_texture])
+            self.cl_queue.finish()
+        else:
+            self.uploader.upload(self.pixels_buffer, wait_for=[self.colorize_launcher()])
+
+    def update(self):
+        self.simulate(self.delta_time)
+        self.colorize()
+
+    def render(self):
+        glUseProgram(self.shader_program.program)
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(self.texture_location, 0)
+
+        glBindVertexArray(self.vao)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glDrawArrays(GL_TRIANGLES, 0, 6)
+
+        # Clean up
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def render_gui(self):
+        # Set the window's background alpha (transparency) to 0.8 (1.0 is opaque, 0.0 is transparent)
+        imgui.push_style_var(imgui.STYLE_ALPHA, 0.8)
+
+        # Start a new ImGui window
+        if imgui.begin("Simulation Parameters"):
+            changed = False
+            changed |= self.slider("Spore Speed", "spore_speed", 5.0, 200.0)
+            changed |= self.slider("Decay Speed", "decay_speed", 0.01, 2.0)
+            changed |= self.slider("Diffuse Speed", "diffuse_speed", 0.0, 20.0)
+            changed |= self.slider("Sensor Distance", "sensor_distance", 1.0, 30.0)
+            changed |= self.slider("Turn Speed", "turn_speed", 0.0, 10.0)
+            if changed:
+                # Update the settings buffer if necessary
+                self.update_settings_buffer()
+
+            if imgui.button("Respawn"):
+                self.initialize_spores()
+
+            imgui.text(f"Spores: {self.spore_count}")
+            imgui.text(f"Map: {self.simulation_width}x{self.simulation_height}")
+            imgui.text(f"FPS: {self.frame_rate}")
+
+        imgui.end()
+        imgui.pop_style_var()
+
+    def slider(self, label, attribute, min_value, max_value):
+        changed, value = imgui.slider_float(label, getattr(self, attribute), min_value, max_value)
+        setattr(self, attribute, value)
+        return changed
+
+    def update_settings_buffer(self):
+        cl.enqueue_copy(self.cl_queue, self.settings_buffer, self.get_settings())
+
+
+if __name__ == '__main__':
+    game = Simulation2D(1280, 720, 3840, 2160, spore_count=2_000_000, target_framerate=60)
+    game.run()
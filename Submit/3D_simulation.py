@@ -1,89 +1,275 @@
-import imgui
 import numpy as np
-from OpenGL.GL import *
 from game_engine import GameEngine
 import glm
 import pyopencl as cl
+import math
+import time
 
-from shader_program import ShaderProgram
-from simulation_renderer_3D import SimulationRenderer3D
+from buffer_pool import BufferPool
 from camera_mover import CameraHandler3D
+from connected_components import ConnectedComponents
+from quality_controller import QualityController
+from simulation_metrics import METRIC_HISTOGRAM, METRIC_MAX_BINS, SimulationMetrics
+from simulation_data import (BOUNDARY_MODES, SETTINGS_DTYPE, SPECIES_SETTINGS_DTYPE, SPECIES_SPORE_DTYPE,
+                             SPORE_DISTRIBUTIONS, SPORE_DTYPE)
+
+# The GUI and GL modules (imgui, glfw, OpenGL and the renderers) are imported by the methods that draw, so headless
+# runs never load them
 
 
 class Simulation3D(GameEngine):
     def __init__(self, window_width, window_height, simulation_size=10, spore_count=300, title="Slime Mold Sim 2D",
-                 target_framerate=60):
-        super().__init__(window_width, window_height, title, "Shaders/3d_simulation.cl", target_framerate)
+                 target_framerate=60, spore_distribution="cube", metrics_directory=None, threaded=False,
+                 headless=False, adaptive_quality=False, species_count=1, boundary_mode="bounce",
+                 deposit_mode="mark"):
+        # Several species build the species kernels on top, SPECIES_COUNT gives every spore its species
+        self.species_count = max(1, int(species_count))
+        cl_files = ["Shaders/3d_simulation.cl"]
+        build_options = []
+        if self.species_count > 1:
+            cl_files.append("Shaders/species_simulation.cl")
+            build_options = ["-D", f"SPECIES_COUNT={self.species_count}"]
+        super().__init__(window_width, window_height, title, cl_files, target_framerate, threaded, headless,
+                         build_options=build_options)
+        phase_start = time.perf_counter()
+
         # Set basic values
         self.simulation_size = simulation_size
 
         self.spore_count = spore_count
-        self.spores = self.initialize_spores()
-        self.spores_buffer = self.initialize_buffer(self.spores)
+        self.max_spore_count = max(spore_count * 10, 1000)
+        self.spore_distribution = spore_distribution
+        self.spore_radius = self.simulation_size / 4
 
         self.spore_speed = 17
         self.decay_speed = 0.4
         self.sensor_distance = 14
         self.turn_speed = 11
 
+        # Spores bounce off the walls, or come back in on the other side of a periodic domain
+        self.boundary_mode = boundary_mode
+
+        # Spores mark their voxel full, or add deposit_amount up to the saturation so the trails show the traffic
+        self.deposit_modes = ["mark", "accumulate"]
+        self.deposit_mode = deposit_mode
+        self.deposit_amount = 0.25
+        self.deposit_saturation = 1.0
+
         # Dtype for the settings
-        self.settings_dtype = np.dtype([
-            ('spore_count', np.uint32),
-            ('simulation_size', np.uint32),
-            ('spore_speed', np.float32),
-            ('decay_speed', np.float32),
-            ('turn_speed', np.float32),
-            ('sensor_distance', np.float32),
-        ])
+        self.settings_dtype = SETTINGS_DTYPE
 
         # Buffers
 
         # Settings Buffer
         self.settings = np.array([(self.spore_count, self.simulation_size, self.spore_speed, self.decay_speed,
-                                   self.turn_speed, self.sensor_distance)], dtype=self.settings_dtype)
+                                   self.turn_speed, self.sensor_distance, BOUNDARY_MODES.index(self.boundary_mode))],
+                                 dtype=self.settings_dtype)
         self.settings_buffer = self.initialize_buffer(self.settings)
 
-        # Random Seeds buffer
-        self.random_seeds = np.random.randint(0, 2 ** 32 - 1, size=self.spore_count + 1, dtype=np.uint32)
-        self.random_seeds_buffer = self.initialize_buffer(self.random_seeds)
+        # Settings of every species, the species kernels read them from constant memory. They all start out from the
+        # settings above, with the other species' trails pushing away.
+        self.spore_dtype = SPECIES_SPORE_DTYPE if self.species_count > 1 else SPORE_DTYPE
+        self.species_settings = np.zeros(self.species_count, dtype=SPECIES_SETTINGS_DTYPE)
+        for field in ("spore_speed", "decay_speed", "turn_speed", "sensor_distance"):
+            self.species_settings[field] = getattr(self, field)
+        self.species_settings["repulsion"] = 0.5
+        self.species_settings_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR,
+                                                 hostbuf=self.species_settings)
+        self.selected_species = 0
+
+        # Spores and their random seeds are filled on the device by initialize_spores, the buffers hold up to the
+        # capacity so the population can change without reallocating every time
+        self.spore_capacity = max(self.spore_count, 1)
+        self.spores_buffer, self.random_seeds_buffer = self.create_spore_buffers(self.spore_capacity)
+        self.initialize_spores_launcher = self.create_kernel_launcher(
+            "initialize_spores", (self.spore_capacity,), self.spores_buffer, self.random_seeds_buffer,
+            self.settings_buffer, np.uint32(0), np.uint32(0), np.float32(0), np.uint32(0))
+        self.compact_spores_launcher = self.create_kernel_launcher("compact_spores", (1,), self.spores_buffer,
+                                                                   self.random_seeds_buffer, None, None, np.uint32(0))
+        self.initialize_spores()
+
+        # Volume Buffer, zeroed on the device so no host volume has to be built and copied over
+        volume_bytes = self.simulation_size ** 3 * np.dtype(np.float32).itemsize
+        self.volume_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=volume_bytes)
+        cl.enqueue_fill_buffer(self.cl_queue, self.volume_buffer, np.float32(0), 0, volume_bytes)
+
+        # Buffers sized by the simulation size come from the pool, so resizing back and forth reuses them
+        self.buffer_pool = BufferPool(self.cl_context)
+
+        # Trail channels the spores sense, interleaved per voxel for several species, the volume itself for one
+        self.channels_buffer = self.create_channels_buffer()
+
+        # Counters the kernels add metrics into, bounces are counted every step even without a metrics stage
+        self.metric_counters_buffer = self.initialize_buffer(np.zeros(METRIC_HISTOGRAM + METRIC_MAX_BINS,
+                                                                      dtype=np.uint32))
+
+        # Instance buffers, the cull kernel appends every visible voxel into these
+        self.max_instances = self.simulation_size ** 3
+        self.instance_positions_buffer = self.buffer_pool.acquire(self.max_instances * 3 * np.dtype(np.float32).itemsize)
+        self.instance_sizes_buffer = self.buffer_pool.acquire(self.max_instances * np.dtype(np.float32).itemsize)
+
+        # Indirect draw command (count, instanceCount, firstIndex, baseVertex, baseInstance)
+        self.draw_command = np.array([36, 0, 0, 0, 0], dtype=np.uint32)
+        self.draw_command_buffer = self.initialize_buffer(self.draw_command)
+
+        # Cull data: model-view-projection matrix (16 floats) followed by the 6 frustum planes (24 floats)
+        self.cull_data = np.zeros(16 + 24, dtype=np.float32)
+        self.cull_data_buffer = self.initialize_buffer(self.cull_data)
+
+        # Frustum culling by this simulation's camera, the simulation server keeps everything instead
+        self.frustum_culling = not self.headless
+
+        # Occlusion culling against the previous frame's depth, reduced to the farthest depth per tile
+        self.occlusion_culling = False
+        self.depth_tile_size = 16
+        if self.window:
+            import glfw
+            self.framebuffer_width, self.framebuffer_height = glfw.get_framebuffer_size(self.window)
+        else:
+            self.framebuffer_width, self.framebuffer_height = self.window_width, self.window_height
+        tile_columns = -(-self.framebuffer_width // self.depth_tile_size)
+        tile_rows = -(-self.framebuffer_height // self.depth_tile_size)
+        self.depth_tiles = np.ones((tile_rows, tile_columns), dtype=np.float32)
+        self.depth_tiles_buffer = self.initialize_buffer(self.depth_tiles)
+
+        self.render_modes = ["cubes", "points", "projections"]
+        self.render_mode = "cubes"
+
+        # Projection preview, the volume is reduced along x, y and z into three 2D images on the device
+        self.projection_modes = ["max", "mean"]
+        self.projection_mode = "max"
+        self.projection_group_size = self.get_projection_group_size()
+        self.projection_data = np.zeros((3, self.simulation_size, self.simulation_size), dtype=np.float32)
+        self.projections_buffer = self.buffer_pool.acquire(self.projection_data.nbytes)
+
+        # Quality knobs, the adaptive quality controller turns these to hold the target framerate. Sub-steps start at
+        # the cheapest value, the controller only trades them away once they're raised in the GUI.
+        self.sub_steps = 1
+        self.readback_interval = 1
+        self.frames_since_readback = 0
+        self.instance_threshold = 0.0
+
+
+        # Instance data starts empty, it's filled by the cull kernel every update
+        self.instance_positions = np.zeros((0, 3), dtype=np.float32)
+        self.instance_sizes = np.zeros(0, dtype=np.float32)
+
+        phase_start = self.record_startup_phase("buffers", phase_start)
+
+        # Headless runs (the simulation server) have no GL context to render with
+        if not self.headless:
+            self.initialize_rendering()
+            phase_start = self.record_startup_phase("rendering", phase_start)
+
+        # Kernel launchers, created once with their buffers bound, only the scalars change per launch
+        volume_shape = (self.simulation_size, self.simulation_size, self.simulation_size)
+        if self.species_count > 1:
+            # Same arguments as the single species kernels, with the channels and the species settings after them
+            self.decay_trails_launcher = self.create_kernel_launcher(
+                "species_decay_trails", volume_shape, self.volume_buffer, self.settings_buffer, np.float32(0),
+                self.channels_buffer, self.species_settings_buffer)
+            self.draw_spores_launcher = self.create_kernel_launcher(
+                "species_draw_spores", (self.spore_capacity,), self.volume_buffer, self.spores_buffer,
+                self.settings_buffer, self.channels_buffer)
+            self.move_spores_launcher = self.create_kernel_launcher(
+                "species_move_spores", (self.spore_capacity,), self.spores_buffer, self.channels_buffer,
+                self.random_seeds_buffer, self.settings_buffer, np.float32(0), self.metric_counters_buffer,
+                self.species_settings_buffer)
+        else:
+            self.decay_trails_launcher = self.create_kernel_launcher("decay_trails", volume_shape, self.volume_buffer,
+                                                                     self.settings_buffer, np.float32(0))
+            self.draw_spores_launcher = self.create_kernel_launcher("draw_spores", (self.spore_capacity,),
+                                                                    self.volume_buffer, self.spores_buffer,
+                                                                    self.settings_buffer)
+            self.move_spores_launcher = self.create_kernel_launcher("move_spores", (self.spore_capacity,),
+                                                                    self.spores_buffer, self.volume_buffer,
+                                                                    self.random_seeds_buffer, self.settings_buffer,
+                                                                    np.float32(0), self.metric_counters_buffer)
+        # Accumulated deposits are counted per group in a local table of twice the group size, the groups are the
+        # same power of two size as the projections'
+        self.deposit_group_size = self.projection_group_size
+        deposit_table = cl.LocalMemory(2 * self.deposit_group_size * np.dtype(np.uint32).itemsize)
+        self.accumulate_spores_launcher = self.create_kernel_launcher(
+            "accumulate_spores", (self.spore_capacity,), self.volume_buffer, self.spores_buffer, self.settings_buffer,
+            np.float32(0), np.float32(0), deposit_table, deposit_table, local_size=(self.deposit_group_size,))
+        self.cull_instances_launcher = self.create_kernel_launcher(
+            "cull_instances", volume_shape, self.volume_buffer, self.settings_buffer, self.cull_data_buffer,
+            self.depth_tiles_buffer, np.uint32(self.framebuffer_width), np.uint32(self.framebuffer_height),
+            np.uint32(self.depth_tile_size), np.uint32(self.occlusion_culling), self.instance_positions_buffer,
+            self.instance_sizes_buffer, self.draw_command_buffer, np.uint32(self.max_instances), np.float32(0))
+
+        # One projection launcher per axis
+        projection_scratch = cl.LocalMemory(self.projection_group_size * np.dtype(np.float32).itemsize)
+        self.project_volume_launchers = [
+            self.create_kernel_launcher("project_volume",
+                                        (self.projection_group_size, self.simulation_size, self.simulation_size),
+                                        self.volume_buffer, self.settings_buffer, self.projections_buffer,
+                                        np.uint32(axis), np.uint32(0), projection_scratch,
+                                        local_size=(self.projection_group_size, 1, 1))
+            for axis in range(3)
+        ]
+
+        phase_start = self.record_startup_phase("kernels", phase_start)
+
+        # Work-group shapes of the simulation kernels, benchmarked on the first run on a device
+        self.tune_work_groups()
+        phase_start = self.record_startup_phase("work-group tuning", phase_start)
+
+        # Kernels that carry the simulation over to a new size
+        self.resample_volume_launcher = self.create_kernel_launcher("resample_volume", volume_shape, None,
+                                                                    np.uint32(0), None, np.uint32(0))
+        self.rescale_spores_launcher = self.create_kernel_launcher("rescale_spores", (1,), self.spores_buffer,
+                                                                   np.uint32(0), np.float32(1), np.uint32(0))
+        self.pending_simulation_size = self.simulation_size
+
+        # Optional metrics stage streaming statistics to a time series
+        self.metrics = SimulationMetrics(self, metrics_directory) if metrics_directory else None
+
+        # Adaptive quality, off until switched on in the GUI unless asked for
+        self.quality_controller = QualityController(self, enabled=adaptive_quality)
+
+        # Connected component labeller, built on the first export
+        self.connected_components = None
+        self.component_exports = 0
+
+        # Offscreen video export, see start_export
+        self.video_exporter = None
+        self.export_frame_count = None
+        self.export_restore = None
+        self.export_resumes_thread = False
+        self.video_exports = 0
+
+        # Setup camera stuff, framed_size is the simulation size the camera and projection were last fitted to
+        self.framed_size = self.simulation_size
+        simulation_center, camera_distance = self.get_camera_target(self.simulation_size)
 
-        # Volume Buffer
-        self.volume_data = self.get_empty_volume()
-        self.volume_buffer = self.initialize_buffer(self.volume_data)
+        camera_speed = 3
 
-        # Setup Shader program
-        self.shader_program = ShaderProgram("Shaders/3D_vertex_shader.glsl", "Shaders/3D_fragment_shader.glsl")
+        # Model matrix (Model transformation)
+        self.model = glm.mat4(1.0)  # Initialize model matrix to identity matrix
+
+        # Projection matrix (Perspective projection)
+        self.projection = self.get_projection_matrix(camera_distance)
+
+        self.camera_mover = CameraHandler3D(45.0, 45.0, simulation_center, camera_distance, camera_speed, self.window)
+        self.record_startup_phase("setup", phase_start)
+        self.report_startup_timings()
 
+    def initialize_rendering(self):
+        """Shader programs and renderers, all of the GL state of the simulation"""
+        from projection_renderer import ProjectionRenderer
+        from shader_program import ShaderProgram
+        from simulation_renderer_3D import CUBE_INDICES, CUBE_VERTICES, SimulationRenderer3D
 
-        # Get instance data
-        self.instance_positions, self.instance_sizes = self.get_instance_positions_and_sizes()
-
-        # Vertex data: positions and texture coordinates for a fullscreen quad
-        # Define the 8 vertices of the cube
-        vertices = np.array([
-            -0.5, -0.5, -0.5,  # Vertex 0
-            0.5, -0.5, -0.5,  # Vertex 1
-            0.5, 0.5, -0.5,  # Vertex 2
-            -0.5, 0.5, -0.5,  # Vertex 3
-            -0.5, -0.5, 0.5,  # Vertex 4
-            0.5, -0.5, 0.5,  # Vertex 5
-            0.5, 0.5, 0.5,  # Vertex 6
-            -0.5, 0.5, 0.5  # Vertex 7
-        ], dtype=np.float32)
-
-        # Define the 12 triangles (2 per face) that make up the cube
-        indices = np.array([
-            0, 1, 2, 2, 3, 0,  # Front face
-            1, 5, 6, 6, 2, 1,  # Right face
-            7, 6, 5, 5, 4, 7,  # Back face
-            4, 0, 3, 3, 7, 4,  # Left face
-            4, 5, 1, 1, 0, 4,  # Bottom face
-            3, 2, 6, 6, 7, 3  # Top face
-        ], dtype=np.uint32)
+        # Setup Shader programs, cubes for the full render and point sprites for the fast preview
+        self.shader_program = ShaderProgram("Shaders/3D_vertex_shader.glsl", "Shaders/3D_fragment_shader.glsl")
+        self.point_shader_program = ShaderProgram("Shaders/3D_point_vertex_shader.glsl",
+                                                  "Shaders/3D_point_fragment_shader.glsl")
+        self.projection_shader_program = ShaderProgram("Shaders/2D_vertex_shader.glsl", "Shaders/2D_fragment_shader.glsl")
 
         # Setup renderer
-        self.renderer = SimulationRenderer3D(self.shader_program.program, self.instance_positions, self.instance_sizes, vertices,
-                                             indices)
+        self.renderer = SimulationRenderer3D(self.shader_program.program, self.instance_positions, self.instance_sizes,
+                                             CUBE_VERTICES, CUBE_INDICES, self.point_shader_program.program)
 
         # Add the uniforms for the shaders
         self.renderer.add_uniform_location("simulationSize")
@@ -91,151 +277,672 @@ class Simulation3D(GameEngine):
         self.renderer.add_uniform_location("view")
         self.renderer.add_uniform_location("projection")
 
-        # Setup camera stuff
+        self.renderer.add_point_uniform_location("simulationSize")
+        self.renderer.add_point_uniform_location("model")
+        self.renderer.add_point_uniform_location("view")
+        self.renderer.add_point_uniform_location("projection")
+        self.renderer.add_point_uniform_location("viewportHeight")
+
+        self.projection_renderer = ProjectionRenderer(self.projection_shader_program.program, self.simulation_size,
+                                                      self.window_width / self.window_height)
+
+    def get_camera_target(self, simulation_size):
+        """Center of a simulation of the given size and the camera distance that fits it in view"""
         simulation_center = glm.vec3(
-            self.simulation_size / 2,
-            self.simulation_size / 2,
-            self.simulation_size / 2
+            simulation_size / 2,
+            simulation_size / 2,
+            simulation_size / 2
         )
 
         camera_multiplier = 2.5  # Adjust multiplier as needed for best view
-        camera_distance = self.simulation_size * camera_multiplier
+        camera_distance = simulation_size * camera_multiplier
+        return simulation_center, camera_distance
+
+    def frame_simulation(self, simulation_size):
+        """Fits the camera and projection to a simulation of the given size, both belong to the render thread"""
+        simulation_center, camera_distance = self.get_camera_target(simulation_size)
+        self.camera_mover.set_target(simulation_center, camera_distance)
+        self.projection = self.get_projection_matrix(camera_distance)
+        self.framed_size = simulation_size
+
+    def get_projection_matrix(self, camera_distance):
+        """Perspective projection reaching just past the far side of the simulation"""
+        # An export renders at its own resolution, the projection follows its aspect ratio
+        if self.video_exporter:
+            aspect_ratio = self.video_exporter.width / self.video_exporter.height
+        else:
+            aspect_ratio = self.window_width / self.window_height
+        return glm.perspective(glm.radians(45), aspect_ratio, 0.1, camera_distance * 2)
+
+    def initialize_spores(self, seed=None, first_spore=0):
+        """
+        Spawns spores on the device by the current distribution, from first_spore up to the spore count.
+        A new random seed is picked if none is given.
+        """
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 32 - 1, dtype=np.uint32)
+        if first_spore >= self.spore_count:
+            return
+
+        self.initialize_spores_launcher.set_arg(3, np.uint32(seed))
+        self.initialize_spores_launcher.set_arg(4, np.uint32(SPORE_DISTRIBUTIONS.index(self.spore_distribution)))
+        self.initialize_spores_launcher.set_arg(5, np.float32(self.spore_radius))
+        self.initialize_spores_launcher.set_arg(6, np.uint32(first_spore))
+        self.initialize_spores_launcher.set_global_size((self.spore_count - first_spore,))
+        self.initialize_spores_launcher()
+
+    def create_spore_buffers(self, capacity):
+        """Spore buffer and random seed buffer for up to capacity spores, the seeds hold one extra entry"""
+        spores_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * self.spore_dtype.itemsize)
+        random_seeds_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE,
+                                        size=(capacity + 1) * np.dtype(np.uint32).itemsize)
+        return spores_buffer, random_seeds_buffer
+
+    def create_channels_buffer(self):
+        """Zeroed interleaved trail channels of every species, or just the volume when there's one species"""
+        if self.species_count == 1:
+            return self.volume_buffer
+
+        channels_buffer = self.buffer_pool.acquire(self.simulation_size ** 3 * self.species_count *
+                                                   np.dtype(np.float32).itemsize)
+        cl.enqueue_fill_buffer(self.cl_queue, channels_buffer, np.float32(0), 0, channels_buffer.size)
+        return channels_buffer
+
+    def ensure_spore_capacity(self, spore_count):
+        """Doubles the spore buffers until spore_count fits, the live spores are copied over on the device"""
+        if spore_count <= self.spore_capacity:
+            return
+
+        capacity = self.spore_capacity
+        while capacity < spore_count:
+            capacity *= 2
+
+        spores_buffer, random_seeds_buffer = self.create_spore_buffers(capacity)
+        if self.spore_count:
+            cl.enqueue_copy(self.cl_queue, spores_buffer, self.spores_buffer,
+                            byte_count=self.spore_count * self.spore_dtype.itemsize)
+        cl.enqueue_copy(self.cl_queue, random_seeds_buffer, self.random_seeds_buffer,
+                        byte_count=(self.spore_count + 1) * np.dtype(np.uint32).itemsize)
+
+        self.spore_capacity = capacity
+        self.spores_buffer, self.random_seeds_buffer = spores_buffer, random_seeds_buffer
+
+        # Point every spore kernel at the new buffers
+        self.initialize_spores_launcher.set_arg(0, self.spores_buffer)
+        self.initialize_spores_launcher.set_arg(1, self.random_seeds_buffer)
+        self.compact_spores_launcher.set_arg(0, self.spores_buffer)
+        self.compact_spores_launcher.set_arg(1, self.random_seeds_buffer)
+        self.draw_spores_launcher.set_arg(1, self.spores_buffer)
+        self.accumulate_spores_launcher.set_arg(1, self.spores_buffer)
+        self.move_spores_launcher.set_arg(0, self.spores_buffer)
+        self.move_spores_launcher.set_arg(2, self.random_seeds_buffer)
+
+    def set_spore_count(self, spore_count):
+        """Grows the population by spawning new spores on the device, or shrinks it by removing random spores"""
+        spore_count = max(0, int(spore_count))
+
+        if spore_count > self.spore_count:
+            self.ensure_spore_capacity(spore_count)
+            first_spore = self.spore_count
+            self.spore_count = spore_count
+            self.update_settings_buffer()
+            self.initialize_spores(first_spore=first_spore)
+            self.update_spore_launch_size()
+        elif spore_count < self.spore_count:
+            removed = np.random.default_rng().choice(self.spore_count, self.spore_count - spore_count, replace=False)
+            self.remove_spores(removed)
+
+    def resize_simulation(self, simulation_size):
+        """
+        Changes the simulation size, the trails are resampled and the spores rescaled on the device so the network
+        carries over. Only the buffers whose size depends on the simulation size are swapped, through the pool.
+        """
+        simulation_size = max(1, int(simulation_size))
+        if simulation_size == self.simulation_size:
+            return
+
+        old_size = self.simulation_size
+        volume_shape = (simulation_size, simulation_size, simulation_size)
+        float_size = np.dtype(np.float32).itemsize
+
+        # Resample the trails into a new volume
+        volume_buffer = self.buffer_pool.acquire(simulation_size ** 3 * float_size)
+        self.resample_volume_launcher.set_args(self.volume_buffer, np.uint32(old_size), volume_buffer,
+                                               np.uint32(simulation_size))
+        self.resample_volume_launcher.set_global_size(volume_shape)
+        self.resample_volume_launcher()
+
+        # Move the spores to the same relative positions
+        if self.spore_count:
+            self.rescale_spores_launcher.set_args(self.spores_buffer, np.uint32(self.spore_count),
+                                                  np.float32(simulation_size / old_size), np.uint32(simulation_size))
+            self.rescale_spores_launcher.set_global_size((self.spore_count,))
+            self.rescale_spores_launcher()
+
+        # Hand the old buffers back to the pool, the queue is in order so the kernels above still see them
+        self.buffer_pool.release(self.volume_buffer)
+        self.buffer_pool.release(self.instance_positions_buffer)
+        self.buffer_pool.release(self.instance_sizes_buffer)
+        self.buffer_pool.release(self.projections_buffer)
 
-        camera_speed = 3
+        self.simulation_size = simulation_size
+        self.volume_buffer = volume_buffer
+
+        # The interleaved channels aren't resampled, the species' trails start over and the next decay clears the
+        # combined volume down to them
+        if self.species_count > 1:
+            self.buffer_pool.release(self.channels_buffer)
+        self.channels_buffer = self.create_channels_buffer()
+
+        self.max_instances = simulation_size ** 3
+        self.instance_positions_buffer = self.buffer_pool.acquire(self.max_instances * 3 * float_size)
+        self.instance_sizes_buffer = self.buffer_pool.acquire(self.max_instances * float_size)
+        self.projection_data = np.zeros((3, simulation_size, simulation_size), dtype=np.float32)
+        self.projections_buffer = self.buffer_pool.acquire(self.projection_data.nbytes)
+        self.spore_radius *= simulation_size / old_size
+        self.update_settings_buffer()
+
+        # Rebind the launchers to the new buffers and shapes
+        self.decay_trails_launcher.set_arg(0, self.volume_buffer)
+        self.decay_trails_launcher.set_global_size(volume_shape)
+        self.draw_spores_launcher.set_arg(0, self.volume_buffer)
+        self.accumulate_spores_launcher.set_arg(0, self.volume_buffer)
+        self.move_spores_launcher.set_arg(1, self.channels_buffer)
+        if self.species_count > 1:
+            self.decay_trails_launcher.set_arg(3, self.channels_buffer)
+            self.draw_spores_launcher.set_arg(3, self.channels_buffer)
+
+        self.cull_instances_launcher.set_arg(0, self.volume_buffer)
+        self.cull_instances_launcher.set_arg(8, self.instance_positions_buffer)
+        self.cull_instances_launcher.set_arg(9, self.instance_sizes_buffer)
+        self.cull_instances_launcher.set_arg(11, np.uint32(self.max_instances))
+        self.cull_instances_launcher.set_global_size(volume_shape)
+
+        for launcher in self.project_volume_launchers:
+            launcher.set_arg(0, self.volume_buffer)
+            launcher.set_arg(2, self.projections_buffer)
+            launcher.set_global_size((self.projection_group_size, simulation_size, simulation_size))
+
+        # Keep the whole simulation in view. In threaded mode this runs on the simulation thread, so present fits the
+        # camera once the first frame of the new size reaches the render thread.
+        if self.simulation_thread is None:
+            self.frame_simulation(simulation_size)
+
+    def export_components(self, path=None):
+        """Labels the trail network and writes its components and skeleton graph to a checkpoint file"""
+        if self.connected_components is None:
+            self.connected_components = ConnectedComponents(self.cl_context, self.cl_queue, self.buffer_pool)
+
+        if path is None:
+            path = f"components_{self.component_exports:04d}.npz"
+        self.component_exports += 1
+        return self.connected_components.export(path, self.volume_buffer, self.simulation_size)
+
+    def update_spore_launch_size(self):
+        """Launches the spore kernels only over the live spores"""
+        global_size = (max(self.spore_count, 1),)
+        self.draw_spores_launcher.set_global_size(global_size)
+        self.accumulate_spores_launcher.set_global_size(global_size)
+        self.move_spores_launcher.set_global_size(global_size)
+
+    def remove_spores(self, indices):
+        """Removes the spores at the indices, surviving spores past the new end are swapped into the holes"""
+        indices = np.unique(np.asarray(indices, dtype=np.uint32))
+        spore_count = self.spore_count - len(indices)
+
+        holes = indices[indices < spore_count]
+        tail = np.arange(spore_count, self.spore_count, dtype=np.uint32)
+        sources = np.setdiff1d(tail, indices[indices >= spore_count]).astype(np.uint32)
+
+        if len(holes):
+            holes_buffer = self.initialize_buffer(holes)
+            sources_buffer = self.initialize_buffer(sources)
+            self.compact_spores_launcher.set_arg(2, holes_buffer)
+            self.compact_spores_launcher.set_arg(3, sources_buffer)
+            self.compact_spores_launcher.set_arg(4, np.uint32(len(holes)))
+            self.compact_spores_launcher.set_global_size((len(holes),))
+            self.compact_spores_launcher()
 
-        # Model matrix (Model transformation)
-        self.model = glm.mat4(1.0)  # Initialize model matrix to identity matrix
+        self.spore_count = spore_count
+        self.update_settings_buffer()
+        self.update_spore_launch_size()
+
+    def tune_work_groups(self):
+        """Applies the tuned local sizes, the benchmark runs leave the simulation state untouched"""
+        simulation_buffers = (self.volume_buffer, self.spores_buffer, self.random_seeds_buffer,
+                              self.metric_counters_buffer)
+        if self.species_count > 1:
+            simulation_buffers += (self.channels_buffer,)
+        for launcher in (self.decay_trails_launcher, self.draw_spores_launcher, self.move_spores_launcher):
+            self.work_group_tuner.apply(launcher, simulation_buffers)
+
+    def get_projection_group_size(self):
+        """Largest power of two work-group size the device allows, up to 64"""
+        max_group_size = min(64, self.cl_queue.device.max_work_group_size)
+        return 1 << (max_group_size.bit_length() - 1)
+
+    def get_projections(self):
+        """Reduces the volume into its x, y and z projections on the device, only those are read back"""
+        mode = np.uint32(self.projection_modes.index(self.projection_mode))
+
+        for launcher in self.project_volume_launchers:
+            launcher.set_arg(4, mode)
+            launcher()
+
+        cl.enqueue_copy(self.cl_queue, self.projection_data, self.projections_buffer).wait()
+
+        # Means are faint, stretch each image to the full range
+        if self.projection_mode == "mean":
+            peaks = self.projection_data.max(axis=(1, 2))
+            peaks[peaks == 0] = 1.0
+            self.projection_data /= peaks[:, np.newaxis, np.newaxis]
+
+        return self.projection_data
+
+    def update_cull_data(self):
+        """Uploads the model-view-projection matrix and the frustum planes extracted from it"""
+        model_view_projection = self.projection * self.camera_mover.view * self.model
+
+        # glm lists the matrix by columns, so rows are the transpose
+        matrix = np.array(model_view_projection.to_list(), dtype=np.float32)
+        rows = matrix.T
+
+        # Left, right, bottom, top, near, far planes
+        planes = np.array([rows[3] + rows[0], rows[3] - rows[0],
+                           rows[3] + rows[1], rows[3] - rows[1],
+                           rows[3] + rows[2], rows[3] - rows[2]], dtype=np.float32)
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+
+        # Planes of (0, 0, 0, 1) pass every voxel, for when the instances are drawn by someone else's camera
+        if not self.frustum_culling:
+            planes[:] = (0.0, 0.0, 0.0, 1.0)
+
+        self.cull_data[:16] = matrix.flatten()
+        self.cull_data[16:] = planes.flatten()
+        cl.enqueue_copy(self.cl_queue, self.cull_data_buffer, self.cull_data)
+
+    def update_depth_tiles(self):
+        """Reads the depth of the frame just drawn and keeps the farthest depth of each tile for occlusion culling"""
+        from OpenGL.GL import GL_DEPTH_COMPONENT, GL_FLOAT, glReadPixels
+
+        depth = glReadPixels(0, 0, self.framebuffer_width, self.framebuffer_height, GL_DEPTH_COMPONENT, GL_FLOAT)
+        depth = np.asarray(depth, dtype=np.float32).reshape(self.framebuffer_height, self.framebuffer_width)
+
+        # Pad to whole tiles with the far plane so partial tiles stay conservative
+        tile_rows, tile_columns = self.depth_tiles.shape
+        padded = np.ones((tile_rows * self.depth_tile_size, tile_columns * self.depth_tile_size), dtype=np.float32)
+        padded[:self.framebuffer_height, :self.framebuffer_width] = depth
+
+        self.depth_tiles = padded.reshape(tile_rows, self.depth_tile_size,
+                                          tile_columns, self.depth_tile_size).max(axis=(1, 3))
+        self.run_on_simulation_thread(cl.enqueue_copy, self.cl_queue, self.depth_tiles_buffer, self.depth_tiles)
+
+    def get_visible_instances(self):
+        """Culls the volume on the device, only the surviving instances are read back"""
+        self.update_cull_data()
+
+        # Reset instanceCount in the draw command
+        cl.enqueue_fill_buffer(self.cl_queue, self.draw_command_buffer, np.uint32(0), 4, 4)
+
+        self.cull_instances_launcher.set_arg(7, np.uint32(self.occlusion_culling))
+        self.cull_instances_launcher.set_arg(12, np.float32(self.instance_threshold))
+        self.cull_instances_launcher()
+
+        cl.enqueue_copy(self.cl_queue, self.draw_command, self.draw_command_buffer).wait()
+        instance_count = min(int(self.draw_command[1]), self.max_instances)
+
+        positions = np.empty((instance_count, 3), dtype=np.float32)
+        sizes = np.empty(instance_count, dtype=np.float32)
+        if instance_count:
+            cl.enqueue_copy(self.cl_queue, positions, self.instance_positions_buffer)
+            cl.enqueue_copy(self.cl_queue, sizes, self.instance_sizes_buffer).wait()
+        return positions, sizes
 
-        # Projection matrix (Perspective projection)
-        self.projection = glm.perspective(glm.radians(45), self.window_width / self.window_height, 0.1,
-                                          camera_distance * 2)
+    def start_export(self, path=None, width=1920, height=1080, frame_rate=30, frame_count=None, raw=False,
+                     camera_path=None):
+        """
+        Renders the following frames offscreen at width by height and writes them to path, see VideoExporter.
+        Every frame advances the simulation by exactly 1 / frame_rate and the frame limiter is off, so the export runs
+        as fast as the GPU draws. It stops after frame_count frames, at the end of camera_path if it has no count, or
+        from stop_export. A threaded run steps on the render thread while exporting, one step per exported frame.
+        """
+        from video_exporter import VideoExporter
+
+        if self.video_exporter:
+            self.stop_export()
+
+        if path is None:
+            path = f"export_{self.video_exports}.rgb" if raw else f"export_{self.video_exports}"
+        self.video_exports += 1
+        self.video_exporter = VideoExporter(width, height, path, frame_rate, raw)
+
+        # The simulation thread keeps its own clock, so it's stopped and every frame steps once in update instead
+        self.export_resumes_thread = self.simulation_thread is not None
+        if self.export_resumes_thread:
+            self.stop_simulation_thread()
+            self.frames.acquire()  # Dropped, the first exported frame simulates its own
+
+        # Occlusion culling reads the window's depth and the controller would trade away quality, both sit it out
+        knob_values = {attribute: getattr(self, attribute) for attribute, _, _ in self.quality_controller.knobs}
+        self.export_restore = (self.target_framerate, self.occlusion_culling, self.quality_controller.enabled,
+                               self.threaded, knob_values)
+        self.target_framerate = math.inf
+        self.occlusion_culling = False
+        self.quality_controller.enabled = False
+        self.threaded = False
+
+        # What the controller already traded away goes back to its best, and every exported frame gets read back
+        for attribute, value in self.quality_controller.get_undegraded_values().items():
+            setattr(self, attribute, value)
+        self.readback_interval = 1
+        self.frames_since_readback = 0
+        self.projection = self.get_projection_matrix(self.camera_mover.camera_distance)
+
+        if camera_path:
+            self.camera_mover.set_path(camera_path)
+            if frame_count is None:
+                frame_count = math.floor(self.camera_mover.get_path_duration() * frame_rate) + 1
+        self.export_frame_count = frame_count
+        print(f"Exporting {frame_count or 'unlimited'} frames of {width}x{height} at {frame_rate} fps to {path}")
+
+    def stop_export(self, resume_thread=True):
+        """Finishes writing the export and brings back the window's settings, and the simulation thread if asked"""
+        exporter = self.video_exporter
+        self.video_exporter = None
+        (self.target_framerate, self.occlusion_culling, self.quality_controller.enabled,
+         self.threaded, knob_values) = self.export_restore
+        for attribute, value in knob_values.items():
+            setattr(self, attribute, value)
+        if resume_thread and self.export_resumes_thread:
+            self.start_simulation_thread()
+        self.camera_mover.set_path(None)
+        self.projection = self.get_projection_matrix(self.camera_mover.camera_distance)
+        exporter.close()
+
+    def close(self):
+        # The main loop is over, the simulation thread stays stopped
+        if self.video_exporter:
+            self.stop_export(resume_thread=False)
+        # The last sample is still in flight and the series files are open
+        if self.metrics:
+            self.metrics.close()
+
+    def get_frame_delta_time(self):
+        """Time the frame advances by, fixed to the video's frame rate while exporting"""
+        if self.video_exporter:
+            return 1.0 / self.video_exporter.frame_rate
+        return self.delta_time
 
-        self.camera_mover = CameraHandler3D(45.0, 45.0, simulation_center, camera_distance, camera_speed, self.window)
+    def render(self):
+        from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, glClear
 
-    def get_empty_volume(self):
-        """Generates empty volume by the simulation size"""
-        volume = np.zeros((self.simulation_size, self.simulation_size, self.simulation_size), dtype=np.float32)
-        return volume
-
-    def initialize_spores(self):
-        """Creates spores with random values"""
-        # Define the structured datatype for a 2D spore
-        spore_dtype = np.dtype([
-            ('x', np.float32),  # Position Vector
-            ('y', np.float32),
-            ('z', np.float32),
-            ('pad', np.float32),  # Padding for data
-            ('dir_x', np.float32),  # Directino Vector
-            ('dir_y', np.float32),
-            ('dir_z', np.float32),
-            ('pad2', np.float32),  # Padding for data
-        ])
-
-        # Initialize empty array of spores
-        spores = np.zeros(self.spore_count, dtype=spore_dtype)
-
-        # Randomize positions within the bounds of the simulation size
-        spores['x'] = np.random.uniform(0, self.simulation_size, size=self.spore_count)
-        spores['y'] = np.random.uniform(0, self.simulation_size, size=self.spore_count)
-        spores['z'] = np.random.uniform(0, self.simulation_size, size=self.spore_count)
-
-        # Generate random direction vectors and normalize them
-        directions = np.random.randn(self.spore_count, 3)  # Generate random directions
-        norms = np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Calculate norms
-        normalized_directions = directions / norms  # Normalize
-
-        # Assign normalized directions to spores
-        spores['dir_x'] = normalized_directions[:, 0]
-        spores['dir_y'] = normalized_directions[:, 1]
-        spores['dir_z'] = normalized_directions[:, 2]
-
-        return spores
-
-    def get_instance_positions_and_sizes(self):
-        # Find indices where value > 0
-        nonzero_indices = np.argwhere(self.volume_data > 0)
-
-        # Normalize sizes based on voxel values
-        sizes = self.volume_data[nonzero_indices[:, 0], nonzero_indices[:, 1], nonzero_indices[:, 2]]
-
-        # Change type of data to floats
-        positions = nonzero_indices.astype(np.float32)
-        sizes = sizes.astype(np.float32)
-        return positions, sizes
+        if not self.video_exporter:
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            self.draw_scene(self.framebuffer_height)
+            return
 
-    def render(self):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glUseProgram(self.shader_program.program)
+        # Draw into the export framebuffer, then show the frame scaled down in the window
+        self.video_exporter.begin_frame()
+        self.draw_scene(self.video_exporter.height)
+        self.video_exporter.end_frame()
 
-        # Set simulation sizes
-        glUniform1f(self.renderer.uniform_locations["simulationSize"], float(self.simulation_size))
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        self.video_exporter.blit(self.framebuffer_width, self.framebuffer_height)
 
-        # Update matrices uniforms
-        glUniformMatrix4fv(self.renderer.uniform_locations["model"], 1, GL_FALSE, glm.value_ptr(self.model))
-        glUniformMatrix4fv(self.renderer.uniform_locations["view"], 1, GL_FALSE, glm.value_ptr(self.camera_mover.view))
-        glUniformMatrix4fv(self.renderer.uniform_locations["projection"], 1, GL_FALSE, glm.value_ptr(self.projection))
+        if self.export_frame_count and self.video_exporter.frames_captured >= self.export_frame_count:
+            self.stop_export()
 
-        self.renderer.draw(len(self.instance_positions))
+    def draw_scene(self, viewport_height):
+        """Draws the simulation into the bound framebuffer"""
+        from OpenGL.GL import GL_FALSE, glUniform1f, glUniformMatrix4fv, glUseProgram
 
-    def update(self):
-        """Runs Kernels, updates data, and camera position"""
+        if self.render_mode == "projections":
+            self.projection_renderer.draw()
+            return
 
-        self.program.decay_trails(self.cl_queue, (self.simulation_size, self.simulation_size, self.simulation_size),
-                                  None, self.volume_buffer, self.settings_buffer, np.float32(self.delta_time))
+        if self.render_mode == "points":
+            glUseProgram(self.point_shader_program.program)
+            uniform_locations = self.renderer.point_uniform_locations
+            glUniform1f(uniform_locations["viewportHeight"], float(viewport_height))
+        else:
+            glUseProgram(self.shader_program.program)
+            uniform_locations = self.renderer.uniform_locations
 
-        self.program.draw_spores(self.cl_queue, (self.spore_count,), None,
-                                 self.volume_buffer, self.spores_buffer, self.settings_buffer)
+        # Set simulation sizes
+        glUniform1f(uniform_locations["simulationSize"], float(self.simulation_size))
 
-        self.program.move_spores(self.cl_queue, (self.spore_count,), None, self.spores_buffer, self.volume_buffer,
-                                 self.random_seeds_buffer, self.settings_buffer, np.float32(self.delta_time))
+        # Update matrices uniforms
+        glUniformMatrix4fv(uniform_locations["model"], 1, GL_FALSE, glm.value_ptr(self.model))
+        glUniformMatrix4fv(uniform_locations["view"], 1, GL_FALSE, glm.value_ptr(self.camera_mover.view))
+        glUniformMatrix4fv(uniform_locations["projection"], 1, GL_FALSE, glm.value_ptr(self.projection))
 
-        self.cl_queue.finish()
+        if self.render_mode == "points":
+            self.renderer.draw_points(len(self.instance_positions))
+        else:
+            self.renderer.draw(len(self.instance_positions))
 
-        cl.enqueue_copy(self.cl_queue, self.volume_data, self.volume_buffer).wait()
+        if self.occlusion_culling:
+            self.update_depth_tiles()
 
-        self.instance_positions, self.instance_sizes = self.get_instance_positions_and_sizes()
-        self.renderer.update_instance_data(self.instance_positions, self.instance_sizes)
-        self.camera_mover.update_view(self.delta_time)
+    def update(self):
+        """Runs Kernels, updates data, and camera position"""
+        # Move the camera first so culling uses the view that gets rendered this frame
+        delta_time = self.get_frame_delta_time()
+        self.camera_mover.update_view(delta_time)
+
+        start_time = time.perf_counter()
+        frame = self.simulate(delta_time)
+        self.frame_timings["simulate"] = time.perf_counter() - start_time
+        if frame is not None:
+            self.present(frame)
+
+    def update_threaded(self):
+        """
+        Moves the camera on the render thread, the simulation thread culls with the newest view. Exports pause threaded
+        mode, so this never runs while one is recording.
+        """
+        self.camera_mover.update_view(self.get_frame_delta_time())
+        super().update_threaded()
+
+    def simulate(self, delta_time):
+        """
+        Steps the kernels sub_steps times, then reduces the volume to what gets drawn: the visible instances or the
+        projections. Only every readback_interval-th call reads anything back, the others return None. Frames carry
+        the simulation size they were simulated at.
+        """
+        step_time = np.float32(delta_time / self.sub_steps)
+        self.decay_trails_launcher.set_arg(2, step_time)
+        self.move_spores_launcher.set_arg(4, step_time)
+
+        # The species kernels have their own deposit, always marking
+        deposit_launcher = self.draw_spores_launcher
+        if self.deposit_mode == "accumulate" and self.species_count == 1:
+            deposit_launcher = self.accumulate_spores_launcher
+            deposit_launcher.set_arg(3, np.float32(self.deposit_amount))
+            deposit_launcher.set_arg(4, np.float32(self.deposit_saturation))
+
+        for _ in range(self.sub_steps):
+            self.decay_trails_launcher()
+            deposit_launcher()
+            self.move_spores_launcher()
+
+            if self.metrics:
+                self.metrics.update()
+
+        self.frames_since_readback += 1
+        if self.frames_since_readback < self.readback_interval:
+            self.cl_queue.flush()
+            return None
+        self.frames_since_readback = 0
+
+        # The projection preview only needs the three small images, not the instances
+        if self.render_mode == "projections":
+            return "projections", self.get_projections().copy(), self.simulation_size
+        return "instances", self.get_visible_instances(), self.simulation_size
+
+    def present(self, frame):
+        """Uploads a simulated frame to the renderers"""
+        kind, data, simulation_size = frame
+        if simulation_size != self.framed_size:
+            self.frame_simulation(simulation_size)
+
+        if kind == "projections":
+            # The simulation may have been resized since the textures were made
+            if data.shape[1] != self.projection_renderer.texture_size:
+                self.projection_renderer.resize(data.shape[1])
+            self.projection_renderer.update_projections(data)
+        else:
+            self.instance_positions, self.instance_sizes = data
+            self.renderer.update_instance_data(self.instance_positions, self.instance_sizes)
 
     def render_gui(self):
+        import imgui
+
         # Set the window's background alpha (transparency) to 0.7 (1.0 is opaque, 0.0 is transparent)
         imgui.push_style_var(imgui.STYLE_ALPHA, 0.8)
 
         # Start a new ImGui window
         if imgui.begin("Simulation Parameters"):
 
-            # Slider for spore_speed
-            changed, self.spore_speed = imgui.slider_float("Spore Speed", self.spore_speed, 0.1, 30.0)
+            # Several species are set one at a time, each has its own settings
+            if self.species_count > 1:
+                self.render_species_gui()
+            else:
+                # Slider for spore_speed
+                changed, self.spore_speed = imgui.slider_float("Spore Speed", self.spore_speed, 0.1, 30.0)
+                if changed:
+                    # Update the settings buffer if necessary
+                    self.run_on_simulation_thread(self.update_settings_buffer)
+
+                # Slider for decay_speed
+                changed, self.decay_speed = imgui.slider_float("Decay Speed", self.decay_speed, 0.01, 2.0)
+                if changed:
+                    # Update the settings buffer if necessary
+                    self.run_on_simulation_thread(self.update_settings_buffer)
+
+                # Slider for sensor_distance
+                changed, self.sensor_distance = imgui.slider_float("Sensor Distance", self.sensor_distance, 1.0, 20.0)
+                if changed:
+                    # Update the settings buffer if necessary
+                    self.run_on_simulation_thread(self.update_settings_buffer)
+
+                # Slider for turn_speed
+                changed, self.turn_speed = imgui.slider_float("Turn Speed", self.turn_speed, 0.0, 25.0)
+                if changed:
+                    # Update the settings buffer if necessary
+                    self.run_on_simulation_thread(self.update_settings_buffer)
+
+            # Slider for the spore count, spores are spawned or removed on the device
+            changed, spore_count = imgui.slider_int("Spore Count", self.spore_count, 0, self.max_spore_count)
             if changed:
-                # Update the settings buffer if necessary
-                self.update_settings_buffer()
+                self.run_on_simulation_thread(self.set_spore_count, spore_count)
 
-            # Slider for decay_speed
-            changed, self.decay_speed = imgui.slider_float("Decay Speed", self.decay_speed, 0.01, 2.0)
-            if changed:
-                # Update the settings buffer if necessary
-                self.update_settings_buffer()
+            # Slider for the simulation size, applied with the button so dragging doesn't resample every frame
+            _, self.pending_simulation_size = imgui.slider_int("Simulation Size", self.pending_simulation_size, 8, 256)
+            if imgui.button("Resize") and self.pending_simulation_size != self.simulation_size:
+                self.run_on_simulation_thread(self.resize_simulation, self.pending_simulation_size)
 
-            # Slider for sensor_distance
-            changed, self.sensor_distance = imgui.slider_float("Sensor Distance", self.sensor_distance, 1.0, 20.0)
+            # Combo for the spawn distribution, picking one respawns the spores
+            changed, distribution_index = imgui.combo("Spawn", SPORE_DISTRIBUTIONS.index(self.spore_distribution),
+                                                      SPORE_DISTRIBUTIONS)
             if changed:
-                # Update the settings buffer if necessary
-                self.update_settings_buffer()
+                self.spore_distribution = SPORE_DISTRIBUTIONS[distribution_index]
+                self.run_on_simulation_thread(self.initialize_spores)
 
-            # Slider for turn_speed
-            changed, self.turn_speed = imgui.slider_float("Turn Speed", self.turn_speed, 0.0, 25.0)
+            # Combo for the boundary, switching keeps the spores where they are
+            changed, boundary_index = imgui.combo("Boundary", BOUNDARY_MODES.index(self.boundary_mode), BOUNDARY_MODES)
+            if changed:
+                self.boundary_mode = BOUNDARY_MODES[boundary_index]
+                self.run_on_simulation_thread(self.update_settings_buffer)
+
+            # Combo for how spores lay their trails, the accumulated deposit has its amount and saturation
+            if self.species_count == 1:
+                changed, mode_index = imgui.combo("Deposit", self.deposit_modes.index(self.deposit_mode),
+                                                  self.deposit_modes)
+                if changed:
+                    self.deposit_mode = self.deposit_modes[mode_index]
+                if self.deposit_mode == "accumulate":
+                    _, self.deposit_amount = imgui.slider_float("Deposit Amount", self.deposit_amount, 0.01, 1.0)
+                    _, self.deposit_saturation = imgui.slider_float("Saturation", self.deposit_saturation, 0.1, 1.0)
+
+            # Combo for switching between the full cube render and the point sprite preview
+            changed, mode_index = imgui.combo("Render Mode", self.render_modes.index(self.render_mode), self.render_modes)
             if changed:
-                # Update the settings buffer if necessary
-                self.update_settings_buffer()
+                self.render_mode = self.render_modes[mode_index]
+
+            # Combo for the projection preview's reduction
+            if self.render_mode == "projections":
+                changed, mode_index = imgui.combo("Projection", self.projection_modes.index(self.projection_mode),
+                                                  self.projection_modes)
+                if changed:
+                    self.projection_mode = self.projection_modes[mode_index]
+
+            # Checkbox for occlusion culling against the previous frame
+            _, self.occlusion_culling = imgui.checkbox("Occlusion Culling", self.occlusion_culling)
+            imgui.text(f"Visible Instances: {len(self.instance_positions)}")
+            if self.threaded:
+                imgui.text(f"Simulation Steps/s: {self.simulation_rate}")
+
+            # Slider for the kernel passes per frame, smaller steps follow the trails more closely
+            _, self.sub_steps = imgui.slider_int("Sub-steps", self.sub_steps, 1, 4)
+
+            # Trades sub-steps, readbacks, small instances and the cube render for framerate under load
+            _, self.quality_controller.enabled = imgui.checkbox("Adaptive Quality", self.quality_controller.enabled)
+            if self.quality_controller.log:
+                _, attribute, _, value, _ = self.quality_controller.log[-1]
+                imgui.text(f"Last Change: {attribute} = {value}")
+
+            # Records an orbit around the simulation offscreen, at 1080p whatever the window's size
+            if self.video_exporter:
+                imgui.text(f"Exported Frames: {self.video_exporter.frames_captured}")
+                if imgui.button("Stop Export"):
+                    self.stop_export()
+            elif imgui.button("Export Video"):
+                self.start_export(camera_path=self.camera_mover.get_orbit_path(12.0))
+
+            # Writes the network's components and skeleton graph next to the script
+            if imgui.button("Export Components"):
+                self.run_on_simulation_thread(self.export_components)
+
+            # Latest streamed metrics
+            if self.metrics and self.metrics.latest:
+                imgui.text(f"Trail Mass: {self.metrics.latest['trail_mass']:.1f}")
+                imgui.text(f"Occupied Voxels: {self.metrics.latest['occupied_voxels']}")
+                imgui.text(f"Bounce Rate: {self.metrics.latest['bounce_rate']:.4f}")
 
         imgui.end()
         imgui.pop_style_var()
 
+    def render_species_gui(self):
+        """Picks a species and shows the sliders of its settings"""
+        import imgui
+
+        _, self.selected_species = imgui.slider_int("Species", self.selected_species, 0, self.species_count - 1)
+        species = self.selected_species
+
+        changed = False
+        for label, field, min_value, max_value in (("Spore Speed", "spore_speed", 0.1, 30.0),
+                                                   ("Decay Speed", "decay_speed", 0.01, 2.0),
+                                                   ("Sensor Distance", "sensor_distance", 1.0, 20.0),
+                                                   ("Turn Speed", "turn_speed", 0.0, 25.0),
+                                                   ("Repulsion", "repulsion", 0.0, 2.0)):
+            field_changed, value = imgui.slider_float(label, float(self.species_settings[field][species]), min_value,
+                                                      max_value)
+            self.species_settings[field][species] = value
+            changed |= field_changed
+
+        if changed:
+            self.run_on_simulation_thread(self.update_species_settings_buffer, self.species_settings.copy())
+
+    def update_species_settings_buffer(self, species_settings):
+        cl.enqueue_copy(self.cl_queue, self.species_settings_buffer, species_settings)
+
     def update_settings_buffer(self):
         # Create a new settings array
         settings = np.array([(self.spore_count, self.simulation_size,
                               self.spore_speed, self.decay_speed, self.turn_speed,
-                              self.sensor_distance)], dtype=self.settings_dtype)
+                              self.sensor_distance, BOUNDARY_MODES.index(self.boundary_mode))],
+                            dtype=self.settings_dtype)
 
         # Update the buffer with the new settings
         cl.enqueue_copy(self.cl_queue, self.settings_buffer, settings)
@@ -2,46 +2,33 @@
 #define M_PI 3.14159265358979323846f
 #endif
 
-
+// Spore Datatype, the random state rides in what would be the float2's padding
 typedef struct {
-    float2 position;  // Use float2 for position
+    float2 position;
     float angle;
+    uint seed;
 } Spore;
 
+// Settings Datatype
 typedef struct {
     uint spore_count;
-    uint screen_height;
-    uint screen_width;
+    uint width;
+    uint height;
     float spore_speed;
     float decay_speed;
     float turn_speed;
     float sensor_distance;
+    float diffuse_speed;
 } Settings;
 
+// Stops of the colour ramp the trails are shown with, evenly spaced from 0 to 1
+#define PALETTE_SIZE 4
+
 // Function prototypes
 uint hash(uint state);
 float scaleToRange01(uint state);
-float sense(__global Spore* spore, __global uchar* image, __global const Settings* settings, float sensorAngleOffset);
-
-float sense(__global Spore* spore, __global uchar* image, __global const Settings* settings, float sensorAngleOffset) {
-    float sensorAngle = spore->angle + sensorAngleOffset;
-    float2 sensorDir = (float2)(cos(sensorAngle), sin(sensorAngle));
-
-    // Calculate the sampling position
-    float2 samplePos = spore->position + sensorDir * settings->sensor_distance;
-
-    // Clamp the sampling position to be within the image bounds
-    uint sampleX = clamp((uint)samplePos.x, (uint)0, settings->screen_width - (uint)1);
-    uint sampleY = clamp((uint)samplePos.y, (uint)0, settings->screen_height - (uint)1);
-
-    // Calculate the linear index in the image array
-    uint idx = (sampleY * settings->screen_width + sampleX) * 4; // 4 bytes per pixel
-
-    // Access the green component of the pixel,
-    float sensedAlpha = (float)image[idx + (uint)2] / 255.0f; // Normalize the alpha value to [0, 1]
-
-    return sensedAlpha;
-}
+float sense(float2 position, float angle, __global const float* trail, __global const Settings* settings);
+float4 get_trail_color(float value, __constant float4* palette);
 
 uint hash(uint state) {
     state ^= 2747636419u;
@@ -58,99 +45,145 @@ float scaleToRange01(uint state) {
     return (float)state / 4294967295.0f;
 }
 
-__kernel void draw_spores(__global uchar* image, __global Spore* spores, __global const Settings* settings) {
+// Trail value a sensor distance away in the direction of angle
+float sense(float2 position, float angle, __global const float* trail, __global const Settings* settings) {
+    float2 sample_position = position + (float2)(cos(angle), sin(angle)) * settings->sensor_distance;
+
+    // Goes through int, a negative float converted straight to uint is undefined
+    uint x = (uint)clamp((int)sample_position.x, 0, (int)settings->width - 1);
+    uint y = (uint)clamp((int)sample_position.y, 0, (int)settings->height - 1);
+    return trail[y * settings->width + x];
+}
+
+// Spawns the spores in place, uniform over the map with random headings
+__kernel void initialize_spores(__global Spore* spores, __global const Settings* settings, const uint seed) {
     uint idx = (uint)get_global_id(0);
 
     if (idx >= settings->spore_count) {
         return;
     }
 
-    Spore s = spores[idx];
-    uint x = (int)(s.position.x);
-    uint y = (int)(s.position.y);
-
-    // Ensure the coordinates are within the image bounds
-    if (x < settings->screen_width && y < settings->screen_height) {
-        // Assuming the image is a 1D array in row-major order and each pixel is 4 bytes (RGBA)
-        int image_idx = 4 * (y * settings->screen_width + x);
-        image[image_idx] = (uchar)((float)x / (float)settings->screen_width * 255);  // R
-        image[image_idx + 1] = (uchar)((float)y / (float)settings->screen_height * 255);  // G
-        image[image_idx + 2] = 255; // B
-        image[image_idx + 3] = 255; // A (fully opaque)
-    }
+    uint state = hash(seed ^ hash(idx));
+    Spore spore;
+    state = hash(state);
+    spore.position.x = scaleToRange01(state) * (settings->width - 1);
+    state = hash(state);
+    spore.position.y = scaleToRange01(state) * (settings->height - 1);
+    state = hash(state);
+    spore.angle = scaleToRange01(state) * 2.0f * M_PI;
+    spore.seed = hash(state);
+    spores[idx] = spore;
 }
 
-// Include hash and scaleToRange01 functions here
-
-__kernel void move_spores(__global Spore* spores, __global uchar* image,__global uint* random_seeds, __global const Settings* settings, const float delta_time) {
+__kernel void move_spores(__global Spore* spores, __global const float* trail, __global const Settings* settings,
+                          const float delta_time) {
     uint idx = (uint)get_global_id(0);
 
     if (idx >= settings->spore_count) {
         return;
     }
 
-    float angle = spores[idx].angle;
-
-    float forwardWeight = sense(&spores[idx], image, settings, 0.0f);
-    float rightWeight = sense(&spores[idx], image, settings, -M_PI / 4.0f);
-    float leftWeight = sense(&spores[idx], image, settings, M_PI / 4.0f);
+    Spore spore = spores[idx];
+
+    float forward_weight = sense(spore.position, spore.angle, trail, settings);
+    float right_weight = sense(spore.position, spore.angle - M_PI / 4.0f, trail, settings);
+    float left_weight = sense(spore.position, spore.angle + M_PI / 4.0f, trail, settings);
+
+    // Turn towards the strongest trail, by a random share of the turn speed so the spores don't lock into lines
+    spore.seed = hash(spore.seed);
+    float turn = settings->turn_speed * delta_time * M_PI * scaleToRange01(spore.seed);
+    if (forward_weight > right_weight && forward_weight > left_weight) {
+        turn = 0.0f;
+    } else if (right_weight > left_weight) {
+        turn = -turn;
+    } else if (left_weight == right_weight) {
+        turn = 0.0f;
+    }
+    spore.angle += turn;
 
-    // Starting the change with some random amount
-    float turningDelta = 0;
+    float2 position = spore.position + (float2)(cos(spore.angle), sin(spore.angle)) * settings->spore_speed * delta_time;
 
-    // Forward strongest, keep going forward
-    if (forwardWeight > rightWeight && forwardWeight > leftWeight)
-    {
-        turningDelta += 0;
+    // Off the map, stay at the edge and head off in a random direction
+    if (position.x < 0 || position.x >= settings->width || position.y < 0 || position.y >= settings->height) {
+        spore.seed = hash(spore.seed);
+        spore.angle = scaleToRange01(spore.seed) * 2.0f * M_PI;
+        position.x = clamp(position.x, 0.0f, (float)(settings->width - 1));
+        position.y = clamp(position.y, 0.0f, (float)(settings->height - 1));
     }
-    else if (rightWeight > leftWeight) // turn right
-    {
-        turningDelta -= 1;
+
+    spore.position = position;
+    spores[idx] = spore;
+}
+
+__kernel void draw_spores(__global float* trail, __global const Spore* spores, __global const Settings* settings) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
     }
-    else if (leftWeight > rightWeight) // turn left
-    {
-        turningDelta += 1;
+
+    uint x = (uint)spores[idx].position.x;
+    uint y = (uint)spores[idx].position.y;
+    if (x < settings->width && y < settings->height) {
+        trail[y * settings->width + x] = 1.0f;
     }
+}
+
+// Blurs the trails by a 3 by 3 mean, mixed in by the diffuse speed, then decays them
+__kernel void diffuse_trails(__global const float* trail, __global float* next_trail, __global const Settings* settings,
+                             const float delta_time) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
 
-    float newAngle = angle + turningDelta * settings->turn_speed * delta_time * M_PI;
+    if (x >= settings->width || y >= settings->height) {
+        return;
+    }
 
-    float2 direction = (float2)(cos(angle), sin(angle)) * settings->spore_speed * delta_time;
-    float2 newPosition = spores[idx].position + direction;
+    float sum = 0.0f;
+    for (int dy = -1; dy <= 1; dy++) {
+        uint sample_y = (uint)clamp((int)y + dy, 0, (int)settings->height - 1);
+        for (int dx = -1; dx <= 1; dx++) {
+            uint sample_x = (uint)clamp((int)x + dx, 0, (int)settings->width - 1);
+            sum += trail[sample_y * settings->width + sample_x];
+        }
+    }
 
-    // Boundary check and bounce-back logic
-    if (newPosition.x < 0 || newPosition.x >= settings->screen_width || newPosition.y < 0 || newPosition.y >= settings->screen_height) {
-        uint random = hash(random_seeds[idx]);
-        random_seeds[idx] = random;
+    float value = trail[y * settings->width + x];
+    float blurred = mix(value, sum / 9.0f, min(settings->diffuse_speed * delta_time, 1.0f));
+    next_trail[y * settings->width + x] = max(0.0f, blurred - settings->decay_speed * delta_time);
+}
 
-        float randomAngle = scaleToRange01(random) * 2.0f * M_PI; // M_PI is the PI constant in OpenCL
+float4 get_trail_color(float value, __constant float4* palette) {
+    float position = clamp(value, 0.0f, 1.0f) * (PALETTE_SIZE - 1);
+    int stop = min((int)position, PALETTE_SIZE - 2);
+    return mix(palette[stop], palette[stop + 1], position - stop);
+}
 
-        // Ensure newPosition is within bounds
-        newPosition.x = clamp(newPosition.x, 0.0f, (float)(settings->screen_width - 1));
-        newPosition.y = clamp(newPosition.y, 0.0f, (float)(settings->screen_height - 1));
+// Colours the trails into RGBA bytes, for the pixel buffer upload
+__kernel void colorize_trails(__global const float* trail, __global const Settings* settings,
+                              __constant float4* palette, __global uchar4* pixels) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
 
-        // Update the spore's angle and position with the new values
-        newAngle = randomAngle;
+    if (x >= settings->width || y >= settings->height) {
+        return;
     }
 
-    // If not outside bounds update the spore's position
-    spores[idx].position = newPosition;
-    spores[idx].angle = newAngle;
+    uint idx = y * settings->width + x;
+    pixels[idx] = convert_uchar4_sat(get_trail_color(trail[idx], palette) * 255.0f);
 }
 
-__kernel void fade_image(__global uchar* image, __global const Settings* settings, const uchar decay_amount) {
-    // Calculate the 2D index of the current work item
+#ifdef GL_SHARING
+// Colours the trails straight into the texture shared with GL
+__kernel void colorize_trails_image(__global const float* trail, __global const Settings* settings,
+                                    __constant float4* palette, __write_only image2d_t image) {
     uint x = (uint)get_global_id(0);
     uint y = (uint)get_global_id(1);
 
-    // Calculate the linear index of the pixel
-    uint idx = 4 * (y * settings->screen_width + x); // 4 bytes per pixel (RGBA)
-
-    // Check if the index is within the bounds of the image
-    if ((uint)x < settings->screen_width && (uint)y < settings->screen_height) {
-        image[idx] = (uchar)max(0, image[idx] - decay_amount);  // R
-        image[idx + 1] = (uchar)max(0, image[idx + 1] - decay_amount); // G
-        image[idx + 2] = (uchar)max(0, image[idx + 2] - decay_amount); // B
-        // Alpha channel remains unchanged image[idx + 3]
+    if (x >= settings->width || y >= settings->height) {
+        return;
     }
-}
 
+    write_imagef(image, (int2)(x, y), get_trail_color(trail[y * settings->width + x], palette));
+}
+#endif
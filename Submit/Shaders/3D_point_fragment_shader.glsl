@@ -0,0 +1,30 @@
+#version 330 core
+out vec4 FragColor;
+
+in vec3 FragPos; // Received from vertex shader
+
+uniform float simulationSize;
+
+void main()
+{
+    // Position inside the point sprite, from -1 to 1 (y goes down)
+    vec2 coord = gl_PointCoord * 2.0 - 1.0;
+
+    // Fake the faces of a cube by splitting the sprite into four bevels
+    float shade;
+    if (abs(coord.y) > abs(coord.x)) {
+        shade = coord.y < 0.0 ? 1.0 : 0.6; // Top and bottom
+    } else {
+        shade = coord.x < 0.0 ? 0.85 : 0.7; // Left and right
+    }
+
+    // Darken towards the edges so neighbouring sprites stay separate
+    shade *= 1.0 - 0.25 * max(abs(coord.x), abs(coord.y));
+
+    // Same coloring as the cube shader
+    vec3 normalizedPos = FragPos / vec3(simulationSize, simulationSize, simulationSize);
+    vec3 baseColor = vec3(0.8, 0.8, 0.8);
+    vec3 color = mix(baseColor, normalizedPos, 0.9);
+
+    FragColor = vec4(color * shade, 1);
+}
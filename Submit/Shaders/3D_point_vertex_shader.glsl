@@ -0,0 +1,19 @@
+#version 330 core
+layout (location = 1) in vec3 instancePos; // Instance positions
+layout (location = 2) in float instanceSize; // Instance size
+
+uniform mat4 model;
+uniform mat4 view;
+uniform mat4 projection;
+uniform float viewportHeight;
+
+out vec3 FragPos;
+
+void main() {
+    // Same placement as the cube shader, which draws the instance centered at (x, z, y)
+    gl_Position = projection * view * model * vec4(instancePos.x, instancePos.z, instancePos.y, 1.0);
+
+    // Size of the cube in pixels at this depth
+    gl_PointSize = instanceSize * projection[1][1] * viewportHeight * 0.5 / gl_Position.w;
+    FragPos = instancePos; // Pass position to fragment shader
+}
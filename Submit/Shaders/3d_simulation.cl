@@ -6,6 +6,9 @@
 typedef struct {
     float3 position;
     float3 direction;
+#ifdef SPECIES_COUNT
+    uint species;  // Only in multi-species builds, see species_simulation.cl
+#endif
 } Spore;
 
 // Settings Datatype
@@ -16,28 +19,73 @@ typedef struct {
     float decay_speed;
     float turn_speed;
     float sensor_distance;
+    uint boundary_mode;  // BOUNDARY_BOUNCE or BOUNDARY_PERIODIC
 } Settings;
 
+// Boundary modes, spores bounce off the walls or the domain wraps around on every axis
+#define BOUNDARY_BOUNCE 0
+#define BOUNDARY_PERIODIC 1
+
+// Layout of the metric counters buffer, the value histogram follows the fixed counters
+#define METRIC_BOUNCES 0
+#define METRIC_OCCUPIED 1
+#define METRIC_HISTOGRAM 2
+#define METRIC_MAX_BINS 64
+
 //// Function prototypes
 uint hash(uint x);
 float scaleToRange01(uint x);
+float3 wrap_position(float3 position, uint simulation_size);
+uint3 sensor_voxel(__global Spore* spore, __global const Settings* settings, float sensor_distance, float3 direction,
+                   float3 forward);
 float sense(__global Spore* spore, __global float* volume, __global const Settings* settings, float3 direction, float3 forward);
 void draw_sensor(__global Spore* spore, __global float* volume, __global const Settings* settings, float3 direction, float3 forward);
-
-// Returns the value of the volume at the averaged vector between the direction and the forward vector
-float sense(__global Spore* spore, __global float* volume, __global const Settings* settings, float3 direction, float3 forward) {
+void draw_spore(__global float* volume, __global const Spore* spore, __global const Settings* settings);
+void atomic_add_saturated(__global float* address, float value, float saturation);
+void get_sensor_axes(float3 sporeDirection, float3* rightVector, float3* upVector);
+bool steer_spore(__global Spore* spore, float forwardWeight, float rightWeight, float leftWeight, float upWeight,
+                 float downWeight, float3 rightVector, float3 upVector, __global uint* random_seeds, uint seed_index,
+                 __global const Settings* settings, float spore_speed, float delta_time);
+bool move_spore(__global Spore* spore, __global float* volume, __global uint* random_seeds, uint seed_index,
+                __global const Settings* settings, float delta_time);
+
+// Voxel at the averaged vector between the direction and the forward vector, clamped to the simulation bounds
+uint3 sensor_voxel(__global Spore* spore, __global const Settings* settings, float sensor_distance, float3 direction,
+                   float3 forward) {
         // Calculate the sampling position using the direction vector
         float3 averagePos = normalize(forward + direction);
 
-        float3 samplePos = spore->position + averagePos * settings->sensor_distance;
+        float3 samplePos = spore->position + averagePos * sensor_distance;
+
+        // A periodic domain wraps the sample around instead, the same for every work-item so it doesn't diverge
+        if (settings->boundary_mode == BOUNDARY_PERIODIC) {
+            return convert_uint3(convert_int3_rtz(wrap_position(samplePos, settings->simulation_size)));
+        }
 
         // Clamp the sampling position to be within the simulation bounds
-        uint sampleX = clamp((uint)samplePos.x, 0u, settings->simulation_size - 1u);
-        uint sampleY = clamp((uint)samplePos.y, 0u, settings->simulation_size - 1u);
-        uint sampleZ = clamp((uint)samplePos.z, 0u, settings->simulation_size - 1u);
+        // (goes through int, a negative float converted straight to uint is undefined and wraps on some devices)
+        uint sampleX = (uint)clamp((int)samplePos.x, 0, (int)settings->simulation_size - 1);
+        uint sampleY = (uint)clamp((int)samplePos.y, 0, (int)settings->simulation_size - 1);
+        uint sampleZ = (uint)clamp((int)samplePos.z, 0, (int)settings->simulation_size - 1);
+
+        return (uint3)(sampleX, sampleY, sampleZ);
+}
+
+// Position wrapped into [0, simulation_size) on every axis, without branching
+float3 wrap_position(float3 position, uint simulation_size) {
+    float size = (float)simulation_size;
+    float3 wrapped = position - size * floor(position * (1.0f / size));
+
+    // Rounding can put a position right on the far edge, or the floor can round up and leave it tiny and negative
+    return select(wrapped, (float3)(0.0f), isgreaterequal(wrapped, (float3)(size)) | isless(wrapped, (float3)(0.0f)));
+}
+
+// Returns the value of the volume at the averaged vector between the direction and the forward vector
+float sense(__global Spore* spore, __global float* volume, __global const Settings* settings, float3 direction, float3 forward) {
+        uint3 sample = sensor_voxel(spore, settings, settings->sensor_distance, direction, forward);
 
         // Calculate the linear index in the volume array
-        uint idx = sampleZ * settings->simulation_size * settings->simulation_size + sampleY * settings->simulation_size + sampleX;
+        uint idx = sample.z * settings->simulation_size * settings->simulation_size + sample.y * settings->simulation_size + sample.x;
 
         // return value
         return volume[idx];
@@ -45,18 +93,10 @@ float sense(__global Spore* spore, __global float* volume, __global const Settin
 
 // Debugging function, for drawing the spores just how the sensors are accessed above
 void draw_sensor(__global Spore* spore, __global float* volume, __global const Settings* settings, float3 direction, float3 forward) {
-    // Calculate the sampling position using the direction vector
-    float3 averagePos = normalize(forward + direction);
-
-    float3 samplePos = spore->position + averagePos * settings->sensor_distance;
-
-    // Clamp the sampling position to be within the simulation bounds
-    uint sampleX = clamp((uint)samplePos.x, 0u, settings->simulation_size - 1u);
-    uint sampleY = clamp((uint)samplePos.y, 0u, settings->simulation_size - 1u);
-    uint sampleZ = clamp((uint)samplePos.z, 0u, settings->simulation_size - 1u);
+    uint3 sample = sensor_voxel(spore, settings, settings->sensor_distance, direction, forward);
 
     // Calculate the linear index in the volume array
-    uint idx = sampleZ * settings->simulation_size * settings->simulation_size + sampleY * settings->simulation_size + sampleX;
+    uint idx = sample.z * settings->simulation_size * settings->simulation_size + sample.y * settings->simulation_size + sample.x;
 
     // Mark the sensor position in the volume
     volume[idx] = 0.5; // Assign a value to indicate a sensor's position
@@ -78,6 +118,141 @@ float scaleToRange01(uint x) {
     return x / (float)0xFFFFFFFF;
 }
 
+// Marks the voxel a spore is in
+void draw_spore(__global float* volume, __global const Spore* spore, __global const Settings* settings) {
+    uint x = (int)(spore->position.x);
+    uint y = (int)(spore->position.y);
+    uint z = (int)(spore->position.z);
+
+    // Ensure the coordinates are within the image bounds
+    if (x < settings->simulation_size && y < settings->simulation_size && z < settings->simulation_size) {
+        uint volume_idx = z * settings->simulation_size * settings->simulation_size + y * settings->simulation_size + x;
+        volume[volume_idx] = 1.0f; // Place a 1 at the position of the spore
+    }
+}
+
+// Random unit vector, uniform over the sphere
+float3 random_direction(uint* state) {
+    *state = hash(*state);
+    float z = scaleToRange01(*state) * 2.0f - 1.0f;
+    *state = hash(*state);
+    float angle = scaleToRange01(*state) * 2.0f * M_PI;
+
+    float radius = sqrt(max(0.0f, 1.0f - z * z));
+    return (float3)(radius * cos(angle), radius * sin(angle), z);
+}
+
+// Spawns spores in place so no spore array has to be built on the host and copied over
+// distribution: 0 uniform in the cube, 1 on a sphere shell of the radius around the center, 2 at the center
+// Only spores from first_spore up to the spore count are spawned, the ones before are left alone
+__kernel void initialize_spores(__global Spore* spores, __global uint* random_seeds, __global const Settings* settings,
+                                const uint seed, const uint distribution, const float radius, const uint first_spore) {
+    uint idx = first_spore + (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    // Every spore gets its own stream from the seed
+    uint state = hash(seed ^ hash(idx));
+    float size = (float)settings->simulation_size;
+    float3 center = (float3)(size * 0.5f);
+    float3 position;
+
+    if (distribution == 1) {
+        position = center + random_direction(&state) * radius;
+    } else if (distribution == 2) {
+        position = center;
+    } else {
+        state = hash(state);
+        position.x = scaleToRange01(state) * size;
+        state = hash(state);
+        position.y = scaleToRange01(state) * size;
+        state = hash(state);
+        position.z = scaleToRange01(state) * size;
+    }
+
+    // Keep inside the volume, the top edge itself would fall outside the last voxel
+    spores[idx].position = clamp(position, 0.0f, size - 0.001f);
+    spores[idx].direction = random_direction(&state);
+
+    random_seeds[idx] = hash(state);
+#ifdef SPECIES_COUNT
+    // Species take turns, so every species gets an even share of any spawn
+    spores[idx].species = idx % SPECIES_COUNT;
+#endif
+
+    // The seed array holds one extra entry past the spores
+    if (idx == settings->spore_count - 1) {
+        random_seeds[idx + 1] = hash(state ^ 0x9E3779B9u);
+    }
+}
+
+// Fills the holes left by removed spores with the surviving spores from past the new end
+__kernel void compact_spores(__global Spore* spores, __global uint* random_seeds, __global const uint* holes,
+                             __global const uint* sources, const uint move_count) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= move_count) {
+        return;
+    }
+
+    // Holes are all below the new count and sources all above it, so no spore is read after being written
+    spores[holes[idx]] = spores[sources[idx]];
+    random_seeds[holes[idx]] = random_seeds[sources[idx]];
+}
+
+// Trilinear sample of the source volume for every voxel of the destination volume, voxel centers are matched up
+__kernel void resample_volume(__global const float* source, const uint source_size, __global float* destination,
+                              const uint destination_size) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = (uint)get_global_id(2);
+
+    if (x >= destination_size || y >= destination_size || z >= destination_size) {
+        return;
+    }
+
+    float scale = (float)source_size / (float)destination_size;
+    float3 samplePos = clamp(((float3)(x, y, z) + 0.5f) * scale - 0.5f, 0.0f, (float)(source_size - 1));
+
+    uint3 low = convert_uint3(samplePos);
+    uint3 high = min(low + 1, (uint3)(source_size - 1));
+    float3 t = samplePos - convert_float3(low);
+
+    uint plane = source_size * source_size;
+    float c000 = source[low.z * plane + low.y * source_size + low.x];
+    float c100 = source[low.z * plane + low.y * source_size + high.x];
+    float c010 = source[low.z * plane + high.y * source_size + low.x];
+    float c110 = source[low.z * plane + high.y * source_size + high.x];
+    float c001 = source[high.z * plane + low.y * source_size + low.x];
+    float c101 = source[high.z * plane + low.y * source_size + high.x];
+    float c011 = source[high.z * plane + high.y * source_size + low.x];
+    float c111 = source[high.z * plane + high.y * source_size + high.x];
+
+    float c00 = mix(c000, c100, t.x);
+    float c10 = mix(c010, c110, t.x);
+    float c01 = mix(c001, c101, t.x);
+    float c11 = mix(c011, c111, t.x);
+
+    float c0 = mix(c00, c10, t.y);
+    float c1 = mix(c01, c11, t.y);
+
+    destination[z * destination_size * destination_size + y * destination_size + x] = mix(c0, c1, t.z);
+}
+
+// Scales spore positions to a new simulation size, keeping them inside the volume like move_spore does
+__kernel void rescale_spores(__global Spore* spores, const uint spore_count, const float scale,
+                             const uint simulation_size) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= spore_count) {
+        return;
+    }
+
+    spores[idx].position = clamp(spores[idx].position * scale, 0.0f, (float)(simulation_size - 1));
+}
+
 // Kernel that updates volume data where spores are.
 __kernel void draw_spores(__global float* volume, __global Spore* spores, __global const Settings* settings) {
     uint idx = (uint)get_global_id(0);
@@ -86,15 +261,68 @@ __kernel void draw_spores(__global float* volume, __global Spore* spores, __glob
         return;
     }
 
-    Spore s = spores[idx];
-    uint x = (int)(s.position.x);
-    uint y = (int)(s.position.y);
-    uint z = (int)(s.position.z);
+    draw_spore(volume, &spores[idx], settings);
+}
 
-    // Ensure the coordinates are within the image bounds
-    if (x < settings->simulation_size && y < settings->simulation_size && z < settings->simulation_size) {
-        uint volume_idx = z * settings->simulation_size * settings->simulation_size + y * settings->simulation_size + x;
-        volume[volume_idx] = 1.0f; // Place a 1 at the position of the spore
+// Adds value to a volume voxel atomically, never past saturation. OpenCL 1.2 has no float atomics, so it swaps the
+// bits in with compare and exchange until no other work-item got in between. Voxels already above saturation (a
+// marked trail, a lowered slider) are left as they are rather than pulled down, and need no exchange at all.
+void atomic_add_saturated(__global float* address, float value, float saturation) {
+    volatile __global uint* bits = (volatile __global uint*)address;
+    uint expected = *bits;
+    uint previous;
+    do {
+        previous = expected;
+        float current = as_float(previous);
+        float sum = fmax(current, min(current + value, saturation));
+        if (sum == current) {
+            return;
+        }
+        expected = atomic_cmpxchg(bits, previous, as_uint(sum));
+    } while (expected != previous);
+}
+
+// draw_spores that adds deposit_amount per spore up to saturation, so the trails show how many spores passed.
+// Each group counts its spores per voxel in a local hash table first, twice the group size so every spore finds a
+// slot, then adds every voxel it touched to the volume once. Spores piling into a filament cost one global atomic
+// per voxel and group instead of one per spore.
+__kernel void accumulate_spores(__global float* volume, __global const Spore* spores,
+                                __global const Settings* settings, const float deposit_amount, const float saturation,
+                                __local uint* voxels, __local uint* counts) {
+    uint idx = (uint)get_global_id(0);
+    uint local_id = (uint)get_local_id(0);
+    uint group_size = (uint)get_local_size(0);
+    uint table_size = 2 * group_size;
+    uint size = settings->simulation_size;
+
+    for (uint slot = local_id; slot < table_size; slot += group_size) {
+        voxels[slot] = 0xFFFFFFFFu;
+        counts[slot] = 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    // Every work-item reaches the barriers, the ones past the spore count just have nothing to add
+    if (idx < settings->spore_count) {
+        uint3 voxel = convert_uint3(convert_int3_rtz(spores[idx].position));
+        if (all(voxel < (uint3)(size))) {
+            uint volume_idx = (voxel.z * size + voxel.y) * size + voxel.x;
+
+            // Linear probing, the first spore of a voxel claims the slot and the rest count into it
+            uint slot = hash(volume_idx) & (table_size - 1);
+            uint claimed = atomic_cmpxchg(&voxels[slot], 0xFFFFFFFFu, volume_idx);
+            while (claimed != 0xFFFFFFFFu && claimed != volume_idx) {
+                slot = (slot + 1) & (table_size - 1);
+                claimed = atomic_cmpxchg(&voxels[slot], 0xFFFFFFFFu, volume_idx);
+            }
+            atomic_inc(&counts[slot]);
+        }
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    for (uint slot = local_id; slot < table_size; slot += group_size) {
+        if (counts[slot]) {
+            atomic_add_saturated(&volume[voxels[slot]], counts[slot] * deposit_amount, saturation);
+        }
     }
 }
 
@@ -128,37 +356,48 @@ __kernel void draw_sensors(__global float* volume, __global Spore* spores, __glo
     draw_sensor(&spores[idx], volume, settings, -upVector, sporeDirection);
 }
 
-// Moves the spores forward based on the weighted sensors, if hit a boundary, randomly bouce
-__kernel void move_spores(__global Spore* spores, __global float* volume, __global uint* random_seeds, __global const Settings* settings, const float delta_time) {
-    uint idx = (uint)get_global_id(0);
-
-    if (idx >= settings->spore_count) {
-        return;
-    }
-
+// Local right and up vectors of a spore heading in sporeDirection, the sensors sit along them
+void get_sensor_axes(float3 sporeDirection, float3* rightVector, float3* upVector) {
     float3 globalUp = (float3)(0.0f, 0.0f, 1.0f); // Global up
-    float3 sporeDirection = spores[idx].direction;
 
     // Generate the local right vector
-    float3 rightVector = cross(sporeDirection, globalUp);
+    float3 right = cross(sporeDirection, globalUp);
     // Handle parallel or antiparallel direction
-    if (length(rightVector) == 0) {
+    if (length(right) == 0) {
         // Fallback or adjust rightVector
-        rightVector = (float3)(1.0f, 0.0f, 0.0f);
+        right = (float3)(1.0f, 0.0f, 0.0f);
     }
-    rightVector = normalize(rightVector);
+    *rightVector = normalize(right);
 
     // Generate local up vector based on right and forward vectors
-    float3 upVector = cross(rightVector, sporeDirection);
-    upVector = normalize(upVector);
+    *upVector = normalize(cross(*rightVector, sporeDirection));
+}
+
+// Moves one spore forward based on the weighted sensors, if hit a boundary, randomly bounce.
+// Uses random_seeds[seed_index] and random_seeds[seed_index + 1] for the bounce.
+// Moves a spore along its sensed direction, returns whether it bounced off the boundary
+bool move_spore(__global Spore* spore, __global float* volume, __global uint* random_seeds, uint seed_index,
+                __global const Settings* settings, float delta_time) {
+    float3 sporeDirection = spore->direction;
+    float3 rightVector, upVector;
+    get_sensor_axes(sporeDirection, &rightVector, &upVector);
 
     // Sense weights
-    float forwardWeight = sense(&spores[idx], volume, settings, sporeDirection, sporeDirection);
-    float rightWeight = sense(&spores[idx], volume, settings, rightVector, sporeDirection);
-    float leftWeight = sense(&spores[idx], volume, settings, -rightVector, sporeDirection);
-    float upWeight = sense(&spores[idx], volume, settings, upVector, sporeDirection);
-    float downWeight = sense(&spores[idx], volume, settings, -upVector, sporeDirection);
+    float forwardWeight = sense(spore, volume, settings, sporeDirection, sporeDirection);
+    float rightWeight = sense(spore, volume, settings, rightVector, sporeDirection);
+    float leftWeight = sense(spore, volume, settings, -rightVector, sporeDirection);
+    float upWeight = sense(spore, volume, settings, upVector, sporeDirection);
+    float downWeight = sense(spore, volume, settings, -upVector, sporeDirection);
+
+    return steer_spore(spore, forwardWeight, rightWeight, leftWeight, upWeight, downWeight, rightVector, upVector,
+                       random_seeds, seed_index, settings, settings->spore_speed, delta_time);
+}
 
+// Turns a spore towards the strongest of its sensed weights and moves it, returns whether it bounced off the boundary
+bool steer_spore(__global Spore* spore, float forwardWeight, float rightWeight, float leftWeight, float upWeight,
+                 float downWeight, float3 rightVector, float3 upVector, __global uint* random_seeds, uint seed_index,
+                 __global const Settings* settings, float spore_speed, float delta_time) {
+    float3 sporeDirection = spore->direction;
     float3 directionChange = (float3)(0,0,0);
 
 
@@ -181,10 +420,17 @@ __kernel void move_spores(__global Spore* spores, __global float* volume, __glob
     }
 
     // Set the new direction
-    float3 newDirection = sporeDirection + directionChange * settings->spore_speed * delta_time;
+    float3 newDirection = sporeDirection + directionChange * spore_speed * delta_time;
     newDirection = normalize(newDirection);
 
-    float3 newPosition = spores[idx].position + newDirection * settings->spore_speed * delta_time;
+    float3 newPosition = spore->position + newDirection * spore_speed * delta_time;
+
+    // A periodic domain has no walls to bounce off, the spore comes back in on the other side
+    if (settings->boundary_mode == BOUNDARY_PERIODIC) {
+        spore->position = wrap_position(newPosition, settings->simulation_size);
+        spore->direction = newDirection;
+        return false;
+    }
 
     // Store position for future check
     float3 storePosition = newPosition;
@@ -201,12 +447,12 @@ __kernel void move_spores(__global Spore* spores, __global float* volume, __glob
     // Boundary check and bounce-back logic
     if (hitBoundary) {
         // Get random values
-        float random1 = hash(random_seeds[idx]);
-        float random2 = hash(random_seeds[idx + 1]);
+        float random1 = hash(random_seeds[seed_index]);
+        float random2 = hash(random_seeds[seed_index + 1]);
 
         // Reset Seed values
-        random_seeds[idx] = random2;
-        random_seeds[idx + 1] = random1;
+        random_seeds[seed_index] = random2;
+        random_seeds[seed_index + 1] = random1;
 
         // Scale to normalized value
         random1 = scaleToRange01(random1);
@@ -236,8 +482,25 @@ __kernel void move_spores(__global Spore* spores, __global float* volume, __glob
     }
 
     // Update values
-    spores[idx].position = newPosition;
-    spores[idx].direction = newDirection;
+    spore->position = newPosition;
+    spore->direction = newDirection;
+
+    return hitBoundary;
+}
+
+// Moves the spores forward based on the weighted sensors, if hit a boundary, randomly bouce
+__kernel void move_spores(__global Spore* spores, __global float* volume, __global uint* random_seeds, __global const Settings* settings, const float delta_time,
+                          __global uint* metric_counters) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    // Bounces are rare, so counting them with a global atomic costs next to nothing
+    if (move_spore(&spores[idx], volume, random_seeds, idx, settings, delta_time)) {
+        atomic_inc(&metric_counters[METRIC_BOUNCES]);
+    }
 }
 
 // Decays each volume position by the decay speed
@@ -256,3 +519,251 @@ __kernel void decay_trails(__global float* volume, __global const Settings* sett
     }
 }
 
+
+// Largest screen area (in depth tiles) a voxel may cover before the occlusion test just keeps it
+#define MAX_OCCLUSION_TILES 16
+
+// Projects a point by the column-major model-view-projection matrix stored at the start of cull_data
+float4 project_point(__constant float* cull_data, float3 point) {
+    return (float4)(cull_data[0] * point.x + cull_data[4] * point.y + cull_data[8] * point.z + cull_data[12],
+                    cull_data[1] * point.x + cull_data[5] * point.y + cull_data[9] * point.z + cull_data[13],
+                    cull_data[2] * point.x + cull_data[6] * point.y + cull_data[10] * point.z + cull_data[14],
+                    cull_data[3] * point.x + cull_data[7] * point.y + cull_data[11] * point.z + cull_data[15]);
+}
+
+// Returns false if the bounding sphere lies fully outside any of the six frustum planes
+bool in_frustum(__constant float* cull_data, float3 center, float radius) {
+    for (int i = 0; i < 6; i++) {
+        // Planes are stored as (normal, distance) after the 16 matrix values
+        float4 plane = vload4(4 + i, cull_data);
+        if (dot(plane.xyz, center) + plane.w < -radius) {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Returns true if the box is behind the previous frame's depth in every tile it covers on screen
+bool is_occluded(__constant float* cull_data, __global const float* depth_tiles, uint screen_width,
+                 uint screen_height, uint tile_size, float3 center, float half_size) {
+    float2 screen_min = (float2)(FLT_MAX, FLT_MAX);
+    float2 screen_max = (float2)(-FLT_MAX, -FLT_MAX);
+    float nearest_depth = 1.0f;
+
+    // Project all 8 corners to get the screen rectangle and the closest depth of the box
+    for (int corner = 0; corner < 8; corner++) {
+        float3 offset = (float3)((corner & 1) ? half_size : -half_size,
+                                 (corner & 2) ? half_size : -half_size,
+                                 (corner & 4) ? half_size : -half_size);
+        float4 clip = project_point(cull_data, center + offset);
+
+        // Box crosses the camera plane, keep it
+        if (clip.w <= 0.0f) {
+            return false;
+        }
+
+        float3 ndc = clip.xyz / clip.w;
+        float2 screen = (ndc.xy * 0.5f + 0.5f) * (float2)(screen_width, screen_height);
+        screen_min = min(screen_min, screen);
+        screen_max = max(screen_max, screen);
+        nearest_depth = min(nearest_depth, ndc.z * 0.5f + 0.5f);
+    }
+
+    int tile_columns = (screen_width + tile_size - 1) / tile_size;
+    int tile_rows = (screen_height + tile_size - 1) / tile_size;
+
+    int x0 = clamp((int)(screen_min.x / tile_size), 0, tile_columns - 1);
+    int y0 = clamp((int)(screen_min.y / tile_size), 0, tile_rows - 1);
+    int x1 = clamp((int)(screen_max.x / tile_size), 0, tile_columns - 1);
+    int y1 = clamp((int)(screen_max.y / tile_size), 0, tile_rows - 1);
+
+    // Too big on screen to be worth testing
+    if ((x1 - x0 + 1) * (y1 - y0 + 1) > MAX_OCCLUSION_TILES) {
+        return false;
+    }
+
+    // Tiles hold the farthest depth drawn in them, so anything nearer than that may be visible
+    for (int y = y0; y <= y1; y++) {
+        for (int x = x0; x <= x1; x++) {
+            if (nearest_depth <= depth_tiles[y * tile_columns + x]) {
+                return false;
+            }
+        }
+    }
+    return true;
+}
+
+// Writes every non-empty voxel that survives frustum (and optionally occlusion) culling into the instance
+// buffers, counting them in the instanceCount field of the indirect draw command
+__kernel void cull_instances(__global const float* volume, __global const Settings* settings,
+                             __constant float* cull_data, __global const float* depth_tiles,
+                             const uint screen_width, const uint screen_height, const uint tile_size,
+                             const uint occlusion_enabled, __global float* instance_positions,
+                             __global float* instance_sizes, __global uint* draw_command, const uint max_instances,
+                             const float instance_threshold) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = (uint)get_global_id(2);
+
+    if (x >= settings->simulation_size || y >= settings->simulation_size || z >= settings->simulation_size) {
+        return;
+    }
+
+    uint idx = z * settings->simulation_size * settings->simulation_size + y * settings->simulation_size + x;
+    float value = volume[idx];
+
+    // Faint voxels are skipped, the threshold is raised to cut the instance count under load
+    if (value <= instance_threshold) {
+        return;
+    }
+
+    // Instances are stored as (z, y, x) and the vertex shader draws them centered at (z, x, y)
+    float3 center = (float3)(z, x, y);
+    float half_size = value * 0.5f;
+
+    // Bounding sphere radius of the cube is half its diagonal
+    if (!in_frustum(cull_data, center, half_size * 1.7320508f)) {
+        return;
+    }
+
+    if (occlusion_enabled && is_occluded(cull_data, depth_tiles, screen_width, screen_height, tile_size, center, half_size)) {
+        return;
+    }
+
+    uint slot = atomic_inc(&draw_command[1]);
+    if (slot < max_instances) {
+        instance_positions[slot * 3] = (float)z;
+        instance_positions[slot * 3 + 1] = (float)y;
+        instance_positions[slot * 3 + 2] = (float)x;
+        instance_sizes[slot] = value;
+    }
+}
+
+// Reduces the volume along one axis (0 = x, 1 = y, 2 = z) into a 2D image, one work-group per pixel.
+// Mode 0 keeps the maximum intensity along the ray, mode 1 the mean.
+__kernel void project_volume(__global const float* volume, __global const Settings* settings,
+                             __global float* projections, const uint axis, const uint mode, __local float* scratch) {
+    uint local_id = (uint)get_local_id(0);
+    uint group_size = (uint)get_local_size(0);
+    uint u = (uint)get_global_id(1);
+    uint v = (uint)get_global_id(2);
+    uint size = settings->simulation_size;
+
+    // Each work-item walks a strided part of the ray
+    float max_value = 0.0f;
+    float sum = 0.0f;
+    if (u < size && v < size) {
+        for (uint t = local_id; t < size; t += group_size) {
+            uint x = axis == 0 ? t : u;
+            uint y = axis == 0 ? u : (axis == 1 ? t : v);
+            uint z = axis == 2 ? t : v;
+
+            float value = volume[z * size * size + y * size + x];
+            max_value = max(max_value, value);
+            sum += value;
+        }
+    }
+
+    scratch[local_id] = mode == 0 ? max_value : sum;
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    // Tree reduction in local memory, the group size is a power of two
+    for (uint stride = group_size / 2; stride > 0; stride /= 2) {
+        if (local_id < stride) {
+            float other = scratch[local_id + stride];
+            scratch[local_id] = mode == 0 ? max(scratch[local_id], other) : scratch[local_id] + other;
+        }
+        barrier(CLK_LOCAL_MEM_FENCE);
+    }
+
+    if (local_id == 0 && u < size && v < size) {
+        projections[axis * size * size + v * size + u] = mode == 0 ? scratch[0] : scratch[0] / (float)size;
+    }
+}
+
+
+// Sums the trail mass and counts occupied voxels and the value histogram, each group strides over the whole volume.
+// Per group masses go to mass_partials, the counts are added to metric_counters. Zero voxels are skipped, the host
+// puts whatever the histogram is missing into the first bin.
+__kernel void reduce_volume_metrics(__global const float* volume, __global const Settings* settings,
+                                    const float occupancy_threshold, const uint bin_count,
+                                    __global float* mass_partials, __global uint* metric_counters,
+                                    __local float* scratch) {
+    __local uint local_histogram[METRIC_MAX_BINS];
+    __local uint local_occupied;
+
+    uint local_id = (uint)get_local_id(0);
+    uint group_size = (uint)get_local_size(0);
+    uint size = settings->simulation_size;
+    uint voxel_count = size * size * size;
+
+    for (uint bin = local_id; bin < bin_count; bin += group_size) {
+        local_histogram[bin] = 0;
+    }
+    if (local_id == 0) {
+        local_occupied = 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    float mass = 0.0f;
+    uint occupied = 0;
+    for (uint idx = (uint)get_global_id(0); idx < voxel_count; idx += (uint)get_global_size(0)) {
+        float value = volume[idx];
+        if (value > 0.0f) {
+            mass += value;
+            occupied += value > occupancy_threshold;
+            atomic_inc(&local_histogram[min((uint)(min(value, 1.0f) * bin_count), bin_count - 1)]);
+        }
+    }
+
+    scratch[local_id] = mass;
+    atomic_add(&local_occupied, occupied);
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    // Tree reduction in local memory, the group size is a power of two
+    for (uint stride = group_size / 2; stride > 0; stride /= 2) {
+        if (local_id < stride) {
+            scratch[local_id] += scratch[local_id + stride];
+        }
+        barrier(CLK_LOCAL_MEM_FENCE);
+    }
+
+    if (local_id == 0) {
+        mass_partials[get_group_id(0)] = scratch[0];
+        atomic_add(&metric_counters[METRIC_OCCUPIED], local_occupied);
+    }
+    for (uint bin = local_id; bin < bin_count; bin += group_size) {
+        if (local_histogram[bin]) {
+            atomic_add(&metric_counters[METRIC_HISTOGRAM + bin], local_histogram[bin]);
+        }
+    }
+}
+
+// Sums spore positions and squared distances from the volume center, 4 floats per group into spore_partials.
+// Measuring from the center keeps the squares small, so the spread doesn't drown in float cancellation.
+__kernel void reduce_spore_metrics(__global const Spore* spores, __global const Settings* settings,
+                                   __global float* spore_partials, __local float4* scratch) {
+    uint local_id = (uint)get_local_id(0);
+    uint group_size = (uint)get_local_size(0);
+    float3 center = (float3)(settings->simulation_size * 0.5f);
+
+    float4 sums = (float4)(0.0f);
+    for (uint idx = (uint)get_global_id(0); idx < settings->spore_count; idx += (uint)get_global_size(0)) {
+        float3 offset = spores[idx].position - center;
+        sums += (float4)(offset, dot(offset, offset));
+    }
+
+    scratch[local_id] = sums;
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    for (uint stride = group_size / 2; stride > 0; stride /= 2) {
+        if (local_id < stride) {
+            scratch[local_id] += scratch[local_id + stride];
+        }
+        barrier(CLK_LOCAL_MEM_FENCE);
+    }
+
+    if (local_id == 0) {
+        vstore4(scratch[0], get_group_id(0), spore_partials);
+    }
+}
@@ -0,0 +1,55 @@
+// Batch kernels, built on top of 3d_simulation.cl. Every simulation in the batch has the same size,
+// its own Settings entry and its own slice of the volume, spores say which simulation they belong to.
+
+// Spore tagged with the simulation it belongs to
+typedef struct {
+    Spore spore;
+    uint batch_id;
+} BatchSpore;
+
+// Decays every simulation's volume by its own decay speed, z runs over all simulations stacked
+__kernel void batch_decay_trails(__global float* volume, __global const Settings* settings, const uint batch_count,
+                                 const float delta_time) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint stacked_z = (uint)get_global_id(2);
+    uint size = settings[0].simulation_size;
+
+    if (x < size && y < size && stacked_z < size * batch_count) {
+        // Volumes are stored back to back, so the stacked index is also the linear index
+        uint idx = stacked_z * size * size + y * size + x;
+        uint batch = stacked_z / size;
+
+        volume[idx] = max(0.0f, volume[idx] - settings[batch].decay_speed * delta_time);
+    }
+}
+
+// Marks the voxel each spore is in, in its own simulation's volume
+__kernel void batch_draw_spores(__global float* volume, __global BatchSpore* spores, __global const Settings* settings,
+                                const uint total_spore_count) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= total_spore_count) {
+        return;
+    }
+
+    uint batch = spores[idx].batch_id;
+    uint volume_size = settings[batch].simulation_size * settings[batch].simulation_size * settings[batch].simulation_size;
+
+    draw_spore(volume + batch * volume_size, &spores[idx].spore, &settings[batch]);
+}
+
+// Moves every spore of every simulation with its own simulation's settings
+__kernel void batch_move_spores(__global BatchSpore* spores, __global float* volume, __global uint* random_seeds,
+                                __global const Settings* settings, const uint total_spore_count, const float delta_time) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= total_spore_count) {
+        return;
+    }
+
+    uint batch = spores[idx].batch_id;
+    uint volume_size = settings[batch].simulation_size * settings[batch].simulation_size * settings[batch].simulation_size;
+
+    move_spore(&spores[idx].spore, volume + batch * volume_size, random_seeds, idx, &settings[batch], delta_time);
+}
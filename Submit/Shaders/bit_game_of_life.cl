@@ -0,0 +1,157 @@
+// Game of Life on a bit-packed board, one bit per cell, 32 cells per uint word.
+// Bit i of a word is the cell at x = word * 32 + i, rows are words_per_row words long.
+// Cells outside the board are dead.
+
+uint life_rule(uint up_west, uint up, uint up_east, uint west, uint center, uint east,
+               uint down_west, uint down, uint down_east);
+uint next_word(__local const uint* tile, uint local_words, uint local_x, uint local_y);
+
+// Next state of 32 cells at once. The eight neighbor planes are summed with bitwise adders into the count's
+// ones, twos and fours bits, a cell lives with a count of 3, or of 2 if it was alive.
+uint life_rule(uint up_west, uint up, uint up_east, uint west, uint center, uint east,
+               uint down_west, uint down, uint down_east) {
+    uint partial = up_west ^ up;
+    uint sum_a = partial ^ up_east;
+    uint carry_a = (up_west & up) | (partial & up_east);
+
+    partial = west ^ east;
+    uint sum_b = partial ^ down_west;
+    uint carry_b = (west & east) | (partial & down_west);
+
+    uint sum_c = down ^ down_east;
+    uint carry_c = down & down_east;
+
+    partial = sum_a ^ sum_b;
+    uint ones = partial ^ sum_c;
+    uint carry_d = (sum_a & sum_b) | (partial & sum_c);
+
+    partial = carry_a ^ carry_b;
+    uint twos_a = partial ^ carry_c;
+    uint fours_a = (carry_a & carry_b) | (partial & carry_c);
+
+    uint twos = twos_a ^ carry_d;
+    uint fours = fours_a ^ (twos_a & carry_d);
+
+    return twos & ~fours & (ones | center);
+}
+
+// Steps the word at (local_x, local_y) of a tile, words off the tile's edge count as dead
+uint next_word(__local const uint* tile, uint local_words, uint local_x, uint local_y) {
+    uint rows[3][3];
+    for (int dy = 0; dy < 3; dy++) {
+        __local const uint* row = tile + (local_y + dy - 1) * local_words;
+        rows[dy][0] = local_x > 0 ? row[local_x - 1] : 0;
+        rows[dy][1] = row[local_x];
+        rows[dy][2] = local_x + 1 < local_words ? row[local_x + 1] : 0;
+    }
+
+    // West neighbors sit one bit lower, the lowest comes from the top bit of the word before
+    uint west[3], east[3];
+    for (int dy = 0; dy < 3; dy++) {
+        west[dy] = (rows[dy][1] << 1) | (rows[dy][0] >> 31);
+        east[dy] = (rows[dy][1] >> 1) | (rows[dy][2] << 31);
+    }
+
+    return life_rule(west[0], rows[0][1], east[0], west[1], rows[1][1], east[1], west[2], rows[2][1], east[2]);
+}
+
+// Advances the board by generations in one launch. Each work-group loads its tile of words into local memory
+// with a halo of one word on either side and one row per generation above and below, then steps the tile
+// generations times in local memory. The halo's outer cells go stale by one cell per generation, so up to 32
+// generations the tile itself stays exact. The tile is one word per work item, the local buffers must each hold
+// (tile_words + 2) * (tile_rows + 2 * generations) words.
+__kernel void step_life(__global const uint* board, __global uint* next_board, const uint words_per_row,
+                        const uint height, const uint generations, __local uint* tile_a, __local uint* tile_b) {
+    const uint tile_words = get_local_size(0);
+    const uint tile_rows = get_local_size(1);
+    const uint local_words = tile_words + 2;
+    const uint local_rows = tile_rows + 2 * generations;
+    const int first_word = (int)(get_group_id(0) * tile_words) - 1;
+    const int first_row = (int)(get_group_id(1) * tile_rows) - (int)generations;
+    const uint local_id = get_local_id(1) * tile_words + get_local_id(0);
+    const uint local_count = tile_words * tile_rows;
+
+    // Load the tile and its halo
+    for (uint i = local_id; i < local_words * local_rows; i += local_count) {
+        int word = first_word + (int)(i % local_words);
+        int row = first_row + (int)(i / local_words);
+        bool on_board = word >= 0 && word < (int)words_per_row && row >= 0 && row < (int)height;
+        tile_a[i] = on_board ? board[row * words_per_row + word] : 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    __local uint* source = tile_a;
+    __local uint* destination = tile_b;
+
+    for (uint generation = 1; generation <= generations; generation++) {
+        // Rows of the halo that can't affect the tile anymore are skipped, the band shrinks by a row each side
+        uint band_rows = local_rows - 2 * generation;
+        for (uint i = local_id; i < local_words * band_rows; i += local_count) {
+            uint local_x = i % local_words;
+            uint local_y = i / local_words + generation;
+            int word = first_word + (int)local_x;
+            int row = first_row + (int)local_y;
+
+            // Cells off the board stay dead
+            bool on_board = word >= 0 && word < (int)words_per_row && row >= 0 && row < (int)height;
+            destination[local_y * local_words + local_x] = on_board ?
+                next_word(source, local_words, local_x, local_y) : 0;
+        }
+        barrier(CLK_LOCAL_MEM_FENCE);
+
+        __local uint* swap = source;
+        source = destination;
+        destination = swap;
+    }
+
+    // Write the tile without its halo
+    uint word = get_global_id(0);
+    uint row = get_global_id(1);
+    if (word < words_per_row && row < height) {
+        uint local_index = (get_local_id(1) + generations) * local_words + get_local_id(0) + 1;
+        next_board[row * words_per_row + word] = source[local_index];
+    }
+}
+
+// Counts the live cells, each work item sums a strided share of the words before one atomic add
+__kernel void count_population(__global const uint* board, const uint word_count, __global uint* population) {
+    uint count = 0;
+    for (uint i = get_global_id(0); i < word_count; i += get_global_size(0)) {
+        count += popcount(board[i]);
+    }
+    if (count) {
+        atomic_add(population, count);
+    }
+}
+
+// Expands the viewport starting at cell (viewport_x, viewport_y) into an RGBA image, one pixel covers scale by
+// scale cells. Zoomed out, a pixel's brightness is the share of live cells among up to 4 by 4 samples of its cells.
+__kernel void render_life(__global const uint* board, const uint words_per_row, const uint height,
+                          const float viewport_x, const float viewport_y, const float scale,
+                          const uint image_width, const uint image_height, __global uchar4* image) {
+    uint x = get_global_id(0);
+    uint y = get_global_id(1);
+
+    if (x >= image_width || y >= image_height) {
+        return;
+    }
+
+    int samples = scale > 1.0f ? min((int)scale, 4) : 1;
+    float sample_step = scale / samples;
+    uint alive = 0;
+
+    for (int sample_y = 0; sample_y < samples; sample_y++) {
+        for (int sample_x = 0; sample_x < samples; sample_x++) {
+            float cell_x = floor(viewport_x + x * scale + sample_x * sample_step);
+            float cell_y = floor(viewport_y + y * scale + sample_y * sample_step);
+            if (cell_x < 0.0f || cell_y < 0.0f || cell_x >= words_per_row * 32.0f || cell_y >= (float)height) {
+                continue;
+            }
+            uint column = (uint)cell_x;
+            alive += (board[(uint)cell_y * words_per_row + column / 32] >> (column % 32)) & 1;
+        }
+    }
+
+    uchar value = (uchar)(alive * 255 / (samples * samples));
+    image[y * image_width + x] = (uchar4)(value, value, value, 255);
+}
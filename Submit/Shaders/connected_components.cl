@@ -0,0 +1,172 @@
+// Connected components of the voxels above a threshold, 6-connected.
+// Every foreground voxel's label points at a voxel of the same component with an index no larger than its own,
+// so following labels always ends at the component's root, its first voxel in memory order.
+#define BACKGROUND 0xFFFFFFFFu
+
+// Layout of the per component statistics, 8 uints each
+#define STAT_SIZE 0
+#define STAT_MIN 1
+#define STAT_MAX 4
+#define STAT_ROOT 7
+#define STAT_COUNT 8
+
+// Layout of the per brick data of the skeleton graph, 6 uints each
+#define BRICK_COUNT 0
+#define BRICK_SUM 1
+#define BRICK_LINKS 4
+#define BRICK_COMPONENT 5
+#define BRICK_STRIDE 6
+
+uint find_root(__global const uint* labels, uint label);
+
+// Follows the labels to the root, labels only ever shrink so concurrent updates can't make this loop
+uint find_root(__global const uint* labels, uint label) {
+    uint next = labels[label];
+    while (next != label) {
+        label = next;
+        next = labels[label];
+    }
+    return label;
+}
+
+// Every foreground voxel starts as its own component
+__kernel void initialize_labels(__global const float* volume, const uint voxel_count, const float threshold,
+                                __global uint* labels) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= voxel_count) {
+        return;
+    }
+
+    labels[idx] = volume[idx] > threshold ? idx : BACKGROUND;
+}
+
+// Hooks the voxel's root onto the smallest root among its neighbors, sets changed when anything was merged
+__kernel void propagate_labels(__global uint* labels, const uint size, __global uint* changed) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = (uint)get_global_id(2);
+
+    if (x >= size || y >= size || z >= size) {
+        return;
+    }
+
+    uint idx = z * size * size + y * size + x;
+    if (labels[idx] == BACKGROUND) {
+        return;
+    }
+
+    uint root = find_root(labels, labels[idx]);
+    uint best = root;
+
+    uint neighbors[6];
+    uint neighbor_count = 0;
+    if (x > 0) neighbors[neighbor_count++] = idx - 1;
+    if (x + 1 < size) neighbors[neighbor_count++] = idx + 1;
+    if (y > 0) neighbors[neighbor_count++] = idx - size;
+    if (y + 1 < size) neighbors[neighbor_count++] = idx + size;
+    if (z > 0) neighbors[neighbor_count++] = idx - size * size;
+    if (z + 1 < size) neighbors[neighbor_count++] = idx + size * size;
+
+    for (uint i = 0; i < neighbor_count; i++) {
+        uint label = labels[neighbors[i]];
+        if (label != BACKGROUND) {
+            best = min(best, find_root(labels, label));
+        }
+    }
+
+    // A merge lost to a concurrent hook is found again on the next pass, the neighbors still differ then
+    if (best < root) {
+        atomic_min(&labels[root], best);
+        atomic_min(&labels[idx], best);
+        *changed = 1;
+    }
+}
+
+// Pointer jumping, every voxel points straight at its root afterwards
+__kernel void flatten_labels(__global uint* labels, const uint voxel_count) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= voxel_count || labels[idx] == BACKGROUND) {
+        return;
+    }
+
+    labels[idx] = find_root(labels, labels[idx]);
+}
+
+// Gives each root a dense component id, stored at the root's index
+__kernel void number_components(__global const uint* labels, const uint voxel_count, __global uint* component_ids,
+                                __global uint* component_count) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= voxel_count || labels[idx] != idx) {
+        return;
+    }
+
+    component_ids[idx] = atomic_inc(component_count);
+}
+
+// Size and bounding box of every component, the minimums must start at BACKGROUND and the rest at 0
+__kernel void component_statistics(__global const uint* labels, const uint size, __global const uint* component_ids,
+                                   __global uint* statistics) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= size * size * size || labels[idx] == BACKGROUND) {
+        return;
+    }
+
+    uint x = idx % size;
+    uint y = (idx / size) % size;
+    uint z = idx / (size * size);
+
+    __global uint* component = statistics + component_ids[labels[idx]] * STAT_COUNT;
+    atomic_inc(&component[STAT_SIZE]);
+    atomic_min(&component[STAT_MIN], x);
+    atomic_min(&component[STAT_MIN + 1], y);
+    atomic_min(&component[STAT_MIN + 2], z);
+    atomic_max(&component[STAT_MAX], x);
+    atomic_max(&component[STAT_MAX + 1], y);
+    atomic_max(&component[STAT_MAX + 2], z);
+
+    if (labels[idx] == idx) {
+        component[STAT_ROOT] = idx;
+    }
+}
+
+// Coarse skeleton, the volume is split into bricks that collect their foreground voxel count, coordinate sums and
+// component, plus a link bit for each of the +x, +y and +z neighbor bricks they touch through foreground voxels.
+// The components must start at BACKGROUND and the rest at 0.
+__kernel void brick_graph(__global const uint* labels, const uint size, __global const uint* component_ids,
+                          const uint brick_size, const uint bricks_per_side, __global uint* bricks) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = (uint)get_global_id(2);
+
+    if (x >= size || y >= size || z >= size) {
+        return;
+    }
+
+    uint idx = z * size * size + y * size + x;
+    uint label = labels[idx];
+    if (label == BACKGROUND) {
+        return;
+    }
+
+    uint brick_index = ((z / brick_size) * bricks_per_side + y / brick_size) * bricks_per_side + x / brick_size;
+    __global uint* brick = bricks + brick_index * BRICK_STRIDE;
+
+    atomic_inc(&brick[BRICK_COUNT]);
+    atomic_add(&brick[BRICK_SUM], x);
+    atomic_add(&brick[BRICK_SUM + 1], y);
+    atomic_add(&brick[BRICK_SUM + 2], z);
+    atomic_min(&brick[BRICK_COMPONENT], component_ids[label]);
+
+    // Links only come from voxels on a brick's far faces
+    uint links = 0;
+    if (x % brick_size == brick_size - 1 && x + 1 < size && labels[idx + 1] != BACKGROUND) links |= 1;
+    if (y % brick_size == brick_size - 1 && y + 1 < size && labels[idx + size] != BACKGROUND) links |= 2;
+    if (z % brick_size == brick_size - 1 && z + 1 < size && labels[idx + size * size] != BACKGROUND) links |= 4;
+    if (links) {
+        atomic_or(&brick[BRICK_LINKS], links);
+    }
+}
@@ -0,0 +1,91 @@
+// Slab kernels, built on top of 3d_simulation.cl and batch_simulation.cl. Each slab owns the planes
+// z_begin <= z < z_end of the volume and stores them with halo extra planes on both sides, so the local
+// buffer starts at global plane z_begin - halo. Positions stay global.
+
+// Pointer that makes global volume indices land in the slab's local buffer. Only planes inside the
+// slab and its halo are ever read through it.
+__global float* slab_volume(__global float* volume, uint size, uint z_begin, uint halo) {
+    return volume - ((long)z_begin - (long)halo) * size * size;
+}
+
+// Decays the planes the slab owns, halo planes are overwritten by the exchange anyway
+__kernel void slab_decay_trails(__global float* volume, __global const Settings* settings, const uint z_begin,
+                                const uint z_end, const uint halo, const float delta_time) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = z_begin + (uint)get_global_id(2);
+    uint size = settings->simulation_size;
+
+    if (x < size && y < size && z < z_end) {
+        __global float* global_volume = slab_volume(volume, size, z_begin, halo);
+        uint idx = z * size * size + y * size + x;
+
+        global_volume[idx] = max(0.0f, global_volume[idx] - settings->decay_speed * delta_time);
+    }
+}
+
+// Marks the voxels of the slab's spores
+__kernel void slab_draw_spores(__global float* volume, __global Spore* spores, __global const Settings* settings,
+                               const uint spore_count, const uint z_begin, const uint z_end, const uint halo) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= spore_count) {
+        return;
+    }
+
+    // Spores only ever draw into the planes their slab owns
+    uint z = (uint)spores[idx].position.z;
+    if (z < z_begin || z >= z_end) {
+        return;
+    }
+
+    draw_spore(slab_volume(volume, settings->simulation_size, z_begin, halo), &spores[idx], settings);
+}
+
+// Moves the slab's spores, sensing reaches into the halo planes
+__kernel void slab_move_spores(__global Spore* spores, __global float* volume, __global uint* random_seeds,
+                               __global const Settings* settings, const uint spore_count, const uint z_begin,
+                               const uint z_end, const uint halo, const float delta_time) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= spore_count) {
+        return;
+    }
+
+    // Spores left over from a full outbox wait here until they migrate, their sensors could reach past the halo
+    uint z = (uint)spores[idx].position.z;
+    if (z < z_begin || z >= z_end) {
+        return;
+    }
+
+    move_spore(&spores[idx], slab_volume(volume, settings->simulation_size, z_begin, halo), random_seeds, idx,
+               settings, delta_time);
+}
+
+// Keeps the spores still inside the slab and sends the rest to an outbox tagged with the slab they moved to.
+// counters[0] counts kept spores, counters[1] outgoing ones (including any that didn't fit in the outbox).
+__kernel void slab_migrate_spores(__global const Spore* spores, const uint spore_count, const uint slab_index,
+                                  const uint slab_depth, const uint slab_count, __global Spore* kept_spores,
+                                  __global BatchSpore* outbox, const uint outbox_capacity, __global uint* counters) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= spore_count) {
+        return;
+    }
+
+    Spore spore = spores[idx];
+    uint target = min((uint)spore.position.z / slab_depth, slab_count - 1);
+
+    if (target == slab_index) {
+        kept_spores[atomic_inc(&counters[0])] = spore;
+    } else {
+        uint slot = atomic_inc(&counters[1]);
+        if (slot < outbox_capacity) {
+            outbox[slot].spore = spore;
+            outbox[slot].batch_id = target;
+        } else {
+            // Outbox is full, keep it for now and send it next step
+            kept_spores[atomic_inc(&counters[0])] = spore;
+        }
+    }
+}
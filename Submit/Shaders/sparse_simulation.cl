@@ -0,0 +1,247 @@
+// Sparse volume kernels, built on top of 3d_simulation.cl. The volume is cut into bricks of BRICK_SIZE^3 voxels,
+// a page table holds one entry per brick of the domain: the slot of the brick in the pool, or one of the markers
+// below. Free slots are kept on a stack and are always all zero, bricks are freed once they decay to zero.
+
+#define BRICK_SIZE 8
+#define BRICK_VOLUME (BRICK_SIZE * BRICK_SIZE * BRICK_SIZE)
+
+// Page table markers, every entry at or above BRICK_RESERVED is one of them
+#define BRICK_RESERVED 0xFFFFFFFCu
+#define BRICK_ALLOCATING 0xFFFFFFFCu  // A spore is taking a slot for the brick right now
+#define BRICK_REQUESTED 0xFFFFFFFDu   // Spilled to the host and asked back for
+#define BRICK_SPILLED 0xFFFFFFFEu     // Spilled to the host, reads as empty until it's restored
+#define BRICK_EMPTY 0xFFFFFFFFu       // All zero, nothing stored anywhere
+
+// Layout of the status buffer
+#define STATUS_FREE_COUNT 0
+#define STATUS_OVERFLOWS 1
+#define STATUS_REQUESTS 2
+
+uint get_brick(uint3 voxel, uint bricks_per_axis);
+uint get_brick_offset(uint3 voxel);
+void request_brick(__global uint* page_table, uint brick, __global int* status, __global uint* requests,
+                   uint request_capacity);
+float sparse_sense(__global Spore* spore, __global uint* page_table, __global const float* pool,
+                   __global const Settings* settings, uint bricks_per_axis, __global int* status,
+                   __global uint* requests, uint request_capacity, float3 direction, float3 forward);
+
+uint get_brick(uint3 voxel, uint bricks_per_axis) {
+    uint3 brick = voxel / BRICK_SIZE;
+    return (brick.z * bricks_per_axis + brick.y) * bricks_per_axis + brick.x;
+}
+
+uint get_brick_offset(uint3 voxel) {
+    uint3 local_voxel = voxel % BRICK_SIZE;
+    return (local_voxel.z * BRICK_SIZE + local_voxel.y) * BRICK_SIZE + local_voxel.x;
+}
+
+// Asks the host to bring a spilled brick back, only the first asker appends it to the requests
+void request_brick(__global uint* page_table, uint brick, __global int* status, __global uint* requests,
+                   uint request_capacity) {
+    if (atomic_cmpxchg(&page_table[brick], BRICK_SPILLED, BRICK_REQUESTED) != BRICK_SPILLED) {
+        return;
+    }
+
+    uint slot = (uint)atomic_inc(&status[STATUS_REQUESTS]);
+    if (slot < request_capacity) {
+        requests[slot] = brick;
+    } else {
+        // No room, it's asked for again the next time it's sensed
+        page_table[brick] = BRICK_SPILLED;
+    }
+}
+
+// sense() through the page table, bricks that aren't on the device read as empty
+float sparse_sense(__global Spore* spore, __global uint* page_table, __global const float* pool,
+                   __global const Settings* settings, uint bricks_per_axis, __global int* status,
+                   __global uint* requests, uint request_capacity, float3 direction, float3 forward) {
+    uint3 voxel = sensor_voxel(spore, settings, settings->sensor_distance, direction, forward);
+    uint brick = get_brick(voxel, bricks_per_axis);
+    uint slot = page_table[brick];
+
+    if (slot >= BRICK_RESERVED) {
+        if (slot == BRICK_SPILLED) {
+            request_brick(page_table, brick, status, requests, request_capacity);
+        }
+        return 0.0f;
+    }
+    return pool[slot * BRICK_VOLUME + get_brick_offset(voxel)];
+}
+
+// Gives every empty brick a spore is in a slot off the free stack, so sparse_draw_spores never loses a deposit.
+// One spore per brick wins the page table entry, when the stack is empty the brick stays empty and is counted.
+__kernel void sparse_allocate_bricks(__global const Spore* spores, __global const Settings* settings,
+                                     __global uint* page_table, const uint bricks_per_axis,
+                                     __global uint* slot_bricks, __global const uint* free_slots,
+                                     __global int* status, __global uint* requests, const uint request_capacity) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    uint3 voxel = convert_uint3(spores[idx].position);
+    if (any(voxel >= (uint3)(settings->simulation_size))) {
+        return;
+    }
+
+    uint brick = get_brick(voxel, bricks_per_axis);
+    uint slot = page_table[brick];
+    if (slot == BRICK_SPILLED) {
+        request_brick(page_table, brick, status, requests, request_capacity);
+    }
+    if (slot != BRICK_EMPTY || atomic_cmpxchg(&page_table[brick], BRICK_EMPTY, BRICK_ALLOCATING) != BRICK_EMPTY) {
+        return;
+    }
+
+    int top = atomic_dec(&status[STATUS_FREE_COUNT]);
+    if (top <= 0) {
+        atomic_inc(&status[STATUS_FREE_COUNT]);
+        atomic_inc(&status[STATUS_OVERFLOWS]);
+        atomic_xchg(&page_table[brick], BRICK_EMPTY);
+        return;
+    }
+
+    slot = free_slots[top - 1];
+    slot_bricks[slot] = brick;
+    atomic_xchg(&page_table[brick], slot);
+}
+
+// draw_spores through the page table, stamps the bricks with the step so the host can tell the cold ones
+__kernel void sparse_draw_spores(__global const Spore* spores, __global const Settings* settings,
+                                 __global const uint* page_table, const uint bricks_per_axis, __global float* pool,
+                                 __global uint* brick_stamps, const uint step) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    uint3 voxel = convert_uint3(spores[idx].position);
+    if (any(voxel >= (uint3)(settings->simulation_size))) {
+        return;
+    }
+
+    uint slot = page_table[get_brick(voxel, bricks_per_axis)];
+    if (slot < BRICK_RESERVED) {
+        pool[slot * BRICK_VOLUME + get_brick_offset(voxel)] = 1.0f;
+        brick_stamps[slot] = step;
+    }
+}
+
+// move_spores with the sensors read through the page table
+__kernel void sparse_move_spores(__global Spore* spores, __global uint* random_seeds, __global const Settings* settings,
+                                 __global uint* page_table, const uint bricks_per_axis, __global const float* pool,
+                                 __global int* status, __global uint* requests, const uint request_capacity,
+                                 const float delta_time) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    __global Spore* spore = &spores[idx];
+    float3 sporeDirection = spore->direction;
+    float3 rightVector, upVector;
+    get_sensor_axes(sporeDirection, &rightVector, &upVector);
+
+    float forwardWeight = sparse_sense(spore, page_table, pool, settings, bricks_per_axis, status, requests,
+                                       request_capacity, sporeDirection, sporeDirection);
+    float rightWeight = sparse_sense(spore, page_table, pool, settings, bricks_per_axis, status, requests,
+                                     request_capacity, rightVector, sporeDirection);
+    float leftWeight = sparse_sense(spore, page_table, pool, settings, bricks_per_axis, status, requests,
+                                    request_capacity, -rightVector, sporeDirection);
+    float upWeight = sparse_sense(spore, page_table, pool, settings, bricks_per_axis, status, requests,
+                                  request_capacity, upVector, sporeDirection);
+    float downWeight = sparse_sense(spore, page_table, pool, settings, bricks_per_axis, status, requests,
+                                    request_capacity, -upVector, sporeDirection);
+
+    steer_spore(spore, forwardWeight, rightWeight, leftWeight, upWeight, downWeight, rightVector, upVector,
+                random_seeds, idx, settings, settings->spore_speed, delta_time);
+}
+
+// Decays the bricks in use, one work-group per pool slot. Bricks that reach zero go back onto the free stack.
+__kernel void sparse_decay_trails(__global float* pool, __global uint* page_table, __global uint* slot_bricks,
+                                  __global uint* free_slots, __global int* status, __global const Settings* settings,
+                                  const float delta_time, __local int* alive) {
+    uint slot = (uint)get_group_id(0);
+    uint lid = (uint)get_local_id(0);
+    uint brick = slot_bricks[slot];
+
+    // Every work-item reaches the barriers, free slots just have no voxels to decay
+    if (lid == 0) {
+        *alive = 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    __global float* voxels = pool + slot * BRICK_VOLUME;
+    uint voxel_count = brick == BRICK_EMPTY ? 0 : BRICK_VOLUME;
+    for (uint i = lid; i < voxel_count; i += (uint)get_local_size(0)) {
+        float value = max(0.0f, voxels[i] - settings->decay_speed * delta_time);
+        voxels[i] = value;
+        if (value > 0.0f) {
+            *alive = 1;
+        }
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    // The brick is all zero already, which is what a free slot has to be
+    if (lid == 0 && brick != BRICK_EMPTY && *alive == 0) {
+        page_table[brick] = BRICK_EMPTY;
+        slot_bricks[slot] = BRICK_EMPTY;
+        free_slots[atomic_inc(&status[STATUS_FREE_COUNT])] = slot;
+    }
+}
+
+// Copies the listed slots out for the host, marks their bricks spilled and frees the slots, one work-group per slot
+__kernel void sparse_spill_bricks(__global float* pool, __global uint* page_table, __global uint* slot_bricks,
+                                  __global uint* free_slots, __global int* status, __global const uint* slots,
+                                  __global float* spilled) {
+    uint i = (uint)get_group_id(0);
+    uint lid = (uint)get_local_id(0);
+    uint slot = slots[i];
+
+    __global float* voxels = pool + slot * BRICK_VOLUME;
+    for (uint v = lid; v < BRICK_VOLUME; v += (uint)get_local_size(0)) {
+        spilled[i * BRICK_VOLUME + v] = voxels[v];
+        voxels[v] = 0.0f;
+    }
+
+    if (lid == 0) {
+        page_table[slot_bricks[slot]] = BRICK_SPILLED;
+        slot_bricks[slot] = BRICK_EMPTY;
+        free_slots[atomic_inc(&status[STATUS_FREE_COUNT])] = slot;
+    }
+}
+
+// Puts the listed bricks back into slots off the free stack, the host checks there are enough first
+__kernel void sparse_restore_bricks(__global float* pool, __global uint* page_table, __global uint* slot_bricks,
+                                    __global const uint* free_slots, __global int* status,
+                                    __global uint* brick_stamps, __global const uint* bricks,
+                                    __global const float* restored, const uint step, __local uint* slot) {
+    uint i = (uint)get_group_id(0);
+    uint lid = (uint)get_local_id(0);
+
+    if (lid == 0) {
+        *slot = free_slots[atomic_dec(&status[STATUS_FREE_COUNT]) - 1];
+        slot_bricks[*slot] = bricks[i];
+        page_table[bricks[i]] = *slot;
+        brick_stamps[*slot] = step;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    __global float* voxels = pool + *slot * BRICK_VOLUME;
+    for (uint v = lid; v < BRICK_VOLUME; v += (uint)get_local_size(0)) {
+        voxels[v] = restored[i * BRICK_VOLUME + v];
+    }
+}
+
+// Sets the page table entries of the listed bricks, for spilled bricks that decayed away on the host
+__kernel void sparse_set_pages(__global uint* page_table, __global const uint* bricks, const uint count,
+                               const uint value) {
+    uint i = (uint)get_global_id(0);
+
+    if (i < count) {
+        page_table[bricks[i]] = value;
+    }
+}
@@ -0,0 +1,106 @@
+// Multi-species kernels, built on top of 3d_simulation.cl with SPECIES_COUNT defined, which gives every spore its
+// species. The trails of the species are interleaved, voxel index * SPECIES_COUNT + species, so a sensor reads all
+// of them from one spot. The single channel volume the culling, projections and metrics read is kept as the strongest
+// channel of each voxel.
+
+// Settings of one species, matches SPECIES_SETTINGS_DTYPE in simulation_data.py
+typedef struct {
+    float spore_speed;
+    float decay_speed;
+    float turn_speed;
+    float sensor_distance;
+    float repulsion;  // Weight of the other species' trails against the own one, they push the spore away
+    float pad[3];
+} SpeciesSettings;
+
+float species_sense(__global Spore* spore, __global const float* channels, __global const Settings* settings,
+                    __constant SpeciesSettings* species, float3 direction, float3 forward);
+
+// sense() on the spore's own channel, minus the other species' channels weighted by its repulsion
+float species_sense(__global Spore* spore, __global const float* channels, __global const Settings* settings,
+                    __constant SpeciesSettings* species, float3 direction, float3 forward) {
+    uint3 voxel = sensor_voxel(spore, settings, species->sensor_distance, direction, forward);
+    uint size = settings->simulation_size;
+    __global const float* voxel_channels = channels + ((voxel.z * size + voxel.y) * size + voxel.x) * SPECIES_COUNT;
+
+    float total = 0.0f;
+    for (uint s = 0; s < SPECIES_COUNT; s++) {
+        total += voxel_channels[s];
+    }
+    float own = voxel_channels[spore->species];
+    return own - species->repulsion * (total - own);
+}
+
+// draw_spores into the spore's own channel and the combined volume
+__kernel void species_draw_spores(__global float* volume, __global Spore* spores, __global const Settings* settings,
+                                  __global float* channels) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    __global const Spore* spore = &spores[idx];
+    uint x = (int)(spore->position.x);
+    uint y = (int)(spore->position.y);
+    uint z = (int)(spore->position.z);
+    uint size = settings->simulation_size;
+
+    if (x < size && y < size && z < size) {
+        uint volume_idx = (z * size + y) * size + x;
+        volume[volume_idx] = 1.0f;
+        channels[volume_idx * SPECIES_COUNT + spore->species] = 1.0f;
+    }
+}
+
+// move_spores with every spore sensing and steering by its own species' settings, all species in one launch
+__kernel void species_move_spores(__global Spore* spores, __global const float* channels,
+                                  __global uint* random_seeds, __global const Settings* settings,
+                                  const float delta_time, __global uint* metric_counters,
+                                  __constant SpeciesSettings* species_settings) {
+    uint idx = (uint)get_global_id(0);
+
+    if (idx >= settings->spore_count) {
+        return;
+    }
+
+    __global Spore* spore = &spores[idx];
+    __constant SpeciesSettings* species = &species_settings[spore->species];
+    float3 sporeDirection = spore->direction;
+    float3 rightVector, upVector;
+    get_sensor_axes(sporeDirection, &rightVector, &upVector);
+
+    float forwardWeight = species_sense(spore, channels, settings, species, sporeDirection, sporeDirection);
+    float rightWeight = species_sense(spore, channels, settings, species, rightVector, sporeDirection);
+    float leftWeight = species_sense(spore, channels, settings, species, -rightVector, sporeDirection);
+    float upWeight = species_sense(spore, channels, settings, species, upVector, sporeDirection);
+    float downWeight = species_sense(spore, channels, settings, species, -upVector, sporeDirection);
+
+    if (steer_spore(spore, forwardWeight, rightWeight, leftWeight, upWeight, downWeight, rightVector, upVector,
+                    random_seeds, idx, settings, species->spore_speed, delta_time)) {
+        atomic_inc(&metric_counters[METRIC_BOUNCES]);
+    }
+}
+
+// Decays every channel of a voxel by its species' decay speed in one pass, and sets the combined volume to the
+// strongest of them
+__kernel void species_decay_trails(__global float* volume, __global const Settings* settings, const float delta_time,
+                                   __global float* channels, __constant SpeciesSettings* species_settings) {
+    uint x = (uint)get_global_id(0);
+    uint y = (uint)get_global_id(1);
+    uint z = (uint)get_global_id(2);
+    uint size = settings->simulation_size;
+
+    if (x < size && y < size && z < size) {
+        uint idx = (z * size + y) * size + x;
+        __global float* voxel_channels = channels + idx * SPECIES_COUNT;
+
+        float strongest = 0.0f;
+        for (uint s = 0; s < SPECIES_COUNT; s++) {
+            float value = max(0.0f, voxel_channels[s] - species_settings[s].decay_speed * delta_time);
+            voxel_channels[s] = value;
+            strongest = max(strongest, value);
+        }
+        volume[idx] = strongest;
+    }
+}
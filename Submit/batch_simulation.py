@@ -0,0 +1,157 @@
+import itertools
+import time
+
+import numpy as np
+import pyopencl as cl
+
+from game_engine import GameEngine
+from kernel_launcher import KernelLauncher
+from work_group_tuner import WorkGroupTuner
+from simulation_data import BATCH_SPORE_DTYPE, SETTINGS_DTYPE, get_random_spores
+
+
+class BatchSimulation3D:
+    """Runs many independent 3D simulations packed into one set of buffers, each kernel launch advances all of them"""
+
+    def __init__(self, parameter_sets, simulation_size=50, spore_count=1000):
+        self.parameter_sets = parameter_sets
+        self.batch_count = len(parameter_sets)
+        self.simulation_size = simulation_size
+        self.spore_count = spore_count
+        self.total_spore_count = self.batch_count * self.spore_count
+
+        # One context and one build for the whole batch
+        self.cl_context, self.cl_queue = GameEngine.initialize_opencl()
+        source = GameEngine.load_file("Shaders/3d_simulation.cl") + GameEngine.load_file("Shaders/batch_simulation.cl")
+        self.program = cl.Program(self.cl_context, source).build()
+
+        # Settings Buffer, one Settings struct per simulation
+        self.settings = self.create_settings()
+        self.settings_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR,
+                                         hostbuf=self.settings)
+
+        # Spores Buffer, every spore tagged with its simulation
+        self.spores = self.initialize_spores()
+        self.spores_buffer = self.initialize_buffer(self.spores)
+
+        # Random Seeds buffer
+        self.random_seeds = np.random.randint(0, 2 ** 32 - 1, size=self.total_spore_count + 1, dtype=np.uint32)
+        self.random_seeds_buffer = self.initialize_buffer(self.random_seeds)
+
+        # Volume Buffer, the simulations' volumes stored back to back and zeroed on the device, the host copy is
+        # only read back into
+        self.volume_data = np.empty((self.batch_count, self.simulation_size, self.simulation_size,
+                                     self.simulation_size), dtype=np.float32)
+        self.volume_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=self.volume_data.nbytes)
+        cl.enqueue_fill_buffer(self.cl_queue, self.volume_buffer, np.float32(0), 0, self.volume_data.nbytes)
+
+        # Kernel launchers, only delta_time changes between steps
+        stacked_shape = (self.simulation_size, self.simulation_size, self.simulation_size * self.batch_count)
+        self.decay_trails_launcher = KernelLauncher(self.cl_queue, self.program, "batch_decay_trails", stacked_shape)
+        self.decay_trails_launcher.set_args(self.volume_buffer, self.settings_buffer, np.uint32(self.batch_count),
+                                            np.float32(0))
+
+        self.draw_spores_launcher = KernelLauncher(self.cl_queue, self.program, "batch_draw_spores",
+                                                   (self.total_spore_count,))
+        self.draw_spores_launcher.set_args(self.volume_buffer, self.spores_buffer, self.settings_buffer,
+                                           np.uint32(self.total_spore_count))
+
+        self.move_spores_launcher = KernelLauncher(self.cl_queue, self.program, "batch_move_spores",
+                                                   (self.total_spore_count,))
+        self.move_spores_launcher.set_args(self.spores_buffer, self.volume_buffer, self.random_seeds_buffer,
+                                           self.settings_buffer, np.uint32(self.total_spore_count), np.float32(0))
+
+        # Tuned work-group shapes, the benchmark runs leave the buffers as they were
+        self.work_group_tuner = WorkGroupTuner(self.cl_queue)
+        for launcher in (self.decay_trails_launcher, self.draw_spores_launcher, self.move_spores_launcher):
+            self.work_group_tuner.apply(launcher, (self.volume_buffer, self.spores_buffer, self.random_seeds_buffer))
+
+        self.steps = 0
+
+    @classmethod
+    def from_grid(cls, simulation_size=50, spore_count=1000, **parameter_ranges):
+        """Creates a batch with one simulation for every combination of the given parameter values"""
+        names = list(parameter_ranges)
+        parameter_sets = [dict(zip(names, values)) for values in itertools.product(*parameter_ranges.values())]
+        return cls(parameter_sets, simulation_size, spore_count)
+
+    def initialize_buffer(self, data):
+        return cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=data)
+
+    def create_settings(self):
+        """Settings for every simulation, parameters not in a set fall back to the Simulation3D defaults"""
+        settings = np.zeros(self.batch_count, dtype=SETTINGS_DTYPE)
+        settings['spore_count'] = self.spore_count
+        settings['simulation_size'] = self.simulation_size
+
+        for i, parameters in enumerate(self.parameter_sets):
+            settings[i]['spore_speed'] = parameters.get('spore_speed', 17)
+            settings[i]['decay_speed'] = parameters.get('decay_speed', 0.4)
+            settings[i]['turn_speed'] = parameters.get('turn_speed', 11)
+            settings[i]['sensor_distance'] = parameters.get('sensor_distance', 14)
+        return settings
+
+    def initialize_spores(self):
+        """Random spores for every simulation, in contiguous runs per simulation"""
+        spores = np.zeros(self.total_spore_count, dtype=BATCH_SPORE_DTYPE)
+        spores['spore'] = get_random_spores(self.total_spore_count, self.simulation_size)
+        spores['batch_id'] = np.repeat(np.arange(self.batch_count, dtype=np.uint32), self.spore_count)
+        return spores
+
+    def step(self, delta_time):
+        """Advances every simulation by one step"""
+        delta_time = np.float32(delta_time)
+
+        self.decay_trails_launcher.set_arg(3, delta_time)
+        self.decay_trails_launcher()
+
+        self.draw_spores_launcher()
+
+        self.move_spores_launcher.set_arg(5, delta_time)
+        self.move_spores_launcher()
+
+        self.steps += 1
+
+    def run(self, steps, delta_time=1 / 30):
+        """Runs every simulation for the number of steps, returns the metrics of each"""
+        for _ in range(steps):
+            self.step(delta_time)
+        self.cl_queue.finish()
+        return self.get_metrics()
+
+    def get_metrics(self):
+        """Reads the batch back once and reduces it into per simulation metrics"""
+        cl.enqueue_copy(self.cl_queue, self.volume_data, self.volume_buffer)
+        cl.enqueue_copy(self.cl_queue, self.spores, self.spores_buffer).wait()
+
+        volumes = self.volume_data.reshape(self.batch_count, -1)
+        positions = np.stack([self.spores['spore']['x'], self.spores['spore']['y'], self.spores['spore']['z']], axis=1)
+        positions = positions.reshape(self.batch_count, self.spore_count, 3)
+
+        metrics = []
+        for i, parameters in enumerate(self.parameter_sets):
+            metrics.append({
+                **parameters,
+                'trail_mass': float(volumes[i].sum()),
+                'occupancy': float(np.count_nonzero(volumes[i]) / volumes[i].size),
+                'spread': float(positions[i].std(axis=0).mean()),
+            })
+        return metrics
+
+    @staticmethod
+    def print_metrics(metrics):
+        """Prints the metrics as a table"""
+        columns = list(metrics[0])
+        print(" ".join(f"{column:>16}" for column in columns))
+        for row in metrics:
+            print(" ".join(f"{row[column]:>16.4f}" for column in columns))
+
+
+if __name__ == '__main__':
+    batch = BatchSimulation3D.from_grid(simulation_size=40, spore_count=2000,
+                                        spore_speed=[10, 17, 25], decay_speed=[0.2, 0.4],
+                                        sensor_distance=[8, 14], turn_speed=[11])
+    start = time.perf_counter()
+    results = batch.run(300)
+    print(f"{batch.batch_count} simulations, {batch.steps} steps in {time.perf_counter() - start:.2f}s")
+    BatchSimulation3D.print_metrics(results)
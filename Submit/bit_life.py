@@ -0,0 +1,134 @@
+import numpy as np
+import pyopencl as cl
+
+from game_engine import GameEngine
+from kernel_launcher import KernelLauncher
+from life_engine import LifeEngine
+
+# The kernel's halo is one 32 cell word wide, so that many generations fit in a launch
+MAX_GENERATIONS_PER_LAUNCH = 32
+
+
+class BitLife(LifeEngine):
+    """
+    Game of Life on the device with one bit per cell, 32 cells to a uint word.
+
+    Each launch of step_life advances generations_per_launch generations inside local memory tiles, the boards
+    ping-pong between two buffers and nothing is read back while stepping. Images are expanded on the device, so only
+    the viewport's pixels cross the bus.
+    """
+
+    def __init__(self, cl_context, cl_queue, width, height, generations_per_launch=8, program=None):
+        super().__init__()
+        if width % 32:
+            raise ValueError("The board width must be a multiple of 32")
+        if not 1 <= generations_per_launch <= MAX_GENERATIONS_PER_LAUNCH:
+            raise ValueError(f"Between 1 and {MAX_GENERATIONS_PER_LAUNCH} generations fit in a launch")
+
+        self.cl_context = cl_context
+        self.cl_queue = cl_queue
+        self.width = width
+        self.height = height
+        self.words_per_row = width // 32
+        self.generations_per_launch = generations_per_launch
+        self.program = program or cl.Program(cl_context, GameEngine.load_file("Shaders/bit_game_of_life.cl")).build()
+
+        # Ping-pong boards
+        board_bytes = self.words_per_row * height * 4
+        self.board_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=board_bytes)
+        self.next_board_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=board_bytes)
+        cl.enqueue_fill_buffer(cl_queue, self.board_buffer, np.uint32(0), 0, board_bytes)
+
+        # Tiles of 8 words by as many rows as the device's work-groups and local memory allow
+        device = cl_queue.device
+        self.tile_words = 8
+        self.tile_rows = 32
+        while self.tile_rows > 1 and (self.tile_words * self.tile_rows > device.max_work_group_size or
+                                      self.get_local_bytes(MAX_GENERATIONS_PER_LAUNCH) > device.local_mem_size):
+            self.tile_rows //= 2
+
+        self.step_launcher = KernelLauncher(cl_queue, self.program, "step_life", (self.words_per_row, height),
+                                            (self.tile_words, self.tile_rows))
+        self.population = np.zeros(1, dtype=np.uint32)
+        self.population_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.population.nbytes)
+        self.population_launcher = KernelLauncher(cl_queue, self.program, "count_population",
+                                                  (min(self.words_per_row * height, device.max_compute_units * 1024),))
+        self.population_launcher.set_args(None, np.uint32(self.words_per_row * height), self.population_buffer)
+        self.render_launcher = KernelLauncher(cl_queue, self.program, "render_life", (1, 1))
+        self.image_buffer = None
+
+    def get_local_bytes(self, generations):
+        """Local memory of the two tiles of a launch"""
+        return 2 * (self.tile_words + 2) * (self.tile_rows + 2 * generations) * 4
+
+    def randomize(self, density=0.5, seed=None):
+        """Fills the board with live cells at the given density"""
+        random = np.random.default_rng(seed)
+        cells = random.random((self.height, self.width), dtype=np.float32) < density
+        self.set_cells(cells)
+
+    def set_cells(self, cells, x=0, y=0):
+        cells = np.asarray(cells, dtype=bool)
+        height, width = cells.shape
+        if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError("The cells don't fit on the board")
+
+        # Whole rows are read back so the words the cells only partly cover keep their other cells
+        rows = self.read_rows(y, height)
+        unpacked = np.unpackbits(rows.view(np.uint8), axis=1, bitorder="little")
+        unpacked[:, x:x + width] = cells
+        rows = np.packbits(unpacked, axis=1, bitorder="little").view(np.uint32)
+        cl.enqueue_copy(self.cl_queue, self.board_buffer, np.ascontiguousarray(rows),
+                        dst_offset=y * self.words_per_row * 4)
+
+    def read_rows(self, y, height):
+        rows = np.empty((height, self.words_per_row), dtype=np.uint32)
+        if height:
+            cl.enqueue_copy(self.cl_queue, rows, self.board_buffer, src_offset=y * self.words_per_row * 4).wait()
+        return rows
+
+    def get_cells(self, x, y, width, height):
+        cells = np.zeros((height, width), dtype=bool)
+
+        # Only the part of the region that's on the board is read
+        top, bottom = max(y, 0), min(y + height, self.height)
+        left, right = max(x, 0), min(x + width, self.width)
+        if top < bottom and left < right:
+            rows = self.read_rows(top, bottom - top)
+            unpacked = np.unpackbits(rows.view(np.uint8), axis=1, bitorder="little").astype(bool)
+            cells[top - y:bottom - y, left - x:right - x] = unpacked[:, left:right]
+        return cells
+
+    def step(self, generations):
+        """Enqueues the launches, nothing waits for them until something is read back"""
+        while generations > 0:
+            launch_generations = min(generations, self.generations_per_launch)
+            local_bytes = self.get_local_bytes(launch_generations) // 2
+            self.step_launcher.set_args(self.board_buffer, self.next_board_buffer, np.uint32(self.words_per_row),
+                                        np.uint32(self.height), np.uint32(launch_generations),
+                                        cl.LocalMemory(local_bytes), cl.LocalMemory(local_bytes))
+            self.step_launcher()
+
+            self.board_buffer, self.next_board_buffer = self.next_board_buffer, self.board_buffer
+            self.generation += launch_generations
+            generations -= launch_generations
+
+    def get_population(self):
+        cl.enqueue_fill_buffer(self.cl_queue, self.population_buffer, np.uint32(0), 0, self.population.nbytes)
+        self.population_launcher.set_arg(0, self.board_buffer)
+        self.population_launcher()
+        cl.enqueue_copy(self.cl_queue, self.population, self.population_buffer).wait()
+        return int(self.population[0])
+
+    def get_image(self, x, y, scale, image_width, image_height):
+        image = np.empty((image_height, image_width, 4), dtype=np.uint8)
+        if self.image_buffer is None or self.image_buffer.size != image.nbytes:
+            self.image_buffer = cl.Buffer(self.cl_context, cl.mem_flags.WRITE_ONLY, size=image.nbytes)
+
+        self.render_launcher.set_args(self.board_buffer, np.uint32(self.words_per_row), np.uint32(self.height),
+                                      np.float32(x), np.float32(y), np.float32(scale), np.uint32(image_width),
+                                      np.uint32(image_height), self.image_buffer)
+        self.render_launcher.set_global_size((image_width, image_height))
+        self.render_launcher()
+        cl.enqueue_copy(self.cl_queue, image, self.image_buffer).wait()
+        return image
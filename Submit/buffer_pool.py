@@ -0,0 +1,40 @@
+import pyopencl as cl
+
+
+class BufferPool:
+    """
+    Keeps released device buffers so later allocations can reuse them instead of allocating again.
+
+    A released buffer is handed out again for any request it can hold without wasting more than half of itself,
+    the oldest free buffers are dropped once more than max_free_bytes are kept.
+    """
+
+    def __init__(self, cl_context, max_free_bytes=1 << 30):
+        self.cl_context = cl_context
+        self.max_free_bytes = max_free_bytes
+        self.free_buffers = []
+
+    def get_free_bytes(self):
+        return sum(buffer.size for buffer in self.free_buffers)
+
+    def acquire(self, size):
+        """Buffer of at least size bytes, reused from the pool when a fitting one is free"""
+        fitting = [buffer for buffer in self.free_buffers if size <= buffer.size <= size * 2]
+        if fitting:
+            buffer = min(fitting, key=lambda free_buffer: free_buffer.size)
+            self.free_buffers.remove(buffer)
+            return buffer
+
+        return cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=max(size, 1))
+
+    def release(self, buffer):
+        """Returns a buffer to the pool, the caller must not use it afterwards"""
+        self.free_buffers.append(buffer)
+
+        while self.free_buffers and self.get_free_bytes() > self.max_free_bytes:
+            self.free_buffers.pop(0).release()
+
+    def clear(self):
+        for buffer in self.free_buffers:
+            buffer.release()
+        self.free_buffers = []
@@ -1,6 +1,6 @@
 import glm
 import math
-import glfw
+import numpy as np
 
 class CameraHandler3D:
     def __init__(self, camera_yaw, camera_pitch, look_at, camera_distance, camera_speed, window):
@@ -15,10 +15,18 @@ class CameraHandler3D:
 
         self.view = self.get_current_view()
 
+        # Scripted path of (time, yaw, pitch, distance) keyframes, the arrow keys steer while there is none
+        self.camera_path = None
+        self.path_time = 0.0
+
+        # Only a window has keys to steer with, headless cameras never import glfw
         if window:
+            import glfw
             glfw.set_key_callback(window, self.key_callback)
 
     def key_callback(self, window, key, scancode, action, mods):
+        import glfw
+
         # Adjust the camera's yaw and pitch based on arrow key input
         if action == glfw.PRESS or action == glfw.REPEAT:
             if key == glfw.KEY_UP:
@@ -32,6 +40,39 @@ class CameraHandler3D:
         else:
             self.camera_delta *= 0
 
+    def set_target(self, look_at, camera_distance):
+        """Points the camera at a new target from a new distance, keeping its angles"""
+        self.look_at = look_at
+        self.camera_distance = camera_distance
+        self.view = self.get_current_view()
+
+    def set_path(self, keyframes):
+        """Flies the camera through (time, yaw, pitch, distance) keyframes from the first one, None ends the path"""
+        self.camera_path = keyframes
+        self.path_time = 0.0
+        if keyframes:
+            self.follow_path(0.0)
+
+    def get_orbit_path(self, duration, turns=1):
+        """Keyframes circling the target turns times in duration seconds, from the current angle and distance"""
+        return [(0.0, self.camera_yaw, self.camera_pitch, self.camera_distance),
+                (duration, self.camera_yaw + 360.0 * turns, self.camera_pitch, self.camera_distance)]
+
+    def get_path_duration(self):
+        return self.camera_path[-1][0] if self.camera_path else 0.0
+
+    def follow_path(self, delta_time):
+        """
+        Places the camera at the current time of the path, then moves the time on by delta_time, so the first frame
+        shows the first keyframe. Keyframes are interpolated linearly and the last one is held.
+        """
+        times, yaws, pitches, distances = zip(*self.camera_path)
+        self.camera_yaw = float(np.interp(self.path_time, times, yaws))
+        self.camera_pitch = float(np.interp(self.path_time, times, pitches))
+        self.camera_distance = float(np.interp(self.path_time, times, distances))
+        self.view = self.get_current_view()
+        self.path_time += delta_time
+
     def get_current_view(self):
         # Recalculate the camera front vector
         front = glm.vec3(
@@ -47,6 +88,10 @@ class CameraHandler3D:
         return view
 
     def update_view(self, delta_time):
+        if self.camera_path:
+            self.follow_path(delta_time)
+            return
+
         if self.camera_delta == [0, 0]:  # return if zero
             return
 
@@ -0,0 +1,209 @@
+import numpy as np
+import pyopencl as cl
+
+from game_engine import GameEngine
+from kernel_launcher import KernelLauncher
+
+# Must match the defines in Shaders/connected_components.cl
+BACKGROUND = 0xFFFFFFFF
+STAT_COUNT = 8
+BRICK_STRIDE = 6
+
+
+class ConnectedComponents:
+    """
+    Labels the connected trail regions of a volume buffer on the device.
+
+    Labels are merged by propagating the smallest root between neighbors and pointer jumping until nothing changes,
+    only the component statistics and the optional brick graph are read back, never the labels.
+    """
+
+    def __init__(self, cl_context, cl_queue, buffer_pool=None, threshold=0.05):
+        self.cl_context = cl_context
+        self.cl_queue = cl_queue
+        self.buffer_pool = buffer_pool
+        self.threshold = threshold
+        self.program = cl.Program(cl_context, GameEngine.load_file("Shaders/connected_components.cl")).build()
+
+        self.changed = np.zeros(1, dtype=np.uint32)
+        self.changed_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.changed.nbytes)
+        self.component_count = np.zeros(1, dtype=np.uint32)
+        self.component_count_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.component_count.nbytes)
+
+        self.launchers = {name: KernelLauncher(cl_queue, self.program, name, (1,))
+                          for name in ("initialize_labels", "propagate_labels", "flatten_labels", "number_components",
+                                       "component_statistics", "brick_graph")}
+
+        self.simulation_size = 0
+        self.labels_buffer = None
+        self.component_ids_buffer = None
+        self.order = None
+        self.iterations = 0
+
+    def acquire(self, size):
+        if self.buffer_pool:
+            return self.buffer_pool.acquire(size)
+        return cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=size)
+
+    def release(self):
+        """Gives the label buffers back, call once done with a labelling"""
+        for buffer in (self.labels_buffer, self.component_ids_buffer):
+            if buffer is not None and self.buffer_pool:
+                self.buffer_pool.release(buffer)
+        self.labels_buffer = self.component_ids_buffer = None
+
+    def launch(self, name, global_size, *args):
+        launcher = self.launchers[name]
+        launcher.set_args(*args)
+        launcher.set_global_size(global_size)
+        return launcher()
+
+    def label(self, volume_buffer, simulation_size):
+        """Labels the voxels above the threshold, returns the component statistics"""
+        self.release()
+        size = np.uint32(simulation_size)
+        voxel_count = simulation_size ** 3
+        volume_shape = (simulation_size, simulation_size, simulation_size)
+
+        self.simulation_size = simulation_size
+        self.labels_buffer = self.acquire(voxel_count * 4)
+        self.component_ids_buffer = self.acquire(voxel_count * 4)
+
+        self.launch("initialize_labels", (voxel_count,), volume_buffer, np.uint32(voxel_count),
+                    np.float32(self.threshold), self.labels_buffer)
+
+        # Merge until a pass changes nothing, that takes about log of the longest path passes
+        self.iterations = 0
+        while True:
+            cl.enqueue_fill_buffer(self.cl_queue, self.changed_buffer, np.uint32(0), 0, self.changed.nbytes)
+            self.launch("propagate_labels", volume_shape, self.labels_buffer, size, self.changed_buffer)
+            self.launch("flatten_labels", (voxel_count,), self.labels_buffer, np.uint32(voxel_count))
+            cl.enqueue_copy(self.cl_queue, self.changed, self.changed_buffer).wait()
+            self.iterations += 1
+            if not self.changed[0]:
+                break
+
+        cl.enqueue_fill_buffer(self.cl_queue, self.component_count_buffer, np.uint32(0), 0,
+                               self.component_count.nbytes)
+        self.launch("number_components", (voxel_count,), self.labels_buffer, np.uint32(voxel_count),
+                    self.component_ids_buffer, self.component_count_buffer)
+        cl.enqueue_copy(self.cl_queue, self.component_count, self.component_count_buffer).wait()
+        component_count = int(self.component_count[0])
+
+        statistics = np.zeros((component_count, STAT_COUNT), dtype=np.uint32)
+        statistics[:, 1:4] = BACKGROUND
+        if component_count:
+            statistics_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
+                                          hostbuf=statistics)
+            self.launch("component_statistics", (voxel_count,), self.labels_buffer, size, self.component_ids_buffer,
+                        statistics_buffer)
+            cl.enqueue_copy(self.cl_queue, statistics, statistics_buffer).wait()
+
+        # Ids are handed out in whatever order the device ran, sort by root so the order is the same every run
+        self.order = np.argsort(statistics[:, 7], kind="stable")
+        statistics = statistics[self.order]
+
+        return {
+            "sizes": statistics[:, 0].astype(np.int64),
+            "bounding_box_min": statistics[:, 1:4].astype(np.int64),
+            "bounding_box_max": statistics[:, 4:7].astype(np.int64),
+            "roots": statistics[:, 7].astype(np.int64),
+        }
+
+    def get_skeleton_graph(self, brick_size=4):
+        """
+        Coarse node/edge graph of the last labelling. Bricks of brick_size voxels touched by a component become
+        nodes at their voxels' centroid, linked where foreground voxels touch across faces. Chains of bricks with two
+        links are then collapsed, leaving junctions and endpoints joined by edges with the chain's length.
+        """
+        size = self.simulation_size
+        bricks_per_side = -(-size // brick_size)
+        bricks = np.zeros((bricks_per_side ** 3, BRICK_STRIDE), dtype=np.uint32)
+        bricks[:, 5] = BACKGROUND
+
+        bricks_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
+                                  hostbuf=bricks)
+        self.launch("brick_graph", (size, size, size), self.labels_buffer, np.uint32(size),
+                    self.component_ids_buffer, np.uint32(brick_size), np.uint32(bricks_per_side), bricks_buffer)
+        cl.enqueue_copy(self.cl_queue, bricks, bricks_buffer).wait()
+
+        occupied = np.flatnonzero(bricks[:, 0])
+        node_of_brick = np.full(len(bricks), -1, dtype=np.int64)
+        node_of_brick[occupied] = np.arange(len(occupied))
+        positions = bricks[occupied, 1:4] / bricks[occupied, 0:1].astype(np.float64)
+
+        # Remap device component ids to the sorted order of label()
+        rank = np.empty(len(self.order), dtype=np.int64)
+        rank[self.order] = np.arange(len(self.order))
+        components = rank[bricks[occupied, 5]] if len(occupied) else np.zeros(0, dtype=np.int64)
+
+        # Brick links to the +x, +y and +z neighbors
+        links = bricks[occupied, 4]
+        adjacency = [[] for _ in occupied]
+        for bit, step in ((1, 1), (2, bricks_per_side), (4, bricks_per_side ** 2)):
+            for node in np.flatnonzero(links & bit):
+                neighbor = node_of_brick[occupied[node] + step]
+                adjacency[node].append(neighbor)
+                adjacency[neighbor].append(node)
+
+        return self.collapse_chains(positions, components, adjacency)
+
+    @staticmethod
+    def collapse_chains(positions, components, adjacency):
+        """Keeps the nodes without exactly two neighbors and joins them by the chains of nodes in between"""
+        degrees = np.array([len(neighbors) for neighbors in adjacency], dtype=np.int64)
+        kept = set(np.flatnonzero(degrees != 2).tolist())
+
+        def get_length(a, b):
+            return float(np.linalg.norm(positions[a] - positions[b]))
+
+        edges, lengths = [], []
+        walked = set()
+
+        def walk_from(start):
+            for first in adjacency[start]:
+                if (start, first) in walked:
+                    continue
+                previous, current, length = start, first, get_length(start, first)
+                walked.update(((start, first), (first, start)))
+
+                # Follow the chain until it reaches a kept node
+                while current not in kept:
+                    following = adjacency[current][0] if adjacency[current][0] != previous else adjacency[current][1]
+                    walked.update(((current, following), (following, current)))
+                    length += get_length(current, following)
+                    previous, current = current, following
+
+                edges.append((start, current))
+                lengths.append(length)
+
+        for node in sorted(kept):
+            walk_from(node)
+
+        # Loops made only of chain nodes get one of their nodes kept
+        for node in range(len(adjacency)):
+            if degrees[node] == 2 and node not in kept and (node, adjacency[node][0]) not in walked:
+                kept.add(node)
+                walk_from(node)
+
+        kept = np.array(sorted(kept), dtype=np.int64)
+        remap = np.full(len(adjacency), -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+
+        return {
+            "node_positions": positions[kept] if len(kept) else np.zeros((0, 3)),
+            "node_components": components[kept] if len(kept) else np.zeros(0, dtype=np.int64),
+            "node_degrees": degrees[kept],
+            "edges": remap[np.array(edges, dtype=np.int64).reshape(-1, 2)],
+            "edge_lengths": np.array(lengths, dtype=np.float64),
+        }
+
+    def export(self, path, volume_buffer, simulation_size, brick_size=4):
+        """Labels the volume and writes the statistics and the skeleton graph to a compressed .npz checkpoint"""
+        components = self.label(volume_buffer, simulation_size)
+        graph = self.get_skeleton_graph(brick_size) if brick_size else {}
+        self.release()
+
+        np.savez_compressed(path, simulation_size=simulation_size, threshold=self.threshold, **components, **graph)
+        print(f"Exported {len(components['sizes'])} components to {path}")
+        return components, graph
@@ -0,0 +1,261 @@
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from simulation_data import BOUNDARY_MODES, SETTINGS_DTYPE, SPORE_DTYPE, get_empty_volume, get_random_spores
+
+
+class SharedArray:
+    """Numpy array backed by a shared memory segment, so worker processes can map it without copying"""
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def description(self):
+        """What a worker needs to map the same segment"""
+        return self.shm.name, self.shape, self.dtype
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def hash_uint(x):
+    """Same hash as hash() in Shaders/3d_simulation.cl, on uint32 arrays"""
+    x = x.copy()
+    x += x << np.uint32(10)
+    x ^= x >> np.uint32(6)
+    x += x << np.uint32(3)
+    x ^= x >> np.uint32(11)
+    x += x << np.uint32(15)
+    return x
+
+
+def float_to_uint(x):
+    """Float to uint32 conversion of the kernel, saturated where rounding pushed a value past the uint range"""
+    return np.minimum(x, np.float32(4294967040.0)).astype(np.uint32)
+
+
+def normalize(vectors):
+    lengths = np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    return vectors / np.maximum(lengths, 1e-20)
+
+
+def get_deposit_indices(spores, simulation_size):
+    """Linear volume index of the voxel every spore inside the volume is in"""
+    x = spores['x'].astype(np.int64)
+    y = spores['y'].astype(np.int64)
+    z = spores['z'].astype(np.int64)
+    inside = (x >= 0) & (x < simulation_size) & (y >= 0) & (y < simulation_size) & (z >= 0) & (z < simulation_size)
+    return np.unique(((z * simulation_size + y) * simulation_size + x)[inside])
+
+
+def move_spores(spores, volume, random_seeds, settings, delta_time):
+    """Vectorised move_spores from Shaders/3d_simulation.cl, updates spores and random_seeds in place.
+    random_seeds holds one more entry than spores, the bounce uses a spore's seed and the next one.
+    """
+    size = int(settings['simulation_size'])
+    spore_speed = float(settings['spore_speed'])
+    sensor_distance = float(settings['sensor_distance'])
+
+    position = np.stack([spores['x'], spores['y'], spores['z']], axis=1)
+    direction = np.stack([spores['dir_x'], spores['dir_y'], spores['dir_z']], axis=1)
+
+    # Local right and up vectors, falling back to x when moving straight along the global up
+    right = np.cross(direction, np.array([0.0, 0.0, 1.0], dtype=np.float32))
+    parallel = np.linalg.norm(right, axis=1) == 0
+    right[parallel] = (1.0, 0.0, 0.0)
+    right = normalize(right)
+    up = normalize(np.cross(right, direction))
+
+    def sense(offset):
+        sample = position + normalize(direction + offset) * sensor_distance
+        sample = np.clip(sample.astype(np.int64), 0, size - 1)
+        return volume[sample[:, 2], sample[:, 1], sample[:, 0]]
+
+    # Sense weights
+    forward_weight = sense(direction)
+    right_weight = sense(right)
+    left_weight = sense(-right)
+    up_weight = sense(up)
+    down_weight = sense(-up)
+
+    # Add directions based on weights
+    turn = (forward_weight < right_weight) | (forward_weight < left_weight)
+    incline = (forward_weight < up_weight) | (forward_weight < down_weight)
+    direction_change = (right * ((turn & (right_weight > left_weight)) * 1.0 - (turn & (left_weight > right_weight)))[:, np.newaxis]
+                        + up * ((incline & (up_weight > down_weight)) * 1.0 - (incline & (down_weight > up_weight)))[:, np.newaxis])
+
+    new_direction = normalize(direction + direction_change * spore_speed * delta_time)
+    new_position = position + new_direction * spore_speed * delta_time
+
+    # Clamp all positions to inside the boundary
+    clamped_position = np.clip(new_position, 0.0, size - 1)
+    hit_boundary = (clamped_position != new_position).any(axis=1)
+
+    # OpenCL vector comparisons are -1 where true, so the kernel's hitMask is -1 on the axes that hit
+    hit_mask = -(clamped_position != new_position).astype(np.float32)
+
+    # Boundary bounce as the kernel does it, a random direction plus a push along the hit axes. Like the kernel it
+    # hashes the spore's seed and the next one, keeps both as floats and stores them back swapped.
+    if hit_boundary.any():
+        bounced = np.flatnonzero(hit_boundary)
+        random1 = hash_uint(random_seeds[bounced]).astype(np.float32)
+        random2 = hash_uint(random_seeds[bounced + 1]).astype(np.float32)
+        random_seeds[bounced] = float_to_uint(random2)
+        random_seeds[bounced + 1] = float_to_uint(random1)
+
+        theta = float_to_uint(random1) / np.float32(0xFFFFFFFF) * 2.0 * np.pi
+        z = float_to_uint(random2) / np.float32(0xFFFFFFFF) * 2.0 - 1.0
+        r = np.sqrt(1.0 - z * z)
+
+        random_mask = 1.0 - hit_mask[hit_boundary]
+        random_direction = normalize(np.stack([r * np.cos(theta), r * np.sin(theta), z], axis=1) * random_mask)
+
+        bounce = normalize(-new_direction[hit_boundary] * (1.0 - random_mask)) * 1.5
+        new_direction[hit_boundary] = normalize(bounce + random_direction)
+
+    spores['x'], spores['y'], spores['z'] = clamped_position.T
+    spores['dir_x'], spores['dir_y'], spores['dir_z'] = new_direction.T
+
+
+def worker_main(arrays, spore_range, z_range, connection):
+    """Worker loop, maps the shared arrays once and then runs commands for its own spores and planes"""
+    shared = {name: SharedArray(shape, dtype, shm_name) for name, (shm_name, shape, dtype) in arrays.items()}
+    volume = shared['volume'].array
+    spores = shared['spores'].array[spore_range[0]:spore_range[1]]
+    # The bounce also draws on the seed after the last spore's, so it overlaps the next chunk by one as in the kernel
+    random_seeds = shared['random_seeds'].array[spore_range[0]:spore_range[1] + 1]
+    deposits = shared['deposits'].array[spore_range[0]:spore_range[1]]
+    settings = shared['settings'].array[0]
+
+    while True:
+        command, delta_time = connection.recv()
+
+        if command == "deposit":
+            # Decay this worker's planes, then collect the voxels its spores are in
+            planes = volume[z_range[0]:z_range[1]]
+            planes -= settings['decay_speed'] * delta_time
+            np.maximum(planes, 0.0, out=planes)
+
+            indices = get_deposit_indices(spores, int(settings['simulation_size']))
+            deposits[:len(indices)] = indices
+            connection.send(len(indices))
+
+        elif command == "move":
+            move_spores(spores, volume, random_seeds, settings, np.float32(delta_time))
+            connection.send(None)
+
+        elif command == "stop":
+            break
+
+    del volume, spores, random_seeds, deposits, settings
+    for array in shared.values():
+        array.close()
+
+
+class CpuSimulation3D:
+    """Simulation3D's spore update on a pool of processes sharing the volume, spores and settings"""
+
+    def __init__(self, simulation_size=50, spore_count=1000, worker_count=None):
+        self.simulation_size = simulation_size
+        self.spore_count = spore_count
+        self.worker_count = worker_count or os.cpu_count()
+
+        self.spore_speed = 17
+        self.decay_speed = 0.4
+        self.sensor_distance = 14
+        self.turn_speed = 11
+
+        # Shared arrays, with the same dtypes as the OpenCL buffers
+        self.shared = {
+            'volume': SharedArray((simulation_size,) * 3, np.float32),
+            'spores': SharedArray((spore_count,), SPORE_DTYPE),
+            'random_seeds': SharedArray((spore_count + 1,), np.uint32),
+            'deposits': SharedArray((spore_count,), np.int64),
+            'settings': SharedArray((1,), SETTINGS_DTYPE),
+        }
+        self.volume = self.shared['volume'].array
+        self.spores = self.shared['spores'].array
+        self.deposits = self.shared['deposits'].array
+        self.settings = self.shared['settings'].array
+
+        self.volume[:] = get_empty_volume(simulation_size)
+        self.spores[:] = get_random_spores(spore_count, simulation_size)
+        self.shared['random_seeds'].array[:] = np.random.randint(0, 2 ** 32 - 1, size=spore_count + 1,
+                                                                   dtype=np.uint32)
+        self.update_settings()
+
+        # Workers start once and stay alive, each owns a chunk of spores and a slab of planes
+        spore_bounds = np.linspace(0, spore_count, self.worker_count + 1).astype(int)
+        z_bounds = np.linspace(0, simulation_size, self.worker_count + 1).astype(int)
+        arrays = {name: array.description() for name, array in self.shared.items()}
+
+        self.spore_ranges = list(zip(spore_bounds[:-1], spore_bounds[1:]))
+        self.workers = []
+        self.connections = []
+        for spore_range, z_range in zip(self.spore_ranges, zip(z_bounds[:-1], z_bounds[1:])):
+            parent_connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=worker_main, args=(arrays, spore_range, z_range, worker_connection),
+                                             daemon=True)
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(parent_connection)
+
+    def update_settings(self):
+        """Writes the settings into shared memory, workers read them every step"""
+        self.settings[0] = (self.spore_count, self.simulation_size, self.spore_speed, self.decay_speed,
+                            self.turn_speed, self.sensor_distance, BOUNDARY_MODES.index("bounce"))
+
+    def run_on_workers(self, command, delta_time):
+        for connection in self.connections:
+            connection.send((command, delta_time))
+        return [connection.recv() for connection in self.connections]
+
+    def step(self, delta_time):
+        """Decay and deposit, then move, the same order as Simulation3D.update"""
+        deposit_counts = self.run_on_workers("deposit", delta_time)
+
+        # Merge every chunk's deposits into the volume
+        flat_volume = self.volume.reshape(-1)
+        for (begin, _), count in zip(self.spore_ranges, deposit_counts):
+            flat_volume[self.deposits[begin:begin + count]] = 1.0
+
+        self.run_on_workers("move", delta_time)
+
+    def close(self):
+        """Stops the workers and frees the shared memory"""
+        for connection in self.connections:
+            connection.send(("stop", 0.0))
+        for worker in self.workers:
+            worker.join()
+
+        del self.volume, self.spores, self.deposits, self.settings
+        for array in self.shared.values():
+            array.close()
+
+
+if __name__ == '__main__':
+    for workers in sorted({1, max(1, os.cpu_count() // 2), os.cpu_count()}):
+        simulation = CpuSimulation3D(simulation_size=64, spore_count=400000, worker_count=workers)
+        simulation.step(1 / 30)  # Warm up
+
+        steps = 20
+        start = time.perf_counter()
+        for _ in range(steps):
+            simulation.step(1 / 30)
+        elapsed = time.perf_counter() - start
+        simulation.close()
+
+        print(f"{workers} workers: {steps / elapsed:.2f} steps/s")
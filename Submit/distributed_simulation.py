@@ -0,0 +1,318 @@
+import math
+import time
+
+import numpy as np
+import pyopencl as cl
+
+from game_engine import GameEngine
+from kernel_launcher import KernelLauncher
+from simulation_data import BATCH_SPORE_DTYPE, BOUNDARY_MODES, SETTINGS_DTYPE, SPORE_DTYPE, get_random_spores
+
+
+class Slab:
+    """The part of the volume one device owns: planes z_begin <= z < z_end plus a halo on both sides"""
+
+    def __init__(self, index, device, cl_context, z_begin, z_end, halo, simulation_size):
+        self.index = index
+        self.device = device
+        self.cl_queue = cl.CommandQueue(cl_context, device)
+        self.z_begin = z_begin
+        self.z_end = z_end
+        self.halo = halo
+
+        # Local volume starts at global plane z_begin - halo
+        self.plane_size = simulation_size * simulation_size
+        self.local_depth = (z_end - z_begin) + 2 * halo
+        self.volume_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE,
+                                       size=self.local_depth * self.plane_size * np.dtype(np.float32).itemsize)
+        cl.enqueue_fill_buffer(self.cl_queue, self.volume_buffer, np.float32(0), 0, self.volume_buffer.size)
+
+        self.spore_count = 0
+        self.capacity = 0
+        self.outbox_capacity = 0
+
+        # counters[0] kept spores, counters[1] outgoing spores
+        self.counters = np.zeros(2, dtype=np.uint32)
+        self.counters_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.counters.nbytes)
+
+    def plane_offset(self, z):
+        """Byte offset of global plane z in the local volume"""
+        return (z - self.z_begin + self.halo) * self.plane_size * np.dtype(np.float32).itemsize
+
+
+class DistributedSimulation3D:
+    """Splits the volume into z slabs spread over several OpenCL devices, exchanging halos and migrating spores"""
+
+    def __init__(self, simulation_size=100, spore_count=10000, slab_count=None, max_sensor_distance=20.0):
+        self.simulation_size = simulation_size
+        self.spore_count = spore_count
+
+        self.spore_speed = 17
+        self.decay_speed = 0.4
+        self.sensor_distance = 14
+        self.turn_speed = 11
+
+        # Halo is wider than the farthest a sensor can reach
+        self.max_sensor_distance = max_sensor_distance
+        self.halo = math.ceil(max_sensor_distance) + 1
+
+        self.devices = self.get_devices()
+        self.cl_context = cl.Context(self.devices)
+        source = (GameEngine.load_file("Shaders/3d_simulation.cl") + GameEngine.load_file("Shaders/batch_simulation.cl")
+                  + GameEngine.load_file("Shaders/slab_simulation.cl"))
+        self.program = cl.Program(self.cl_context, source).build()
+
+        # Settings Buffer, shared by every slab
+        self.settings = np.zeros(1, dtype=SETTINGS_DTYPE)
+        self.settings_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY, size=self.settings.nbytes)
+
+        # One slab per device unless asked otherwise, slabs are spread over the devices in turn
+        self.slab_count = slab_count or len(self.devices)
+        self.slab_depth = math.ceil(self.simulation_size / self.slab_count)
+        self.slabs = []
+        for i in range(self.slab_count):
+            z_begin = min(i * self.slab_depth, self.simulation_size)
+            z_end = min(z_begin + self.slab_depth, self.simulation_size)
+            self.slabs.append(Slab(i, self.devices[i % len(self.devices)], self.cl_context, z_begin, z_end,
+                                   self.halo, self.simulation_size))
+
+        for slab in self.slabs:
+            self.create_launchers(slab)
+
+        self.update_settings_buffer()
+        self.distribute_spores(get_random_spores(self.spore_count, self.simulation_size))
+
+    @staticmethod
+    def get_devices():
+        """Every GPU of the first platform, or the CPU split into sub-devices when there are none"""
+        cl_platform = cl.get_platforms()[0]
+        devices = cl_platform.get_devices()
+        gpu_devices = [device for device in devices if device.type == cl.device_type.GPU]
+        if gpu_devices:
+            return gpu_devices
+
+        cpu = devices[0]
+        try:
+            # Device fission, roughly two compute units per sub-device
+            units = max(1, min(2, cpu.max_compute_units))
+            return cpu.create_sub_devices([cl.device_partition_property.EQUALLY, units])
+        except cl.Error:
+            return [cpu]
+
+    def create_launchers(self, slab):
+        """Kernel launchers of the slab, the arguments that never change are bound here"""
+        size = self.simulation_size
+        z_begin, z_end, halo = np.uint32(slab.z_begin), np.uint32(slab.z_end), np.uint32(slab.halo)
+
+        slab.decay_trails_launcher = KernelLauncher(slab.cl_queue, self.program, "slab_decay_trails",
+                                                    (size, size, max(slab.z_end - slab.z_begin, 1)))
+        slab.decay_trails_launcher.set_args(slab.volume_buffer, self.settings_buffer, z_begin, z_end, halo,
+                                            np.float32(0))
+
+        slab.draw_spores_launcher = KernelLauncher(slab.cl_queue, self.program, "slab_draw_spores", (1,))
+        slab.draw_spores_launcher.set_arg(0, slab.volume_buffer)
+        slab.draw_spores_launcher.set_arg(2, self.settings_buffer)
+        slab.draw_spores_launcher.set_arg(4, z_begin)
+        slab.draw_spores_launcher.set_arg(5, z_end)
+        slab.draw_spores_launcher.set_arg(6, halo)
+
+        slab.move_spores_launcher = KernelLauncher(slab.cl_queue, self.program, "slab_move_spores", (1,))
+        slab.move_spores_launcher.set_arg(1, slab.volume_buffer)
+        slab.move_spores_launcher.set_arg(3, self.settings_buffer)
+        slab.move_spores_launcher.set_arg(5, z_begin)
+        slab.move_spores_launcher.set_arg(6, z_end)
+        slab.move_spores_launcher.set_arg(7, halo)
+
+        slab.migrate_spores_launcher = KernelLauncher(slab.cl_queue, self.program, "slab_migrate_spores", (1,))
+        slab.migrate_spores_launcher.set_arg(2, np.uint32(slab.index))
+        slab.migrate_spores_launcher.set_arg(3, np.uint32(self.slab_depth))
+        slab.migrate_spores_launcher.set_arg(4, np.uint32(self.slab_count))
+        slab.migrate_spores_launcher.set_arg(8, slab.counters_buffer)
+
+    @staticmethod
+    def bind_spores(slab):
+        """Points the spore kernels at the slab's current spore buffers and count"""
+        spore_count = np.uint32(slab.spore_count)
+        global_size = (max(slab.spore_count, 1),)
+
+        slab.draw_spores_launcher.set_arg(1, slab.spores_buffer)
+        slab.draw_spores_launcher.set_arg(3, spore_count)
+        slab.draw_spores_launcher.set_global_size(global_size)
+
+        slab.move_spores_launcher.set_arg(0, slab.spores_buffer)
+        slab.move_spores_launcher.set_arg(2, slab.random_seeds_buffer)
+        slab.move_spores_launcher.set_arg(4, spore_count)
+        slab.move_spores_launcher.set_global_size(global_size)
+
+        slab.migrate_spores_launcher.set_arg(0, slab.spores_buffer)
+        slab.migrate_spores_launcher.set_arg(1, spore_count)
+        slab.migrate_spores_launcher.set_arg(5, slab.kept_spores_buffer)
+        slab.migrate_spores_launcher.set_arg(6, slab.outbox_buffer)
+        slab.migrate_spores_launcher.set_arg(7, np.uint32(slab.outbox_capacity))
+        slab.migrate_spores_launcher.set_global_size(global_size)
+
+    def update_settings_buffer(self):
+        # Sensors can't reach past the halo
+        self.sensor_distance = min(self.sensor_distance, self.max_sensor_distance)
+        self.settings[0] = (self.spore_count, self.simulation_size, self.spore_speed, self.decay_speed,
+                            self.turn_speed, self.sensor_distance, BOUNDARY_MODES.index("bounce"))
+        cl.enqueue_copy(self.slabs[0].cl_queue, self.settings_buffer, self.settings).wait()
+
+    def get_target_slabs(self, spores):
+        return np.minimum(spores['z'].astype(np.int64) // self.slab_depth, self.slab_count - 1)
+
+    def distribute_spores(self, spores):
+        """Uploads the spores into the slabs that own their positions"""
+        targets = self.get_target_slabs(spores)
+        for slab in self.slabs:
+            slab_spores = spores[targets == slab.index]
+            self.ensure_capacity(slab, len(slab_spores))
+            slab.spore_count = len(slab_spores)
+            if slab.spore_count:
+                cl.enqueue_copy(slab.cl_queue, slab.spores_buffer, slab_spores)
+            self.bind_spores(slab)
+        self.finish()
+
+    def ensure_capacity(self, slab, spore_count):
+        """Doubles the slab's spore buffers until they fit spore_count, keeping the spores already there"""
+        if spore_count <= slab.capacity and slab.capacity:
+            return
+
+        capacity = max(slab.capacity, 1024)
+        while capacity < spore_count:
+            capacity *= 2
+
+        spores_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * SPORE_DTYPE.itemsize)
+        if slab.spore_count:
+            cl.enqueue_copy(slab.cl_queue, spores_buffer, slab.spores_buffer,
+                            byte_count=slab.spore_count * SPORE_DTYPE.itemsize)
+
+        slab.spores_buffer = spores_buffer
+        slab.kept_spores_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=spores_buffer.size)
+
+        # Seeds are only random state, new ones are fine
+        random_seeds = np.random.randint(0, 2 ** 32 - 1, size=capacity + 1, dtype=np.uint32)
+        slab.random_seeds_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
+                                             hostbuf=random_seeds)
+
+        # A tenth of the slab leaving in one step is plenty, overflow waits for the next step
+        self.resize_outbox(slab, max(256, capacity // 10))
+        slab.capacity = capacity
+
+    def resize_outbox(self, slab, outbox_capacity):
+        slab.outbox_capacity = outbox_capacity
+        slab.outbox_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE,
+                                       size=outbox_capacity * BATCH_SPORE_DTYPE.itemsize)
+
+    def finish(self):
+        for slab in self.slabs:
+            slab.cl_queue.finish()
+
+    def exchange_halos(self):
+        """Copies every neighbour's owned planes into each slab's halo planes"""
+        for slab in self.slabs:
+            halo_ranges = [(max(slab.z_begin - self.halo, 0), slab.z_begin),
+                           (slab.z_end, min(slab.z_end + self.halo, self.simulation_size))]
+            for other in self.slabs:
+                if other is slab:
+                    continue
+                for halo_begin, halo_end in halo_ranges:
+                    begin = max(halo_begin, other.z_begin)
+                    end = min(halo_end, other.z_end)
+                    if begin < end:
+                        cl.enqueue_copy(slab.cl_queue, slab.volume_buffer, other.volume_buffer,
+                                        byte_count=(end - begin) * slab.plane_size * np.dtype(np.float32).itemsize,
+                                        src_offset=other.plane_offset(begin), dst_offset=slab.plane_offset(begin))
+        self.finish()
+
+    def migrate_spores(self):
+        """Moves spores that crossed a slab boundary to the slab that now owns them"""
+        incoming = [[] for _ in self.slabs]
+
+        for slab in self.slabs:
+            if not slab.spore_count:
+                continue
+            cl.enqueue_fill_buffer(slab.cl_queue, slab.counters_buffer, np.uint32(0), 0, slab.counters.nbytes)
+            slab.migrate_spores_launcher()
+            cl.enqueue_copy(slab.cl_queue, slab.counters, slab.counters_buffer).wait()
+
+            outgoing = min(int(slab.counters[1]), slab.outbox_capacity)
+            if outgoing:
+                outbox = np.empty(outgoing, dtype=BATCH_SPORE_DTYPE)
+                cl.enqueue_copy(slab.cl_queue, outbox, slab.outbox_buffer).wait()
+                for target in np.unique(outbox['batch_id']):
+                    incoming[target].append(outbox['spore'][outbox['batch_id'] == target])
+
+            # Let the outbox fit next time
+            if slab.counters[1] > slab.outbox_capacity:
+                self.resize_outbox(slab, int(slab.counters[1]) * 2)
+
+            # Kept spores become the slab's spores
+            slab.spores_buffer, slab.kept_spores_buffer = slab.kept_spores_buffer, slab.spores_buffer
+            slab.spore_count = int(slab.counters[0])
+
+        # Append the arrivals after each slab's kept spores
+        for slab, arrivals in zip(self.slabs, incoming):
+            if arrivals:
+                arrivals = np.concatenate(arrivals)
+                self.ensure_capacity(slab, slab.spore_count + len(arrivals))
+                cl.enqueue_copy(slab.cl_queue, slab.spores_buffer, arrivals,
+                                dst_offset=slab.spore_count * SPORE_DTYPE.itemsize)
+                slab.spore_count += len(arrivals)
+            self.bind_spores(slab)
+        self.finish()
+
+    def step(self, delta_time):
+        """Advances every slab by one step"""
+        delta_time = np.float32(delta_time)
+
+        for slab in self.slabs:
+            slab.decay_trails_launcher.set_arg(5, delta_time)
+            slab.decay_trails_launcher()
+            if slab.spore_count:
+                slab.draw_spores_launcher()
+        self.finish()
+
+        self.exchange_halos()
+
+        for slab in self.slabs:
+            if slab.spore_count:
+                slab.move_spores_launcher.set_arg(8, delta_time)
+                slab.move_spores_launcher()
+        self.finish()
+
+        self.migrate_spores()
+
+    def get_volume(self):
+        """Gathers the owned planes of every slab into one host volume"""
+        size = self.simulation_size
+        volume = np.zeros((size, size, size), dtype=np.float32)
+        for slab in self.slabs:
+            if slab.z_begin < slab.z_end:
+                cl.enqueue_copy(slab.cl_queue, volume[slab.z_begin:slab.z_end], slab.volume_buffer,
+                                src_offset=slab.plane_offset(slab.z_begin)).wait()
+        return volume
+
+    def get_spores(self):
+        """Gathers every slab's spores"""
+        spores = []
+        for slab in self.slabs:
+            slab_spores = np.empty(slab.spore_count, dtype=SPORE_DTYPE)
+            if slab.spore_count:
+                cl.enqueue_copy(slab.cl_queue, slab_spores, slab.spores_buffer).wait()
+            spores.append(slab_spores)
+        return np.concatenate(spores)
+
+
+if __name__ == '__main__':
+    simulation = DistributedSimulation3D(simulation_size=128, spore_count=200000)
+    print(f"{simulation.slab_count} slabs on {len(simulation.devices)} devices, halo of {simulation.halo} planes")
+
+    steps = 100
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.step(1 / 30)
+    elapsed = time.perf_counter() - start
+
+    print(f"{steps} steps in {elapsed:.2f}s ({steps / elapsed:.1f} steps/s)")
+    print("Spores per slab:", [slab.spore_count for slab in simulation.slabs])
@@ -1,32 +1,100 @@
 import pyopencl as cl
-import glfw
-from OpenGL.GL import *
 import os
+import queue
+import sys
+import threading
 import time
-import imgui
-from imgui.integrations.glfw import GlfwRenderer
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from kernel_launcher import KernelLauncher
+from triple_buffer import TripleBuffer
+from work_group_tuner import WorkGroupTuner
 
 
 class GameEngine(ABC):
-    def __init__(self, width, height, title, cl_file, target_framerate):
+    def __init__(self, width, height, title, cl_file, target_framerate, threaded=False, headless=False,
+                 gl_sharing=False, build_options=()):
         self.window_width = width
         self.window_height = height
         self.target_framerate = target_framerate
 
-        self.window = self.initialize_window(self.window_width, self.window_height, title)
-        imgui.create_context()
-        self.impl = GlfwRenderer(self.window)
+        # Seconds each phase of the startup took, subclasses add their own and print them with report_startup_timings
+        self.startup_timings = {}
+        self.startup_time = time.perf_counter()
+        phase_start = self.startup_time
+
+        # Engines without a cl_file only render (the simulation viewer), they don't touch OpenCL. A list of files is
+        # built as one program, in order. Without GL sharing the program builds on its own thread while the window
+        # opens, sharing needs a context made for the window's GL context so it has to wait for the window.
+        self.gl_sharing = False
+        share_gl = cl_file and gl_sharing and not headless
+        program_build = None
+        if cl_file and not share_gl:
+            self.cl_context, self.cl_queue = self.initialize_opencl()
+            phase_start = self.record_startup_phase("opencl context", phase_start)
+            program_build = self.start_program_build(cl_file, build_options)
+
+        # Headless engines have no window, GL context or GUI, only OpenCL, and never import the GUI and GL modules
+        self.headless = headless
+        if headless:
+            self.window = None
+            self.impl = None
+        else:
+            import imgui
+            from imgui.integrations.glfw import GlfwRenderer
+
+            self.window = self.initialize_window(self.window_width, self.window_height, title)
+            phase_start = self.record_startup_phase("window", phase_start)
+            imgui.create_context()
+            self.impl = GlfwRenderer(self.window)
+            phase_start = self.record_startup_phase("gui", phase_start)
+
+        if share_gl:
+            # The kernels see GL_SHARING when the context shares
+            shared = self.initialize_opencl_gl_sharing()
+            self.gl_sharing = shared is not None
+            self.cl_context, self.cl_queue = shared or self.initialize_opencl()
+            phase_start = self.record_startup_phase("opencl context", phase_start)
+            program_build = self.start_program_build(cl_file, build_options)
 
-        self.cl_context, self.cl_queue = self.initialize_opencl()
-        self.program = cl.Program(self.cl_context, self.load_file(cl_file)).build()
-        self.last_frame_time = glfw.get_time()
+        if cl_file:
+            self.program = program_build.result()
+            self.record_startup_phase("waiting for the build", phase_start)
+            self.work_group_tuner = WorkGroupTuner(self.cl_queue)
+        else:
+            self.cl_context = self.cl_queue = self.program = self.work_group_tuner = None
+
+        if headless:
+            self.last_frame_time = time.perf_counter()
+        else:
+            import glfw
+            self.last_frame_time = glfw.get_time()
         self.delta_time = 0.0
         self.frame_rate = 0
 
+        # Threaded mode, the simulation steps on its own thread and hands frames to the render thread. Only engines
+        # that override simulate and present can run it, checked here rather than on the first step.
+        if threaded and (type(self).simulate is GameEngine.simulate or type(self).present is GameEngine.present):
+            raise TypeError(f"{type(self).__name__} can't run threaded without overriding simulate and present")
+        self.threaded = threaded
+        self.frames = TripleBuffer()
+        self.simulation_commands = queue.Queue()
+        self.simulation_thread = None
+        self.simulation_stop = threading.Event()
+        self.simulation_error = None
+        self.simulation_rate = 0
+
+        # Seconds spent in each phase of the last frame, "frame" is the whole frame before the limiter sleeps
+        self.frame_timings = {}
+        self.quality_controller = None
+
     @staticmethod
     def initialize_window(window_width, window_height, window_title):
         """Initializes glfw window"""
+        import glfw
+        from OpenGL.GL import GL_TRUE
+
         if not glfw.init():
             raise Exception("Failed to initialize GLFW")
 
@@ -63,14 +131,77 @@ class GameEngine(ABC):
         queue = cl.CommandQueue(context)
         return context, queue
 
+    @staticmethod
+    def initialize_opencl_gl_sharing():
+        """OpenCL context sharing objects with the current GL context, None when no GPU supports it"""
+        if not cl.have_gl():
+            return None
+
+        from pyopencl.tools import get_gl_sharing_context_properties
+        for cl_platform in cl.get_platforms():
+            devices = [device for device in cl_platform.get_devices() if device.type == cl.device_type.GPU and
+                       ("cl_khr_gl_sharing" in device.extensions or "cl_APPLE_gl_sharing" in device.extensions)]
+            if not devices:
+                continue
+
+            try:
+                # Apple finds the device from the GL share group itself
+                if sys.platform == "darwin":
+                    context = cl.Context(properties=get_gl_sharing_context_properties(), devices=[])
+                else:
+                    context = cl.Context(properties=[(cl.context_properties.PLATFORM, cl_platform)] +
+                                         get_gl_sharing_context_properties(), devices=[devices[0]])
+            except cl.Error as error:
+                print("GL sharing unavailable on", cl_platform.name, error)
+                continue
+
+            print("Using device:", context.devices[0].name, "with GL sharing")
+            return context, cl.CommandQueue(context)
+        return None
+
+    def start_program_build(self, cl_file, build_options):
+        """Starts building the program on its own thread, returns the future of it"""
+        build_options = list(build_options) + (["-D", "GL_SHARING"] if self.gl_sharing else [])
+        cl_files = [cl_file] if isinstance(cl_file, str) else cl_file
+        source = "".join(self.load_file(file) for file in cl_files)
+
+        def build():
+            build_start = time.perf_counter()
+            program = cl.Program(self.cl_context, source).build(options=build_options)
+            self.startup_timings["program build"] = time.perf_counter() - build_start
+            return program
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="program build")
+        program_build = executor.submit(build)
+        executor.shutdown(wait=False)
+        return program_build
+
+    def record_startup_phase(self, phase, phase_start):
+        """Stores the time since phase_start under phase, returns the current time as the next phase's start"""
+        current_time = time.perf_counter()
+        self.startup_timings[phase] = current_time - phase_start
+        return current_time
+
+    def report_startup_timings(self):
+        """Prints how long each startup phase took, the build ran alongside the phases before the wait for it"""
+        phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in self.startup_timings.items())
+        print(f"Started in {time.perf_counter() - self.startup_time:.3f}s ({phases})")
+
     def run(self):
         """Main loop of game"""
+        import glfw
+        import imgui
+        from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, glClear
+
         print("Starting Program...")
 
         # Vars for tracking frame count and framerate
         frame_count = 0
         second_timer = glfw.get_time()
 
+        if self.threaded:
+            self.start_simulation_thread()
+
         # Main Loop
         while not glfw.window_should_close(self.window):
             # Framerate tracking
@@ -81,15 +212,23 @@ class GameEngine(ABC):
             # Input processing
             self.impl.process_inputs()
             glfw.poll_events()
+            phase_start = glfw.get_time()
 
-            # Run update function
-            self.update()
+            # Run update function, in threaded mode the simulation thread does the stepping
+            if self.threaded:
+                if self.simulation_error:
+                    raise self.simulation_error
+                self.update_threaded()
+            else:
+                self.update()
+            phase_start = self.record_phase("update", phase_start)
 
             # Clear screen to black
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
             # Render function
             self.render()
+            phase_start = self.record_phase("render", phase_start)
 
             # GUI stuff
             imgui.new_frame()
@@ -97,9 +236,16 @@ class GameEngine(ABC):
             imgui.end_frame()
             imgui.render()
             self.impl.render(imgui.get_draw_data())
+            phase_start = self.record_phase("gui", phase_start)
 
             # Swap window buffers
             glfw.swap_buffers(self.window)
+            self.record_phase("swap", phase_start)
+            self.frame_timings["frame"] = glfw.get_time() - current_time
+
+            # Let the controller trade quality for time before the next frame
+            if self.quality_controller:
+                self.quality_controller.update()
 
             # Frame rate calculation
             frame_count += 1
@@ -114,9 +260,93 @@ class GameEngine(ABC):
                 time.sleep(time_to_wait)
 
         # Cleanup
+        if self.threaded:
+            self.stop_simulation_thread()
+        self.close()
         self.impl.shutdown()
         glfw.terminate()
 
+    def start_simulation_thread(self):
+        self.simulation_stop.clear()
+        self.simulation_thread = threading.Thread(target=self.simulation_loop, name="simulation", daemon=True)
+        self.simulation_thread.start()
+
+    def stop_simulation_thread(self):
+        self.simulation_stop.set()
+        self.simulation_thread.join()
+        self.simulation_thread = None
+
+        # Commands sent after the last step still run, nothing the GUI changed gets lost
+        self.run_simulation_commands()
+
+    def simulation_loop(self):
+        """Threaded mode: steps as fast as the device allows, independent of vsync and the frame limiter"""
+        last_step_time = time.perf_counter()
+        second_timer = last_step_time
+        step_count = 0
+
+        try:
+            while not self.simulation_stop.is_set():
+                self.run_simulation_commands()
+
+                current_time = time.perf_counter()
+                delta_time = current_time - last_step_time
+                last_step_time = current_time
+
+                # Frames the simulation skips reading back aren't published
+                frame = self.simulate(delta_time)
+                if frame is not None:
+                    self.frames.publish(frame)
+                self.frame_timings["simulate"] = time.perf_counter() - current_time
+
+                step_count += 1
+                if current_time - second_timer >= 1.0:
+                    self.simulation_rate = step_count
+                    step_count = 0
+                    second_timer += 1.0
+        except Exception as error:
+            # Raised again on the render thread
+            self.simulation_error = error
+
+    def record_phase(self, phase, phase_start):
+        """Stores the time since phase_start under phase, returns the current time as the next phase's start"""
+        import glfw
+        current_time = glfw.get_time()
+        self.frame_timings[phase] = current_time - phase_start
+        return current_time
+
+    def run_simulation_commands(self):
+        while True:
+            try:
+                command, args, kwargs = self.simulation_commands.get_nowait()
+            except queue.Empty:
+                return
+            command(*args, **kwargs)
+
+    def run_on_simulation_thread(self, command, *args, **kwargs):
+        """Runs command where the simulation runs, queued between steps in threaded mode and right away otherwise"""
+        if self.simulation_thread is not None:
+            self.simulation_commands.put((command, args, kwargs))
+        else:
+            command(*args, **kwargs)
+
+    def update_threaded(self):
+        """Threaded mode: called on the render thread instead of update, presents the newest simulated frame"""
+        frame = self.frames.acquire()
+        if frame is not None:
+            self.present(frame)
+
+    def simulate(self, delta_time):
+        """
+        Threaded mode: advances the simulation on the simulation thread, returns what the render thread needs,
+        or None when there's nothing new to present. Engines running threaded have to override it.
+        """
+        pass
+
+    def present(self, frame):
+        """Threaded mode: takes a frame from simulate over on the render thread, overridden with simulate"""
+        pass
+
     # Helper Functions
     @staticmethod
     def load_file(filename):
@@ -132,6 +362,16 @@ class GameEngine(ABC):
         buf = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR, hostbuf=data)
         return buf
 
+    def create_kernel_launcher(self, kernel_name, global_size, *args, local_size=None):
+        """Creates the kernel once and binds its arguments, see KernelLauncher"""
+        launcher = KernelLauncher(self.cl_queue, self.program, kernel_name, global_size, local_size)
+        launcher.set_args(*args)
+        return launcher
+
+    def close(self):
+        """Called after the main loop, while the GL context is still there, for what has to be finished or freed"""
+        pass
+
     @abstractmethod
     def update(self):
         """Updates before rendering every frame"""
@@ -0,0 +1,154 @@
+import time
+
+import glfw
+import imgui
+import numpy as np
+from OpenGL.GL import *
+
+from bit_life import MAX_GENERATIONS_PER_LAUNCH, BitLife
+from game_engine import GameEngine
+from shader_program import ShaderProgram
+
+
+class GameOfLife(GameEngine):
+    """Shows a LifeEngine, by default a BitLife board on the device, panned with WASD and zoomed with the GUI"""
+
+    def __init__(self, window_width, window_height, board_width=4096, board_height=4096, target_framerate=60,
+                 title="Conway's Game of Life", life_engine=None):
+        super().__init__(window_width, window_height, title, "Shaders/bit_game_of_life.cl", target_framerate)
+        self.life_engine = life_engine or BitLife(self.cl_context, self.cl_queue, board_width, board_height,
+                                                  program=self.program)
+        if life_engine is None:
+            self.life_engine.randomize(0.3)
+
+        # Generations per frame, the board only crosses the bus as the viewport's image
+        self.generations_per_frame = 1
+        self.paused = False
+        self.generation_rate = 0.0
+
+        # Viewport, scale is cells per pixel
+        self.framebuffer_width, self.framebuffer_height = glfw.get_framebuffer_size(self.window)
+        self.scale = 1.0
+        self.viewport_x = 0.0
+        self.viewport_y = 0.0
+        self.pan_speed = 600
+
+        self.shader_program = ShaderProgram("Shaders/2D_vertex_shader.glsl", "Shaders/2D_fragment_shader.glsl")
+        self.texture_location = glGetUniformLocation(self.shader_program.program, "texture1")
+        self.texture = self.initialize_texture(self.framebuffer_width, self.framebuffer_height)
+        self.vao, self.vbo = self.setup_rendering()
+        self.population = 0
+
+    @staticmethod
+    def initialize_texture(width, height):
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture
+
+    @staticmethod
+    def setup_rendering():
+        """One quad over the whole window, the image's first row is the top of the screen"""
+        vertex_data = np.array([
+            -1.0, -1.0, 0.0, 1.0,  # Triangle 1, Bottom-left
+            1.0, -1.0, 1.0, 1.0,  # Triangle 1, Bottom-right
+            -1.0, 1.0, 0.0, 0.0,  # Triangle 1, Top-left
+            1.0, -1.0, 1.0, 1.0,  # Triangle 2, Bottom-right
+            -1.0, 1.0, 0.0, 0.0,  # Triangle 2, Top-left
+            1.0, 1.0, 1.0, 0.0  # Triangle 2, Top-right
+        ], dtype=np.float32)
+
+        vao = glGenVertexArrays(1)
+        glBindVertexArray(vao)
+
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
+
+        # Position attribute
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(0)
+        # Texture coordinate attribute
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(2 * vertex_data.itemsize))
+        glEnableVertexAttribArray(1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindVertexArray(0)
+
+        return vao, vbo
+
+    def update_viewport(self):
+        """WASD pans by a screen speed, so it feels the same at every zoom"""
+        distance = self.pan_speed * self.delta_time * self.scale
+        if glfw.get_key(self.window, glfw.KEY_A) == glfw.PRESS:
+            self.viewport_x -= distance
+        if glfw.get_key(self.window, glfw.KEY_D) == glfw.PRESS:
+            self.viewport_x += distance
+        if glfw.get_key(self.window, glfw.KEY_W) == glfw.PRESS:
+            self.viewport_y -= distance
+        if glfw.get_key(self.window, glfw.KEY_S) == glfw.PRESS:
+            self.viewport_y += distance
+
+    def update(self):
+        self.update_viewport()
+
+        start = time.perf_counter()
+        if not self.paused:
+            self.life_engine.step(self.generations_per_frame)
+
+        # The image readback waits for the steps, so the rate covers both
+        image = self.life_engine.get_image(self.viewport_x, self.viewport_y, self.scale,
+                                           self.framebuffer_width, self.framebuffer_height)
+        if not self.paused:
+            self.generation_rate = self.generations_per_frame / max(time.perf_counter() - start, 1e-6)
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.framebuffer_width, self.framebuffer_height, GL_RGBA,
+                        GL_UNSIGNED_BYTE, image)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def render(self):
+        glUseProgram(self.shader_program.program)
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(self.texture_location, 0)
+
+        glBindVertexArray(self.vao)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glDrawArrays(GL_TRIANGLES, 0, 6)
+
+        # Clean up
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def render_gui(self):
+        imgui.push_style_var(imgui.STYLE_ALPHA, 0.8)
+
+        if imgui.begin("Game of Life"):
+            _, self.paused = imgui.checkbox("Paused", self.paused)
+            _, self.generations_per_frame = imgui.slider_int("Generations/Frame", self.generations_per_frame, 1,
+                                                             MAX_GENERATIONS_PER_LAUNCH * 64)
+            _, self.scale = imgui.slider_float("Cells/Pixel", self.scale, 0.05, 64.0,
+                                              flags=imgui.SLIDER_FLAGS_LOGARITHMIC)
+
+            if imgui.button("Randomize") and isinstance(self.life_engine, BitLife):
+                self.life_engine.randomize(0.3)
+
+            # Counting reads back one number, only done on request
+            if imgui.button("Count Population"):
+                self.population = self.life_engine.get_population()
+            imgui.text(f"Population: {self.population}")
+            imgui.text(f"Generation: {self.life_engine.generation}")
+            imgui.text(f"Generations/s: {self.generation_rate:.0f}")
+            imgui.text(f"FPS: {self.frame_rate}")
+
+        imgui.end()
+        imgui.pop_style_var()
+
+
+if __name__ == '__main__':
+    game = GameOfLife(700, 700, 4096, 4096)
+    game.run()
@@ -0,0 +1,329 @@
+import time
+from array import array
+
+import numpy as np
+
+from life_engine import LifeEngine
+
+
+class HashLife(LifeEngine):
+    """
+    Game of Life on an unbounded plane with Gosper's HashLife, on the CPU.
+
+    The board is a quadtree whose nodes are hash-consed, equal subtrees are stored once. Nodes live in slots of flat
+    typed arrays (children, level, population) and are found again through a dict keyed by their four children. The
+    result of stepping a node forward is memoised per node and step size, so repeating and empty regions cost nothing
+    after the first time. Slot 0 is the dead cell and slot 1 the live one. Once more than max_nodes slots are in use,
+    a step ends with a garbage collection that keeps only the nodes the board still uses.
+    """
+
+    def __init__(self, max_nodes=1_000_000):
+        super().__init__()
+        self.max_nodes = max_nodes
+
+        # Node storage, a node's children always have lower slots than the node itself
+        self.nw, self.ne, self.sw, self.se = (array("i", [0, 0]) for _ in range(4))
+        self.levels = array("b", [0, 0])
+        self.populations = array("q", [0, 1])
+        self.nodes = {}
+
+        # Memoised successors, one slot array per log2 of the step size, -1 when not known yet
+        self.results = {}
+
+        # Empty node of every level
+        self.empty_nodes = [0]
+
+        # The root covers the cells from (origin_x, origin_y) on, 2 ** level on each side
+        self.root = self.get_empty(3)
+        self.origin_x = self.origin_y = -4
+
+    def join(self, nw, ne, sw, se):
+        """The node with the four children, created if it doesn't exist yet"""
+        key = (nw << 96) | (ne << 64) | (sw << 32) | se
+        slot = self.nodes.get(key)
+        if slot is None:
+            slot = len(self.levels)
+            self.nw.append(nw)
+            self.ne.append(ne)
+            self.sw.append(sw)
+            self.se.append(se)
+            self.levels.append(self.levels[nw] + 1)
+            populations = self.populations
+            populations.append(populations[nw] + populations[ne] + populations[sw] + populations[se])
+            for results in self.results.values():
+                results.append(-1)
+            self.nodes[key] = slot
+        return slot
+
+    def get_empty(self, level):
+        while len(self.empty_nodes) <= level:
+            empty = self.empty_nodes[-1]
+            self.empty_nodes.append(self.join(empty, empty, empty, empty))
+        return self.empty_nodes[level]
+
+    def get_centered(self, node):
+        """The node one level up with node in its middle"""
+        empty = self.get_empty(self.levels[node] - 1)
+        return self.join(self.join(empty, empty, empty, self.nw[node]), self.join(empty, empty, self.ne[node], empty),
+                         self.join(empty, self.sw[node], empty, empty), self.join(self.se[node], empty, empty, empty))
+
+    def get_inner(self, node):
+        """The middle half of node, one level down"""
+        return self.join(self.se[self.nw[node]], self.sw[self.ne[node]], self.ne[self.sw[node]], self.nw[self.se[node]])
+
+    def expand(self):
+        """Grows the root by a level around its middle"""
+        half = 1 << (self.levels[self.root] - 1)
+        self.root = self.get_centered(self.root)
+        self.origin_x -= half
+        self.origin_y -= half
+
+    def crop(self):
+        """Shrinks the root while everything alive fits in its middle quarter, stepping grows it back to the half"""
+        while self.levels[self.root] > 3:
+            inner = self.get_inner(self.root)
+            if self.populations[self.get_inner(inner)] != self.populations[self.root]:
+                return
+            quarter = 1 << (self.levels[self.root] - 2)
+            self.root = inner
+            self.origin_x += quarter
+            self.origin_y += quarter
+
+    def get_base_successor(self, node):
+        """Middle 2 by 2 cells of a 4 by 4 node one generation on, leaf slots are their cell values"""
+        nw, ne, sw, se = self.nw, self.ne, self.sw, self.se
+        a, b, c, d = nw[node], ne[node], sw[node], se[node]
+        grid = [[nw[a], ne[a], nw[b], ne[b]],
+                [sw[a], se[a], sw[b], se[b]],
+                [nw[c], ne[c], nw[d], ne[d]],
+                [sw[c], se[c], sw[d], se[d]]]
+
+        cells = []
+        for y in (1, 2):
+            for x in (1, 2):
+                count = sum(grid[y + dy][x + dx] for dy in (-1, 0, 1) for dx in (-1, 0, 1)) - grid[y][x]
+                cells.append(1 if count == 3 or (count == 2 and grid[y][x]) else 0)
+        return self.join(*cells)
+
+    def get_successor(self, node, step_log):
+        """The middle half of node, 2 ** step_log generations on, step_log is at most the node's level - 2"""
+        level = self.levels[node]
+        if self.populations[node] == 0:
+            return self.get_empty(level - 1)
+        step_log = min(step_log, level - 2)
+
+        results = self.results.get(step_log)
+        if results is None:
+            results = self.results[step_log] = array("i", [-1]) * len(self.levels)
+        if results[node] >= 0:
+            return results[node]
+
+        if level == 2:
+            result = self.get_base_successor(node)
+        else:
+            nw, ne, sw, se, join, successor = self.nw, self.ne, self.sw, self.se, self.join, self.get_successor
+            a, b, c, d = nw[node], ne[node], sw[node], se[node]
+
+            # Nine overlapping nodes a level down, stepped by up to half the step
+            c1 = successor(a, step_log)
+            c2 = successor(join(ne[a], nw[b], se[a], sw[b]), step_log)
+            c3 = successor(b, step_log)
+            c4 = successor(join(sw[a], se[a], nw[c], ne[c]), step_log)
+            c5 = successor(join(se[a], sw[b], ne[c], nw[d]), step_log)
+            c6 = successor(join(sw[b], se[b], nw[d], ne[d]), step_log)
+            c7 = successor(c, step_log)
+            c8 = successor(join(ne[c], nw[d], se[c], sw[d]), step_log)
+            c9 = successor(d, step_log)
+
+            if step_log < level - 2:
+                # The nine already moved the whole step, only their middles are put together
+                result = join(join(se[c1], sw[c2], ne[c4], nw[c5]), join(se[c2], sw[c3], ne[c5], nw[c6]),
+                              join(se[c4], sw[c5], ne[c7], nw[c8]), join(se[c5], sw[c6], ne[c8], nw[c9]))
+            else:
+                # The nine moved half the step, the four nodes they make up take the other half
+                result = join(successor(join(c1, c2, c4, c5), step_log), successor(join(c2, c3, c5, c6), step_log),
+                              successor(join(c4, c5, c7, c8), step_log), successor(join(c5, c6, c8, c9), step_log))
+
+        results[node] = result
+        return result
+
+    def step(self, generations):
+        """Advances by the generations, one memoised jump per set bit"""
+        for step_log in reversed(range(int(generations).bit_length())):
+            if not generations >> step_log & 1:
+                continue
+
+            # Enough empty border that nothing can leave the root during the jump
+            while (self.levels[self.root] < step_log + 2 or
+                   self.populations[self.get_inner(self.root)] != self.populations[self.root]):
+                self.expand()
+
+            # The successor of the centered root covers the root's own cells
+            self.root = self.get_successor(self.get_centered(self.root), step_log)
+            self.generation += 1 << step_log
+            self.crop()
+
+            if len(self.levels) > self.max_nodes:
+                self.collect_garbage()
+
+    def collect_garbage(self):
+        """Drops every node the root and the empty nodes don't use, the kept nodes are moved down to fill the gaps"""
+        start = time.perf_counter()
+        node_count = len(self.levels)
+
+        # Mark
+        marked = bytearray(node_count)
+        marked[0] = marked[1] = 1
+        stack = [self.root, *self.empty_nodes]
+        while stack:
+            node = stack.pop()
+            if not marked[node]:
+                marked[node] = 1
+                stack += (self.nw[node], self.ne[node], self.sw[node], self.se[node])
+
+        # Slots only grow from children to parents, so one pass in order remaps everything
+        remap = array("i", [-1]) * node_count
+        nw, ne, sw, se = array("i"), array("i"), array("i"), array("i")
+        levels, populations, nodes = array("b"), array("q"), {}
+        for node in range(node_count):
+            if not marked[node]:
+                continue
+            slot = len(levels)
+            remap[node] = slot
+            if node > 1:
+                children = (remap[self.nw[node]], remap[self.ne[node]], remap[self.sw[node]], remap[self.se[node]])
+                nodes[(children[0] << 96) | (children[1] << 64) | (children[2] << 32) | children[3]] = slot
+            else:
+                children = (0, 0, 0, 0)
+            nw.append(children[0])
+            ne.append(children[1])
+            sw.append(children[2])
+            se.append(children[3])
+            levels.append(self.levels[node])
+            populations.append(self.populations[node])
+
+        # Results survive when both ends do
+        for step_log, old_results in self.results.items():
+            results = array("i", [-1]) * len(levels)
+            for node in range(node_count):
+                if marked[node] and old_results[node] >= 0 and marked[old_results[node]]:
+                    results[remap[node]] = remap[old_results[node]]
+            self.results[step_log] = results
+
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.levels, self.populations, self.nodes = levels, populations, nodes
+        self.root = remap[self.root]
+        self.empty_nodes = [remap[node] for node in self.empty_nodes]
+        print(f"HashLife: collected {node_count - len(levels)} of {node_count} nodes in "
+              f"{time.perf_counter() - start:.2f}s")
+
+    def set_cells(self, cells, x=0, y=0):
+        cells = np.asarray(cells, dtype=bool)
+        height, width = cells.shape
+
+        # Grow the root until the region is inside it
+        while True:
+            size = 1 << self.levels[self.root]
+            if (self.origin_x <= x and self.origin_y <= y and x + width <= self.origin_x + size and
+                    y + height <= self.origin_y + size):
+                break
+            self.expand()
+
+        def write(node, level, node_x, node_y):
+            size = 1 << level
+            left, right = max(node_x, x), min(node_x + size, x + width)
+            top, bottom = max(node_y, y), min(node_y + size, y + height)
+            if left >= right or top >= bottom:
+                return node
+
+            # Covered entirely by dead cells
+            covered = left == node_x and right == node_x + size and top == node_y and bottom == node_y + size
+            if covered and not cells[top - y:bottom - y, left - x:right - x].any():
+                return self.get_empty(level)
+
+            if level == 0:
+                return int(cells[node_y - y, node_x - x])
+
+            half = size >> 1
+            return self.join(write(self.nw[node], level - 1, node_x, node_y),
+                             write(self.ne[node], level - 1, node_x + half, node_y),
+                             write(self.sw[node], level - 1, node_x, node_y + half),
+                             write(self.se[node], level - 1, node_x + half, node_y + half))
+
+        self.root = write(self.root, self.levels[self.root], self.origin_x, self.origin_y)
+
+    def visit(self, node, level, node_x, node_y, left, top, right, bottom, smallest_level, callback):
+        """Calls callback(node, level, x, y) for the live nodes of smallest_level overlapping the rectangle"""
+        size = 1 << level
+        if (self.populations[node] == 0 or node_x >= right or node_y >= bottom or node_x + size <= left or
+                node_y + size <= top):
+            return
+        if level <= smallest_level:
+            callback(node, level, node_x, node_y)
+            return
+
+        half = size >> 1
+        self.visit(self.nw[node], level - 1, node_x, node_y, left, top, right, bottom, smallest_level, callback)
+        self.visit(self.ne[node], level - 1, node_x + half, node_y, left, top, right, bottom, smallest_level, callback)
+        self.visit(self.sw[node], level - 1, node_x, node_y + half, left, top, right, bottom, smallest_level, callback)
+        self.visit(self.se[node], level - 1, node_x + half, node_y + half, left, top, right, bottom, smallest_level,
+                   callback)
+
+    def get_cells(self, x, y, width, height):
+        cells = np.zeros((height, width), dtype=bool)
+
+        def set_cell(node, level, node_x, node_y):
+            cells[node_y - y, node_x - x] = True
+
+        self.visit(self.root, self.levels[self.root], self.origin_x, self.origin_y, x, y, x + width, y + height, 0,
+                   set_cell)
+        return cells
+
+    def get_population(self):
+        return self.populations[self.root]
+
+    def get_image(self, x, y, scale, image_width, image_height):
+        if scale < 1.0:
+            # Zoomed in, every pixel shows one cell
+            left, top = int(np.floor(x)), int(np.floor(y))
+            columns = np.floor(x + np.arange(image_width) * scale).astype(np.int64) - left
+            rows = np.floor(y + np.arange(image_height) * scale).astype(np.int64) - top
+            cells = self.get_cells(left, top, int(columns[-1]) + 1, int(rows[-1]) + 1)
+            values = cells[rows][:, columns].astype(np.float32)
+        else:
+            # Zoomed out, the populations of nodes no bigger than a pixel land in the pixel under their middle
+            smallest_level = max(int(np.log2(scale)), 0)
+            pixels_x, pixels_y, counts = [], [], []
+
+            def add_node(node, level, node_x, node_y):
+                middle = (1 << level) / 2
+                pixels_x.append(int((node_x + middle - x) // scale))
+                pixels_y.append(int((node_y + middle - y) // scale))
+                counts.append(self.populations[node])
+
+            self.visit(self.root, self.levels[self.root], self.origin_x, self.origin_y, int(np.floor(x)),
+                       int(np.floor(y)), int(np.ceil(x + image_width * scale)),
+                       int(np.ceil(y + image_height * scale)), smallest_level, add_node)
+
+            values = np.zeros((image_height, image_width), dtype=np.float32)
+            pixels_x, pixels_y = np.array(pixels_x, dtype=np.int64), np.array(pixels_y, dtype=np.int64)
+            inside = (pixels_x >= 0) & (pixels_x < image_width) & (pixels_y >= 0) & (pixels_y < image_height)
+            np.add.at(values, (pixels_y[inside], pixels_x[inside]), np.array(counts, dtype=np.float32)[inside])
+            values = np.minimum(values / (scale * scale), 1.0)
+
+        image = np.empty((image_height, image_width, 4), dtype=np.uint8)
+        image[..., :3] = (values * 255).astype(np.uint8)[..., np.newaxis]
+        image[..., 3] = 255
+        return image
+
+
+if __name__ == '__main__':
+    # Gosper glider gun, it adds a glider every 30 generations forever
+    glider_gun = "24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4bobo$10bo5bo7bo$11bo3bo$12b2o!"
+    life = HashLife()
+    life.load_rle(glider_gun)
+    for power in (10, 20, 30, 40):
+        start = time.perf_counter()
+        life.step((1 << power) - life.generation)
+        print(f"Generation 2^{power}: population {life.get_population()}, {len(life.levels)} nodes, "
+              f"{time.perf_counter() - start:.3f}s")
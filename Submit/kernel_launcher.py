@@ -0,0 +1,38 @@
+import pyopencl as cl
+
+
+class KernelLauncher:
+    """One kernel created once with its arguments bound, launching only re-sets the arguments that changed"""
+
+    def __init__(self, cl_queue, program, kernel_name, global_size, local_size=None):
+        self.cl_queue = cl_queue
+        self.kernel_name = kernel_name
+        self.kernel = cl.Kernel(program, kernel_name)
+        self.global_size = tuple(global_size)
+        self.local_size = None if local_size is None else tuple(local_size)
+
+    def set_args(self, *args):
+        """Binds every argument, buffers only need binding again when they are replaced"""
+        self.kernel.set_args(*args)
+
+    def set_arg(self, index, value):
+        """Updates a single argument, scalars must be numpy scalars of the kernel's type"""
+        self.kernel.set_arg(index, value)
+
+    def set_global_size(self, global_size):
+        self.global_size = tuple(global_size)
+
+    def set_local_size(self, local_size):
+        """None leaves the work-group shape to the driver"""
+        self.local_size = None if local_size is None else tuple(local_size)
+
+    def get_padded_global_size(self):
+        """Global size rounded up to whole work-groups, the kernels skip the padding items by their bounds checks"""
+        if self.local_size is None:
+            return self.global_size
+        return tuple(-(-size // local) * local for size, local in zip(self.global_size, self.local_size))
+
+    def __call__(self, wait_for=None):
+        """Enqueues the kernel with the arguments currently bound"""
+        return cl.enqueue_nd_range_kernel(self.cl_queue, self.kernel, self.get_padded_global_size(), self.local_size,
+                                          wait_for=wait_for)
@@ -0,0 +1,82 @@
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+def parse_rle(text):
+    """Reads a pattern in the run length encoded format, returns its cells as a bool array indexed [y, x]"""
+    rows, row = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        # Comments and the "x = 3, y = 3, rule = B3/S23" header
+        if not line or line.startswith("#") or line.startswith("x"):
+            continue
+
+        for count, tag in re.findall(r"(\d*)([a-zA-Z$!])", line):
+            count = int(count) if count else 1
+            if tag == "!":
+                rows.append(row)
+                return to_cells(rows)
+            if tag == "$":
+                rows.append(row)
+                rows.extend([] for _ in range(count - 1))
+                row = []
+            else:
+                # Every state but b is alive, multi-state patterns come out as their live cells
+                row.extend([tag != "b"] * count)
+
+    rows.append(row)
+    return to_cells(rows)
+
+
+def to_cells(rows):
+    width = max((len(row) for row in rows), default=0)
+    cells = np.zeros((len(rows), width), dtype=bool)
+    for y, row in enumerate(rows):
+        cells[y, :len(row)] = row
+    return cells
+
+
+class LifeEngine(ABC):
+    """
+    Common interface of the Game of Life engines, the GameOfLife app shows any of them.
+    Cells are addressed by (x, y) with y growing downwards, cells passed in and out are 2D bool arrays indexed [y, x].
+    """
+
+    def __init__(self):
+        self.generation = 0
+
+    def load_rle(self, text, x=0, y=0):
+        """Writes a run length encoded pattern with its top left corner at (x, y), returns its cells"""
+        cells = parse_rle(text)
+        self.set_cells(cells, x, y)
+        return cells
+
+    @abstractmethod
+    def set_cells(self, cells, x=0, y=0):
+        """Writes the cells with their top left corner at (x, y)"""
+        pass
+
+    @abstractmethod
+    def get_cells(self, x, y, width, height):
+        """Reads the width by height cells starting at (x, y), cells the engine doesn't hold are dead"""
+        pass
+
+    @abstractmethod
+    def step(self, generations):
+        """Advances the board by the number of generations"""
+        pass
+
+    @abstractmethod
+    def get_population(self):
+        """Number of live cells"""
+        pass
+
+    @abstractmethod
+    def get_image(self, x, y, scale, image_width, image_height):
+        """
+        RGBA image of the viewport starting at cell (x, y), one pixel per scale by scale cells. Zoomed out, the
+        brightness of a pixel is how many of its cells are alive.
+        """
+        pass
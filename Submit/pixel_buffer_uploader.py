@@ -0,0 +1,66 @@
+import ctypes
+
+import numpy as np
+import pyopencl as cl
+from OpenGL.GL import *
+
+
+class PixelBufferUploader:
+    """
+    Moves RGBA pixels from an OpenCL buffer into a GL texture without either side waiting on the other.
+
+    Each upload starts a non-blocking OpenCL copy into a mapped pixel buffer object of the ring, and hands the copy
+    started the frame before to the texture, which GL then reads from the pixel buffer on its own time. The texture
+    shows the previous frame's pixels, one frame behind.
+    """
+
+    def __init__(self, cl_queue, texture, width, height, ring_size=2):
+        self.cl_queue = cl_queue
+        self.texture = texture
+        self.width = width
+        self.height = height
+        self.nbytes = width * height * 4
+
+        self.pixel_buffers = [glGenBuffers(1) for _ in range(ring_size)]
+        for pixel_buffer in self.pixel_buffers:
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+            glBufferData(GL_PIXEL_UNPACK_BUFFER, self.nbytes, None, GL_STREAM_DRAW)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.next_slot = 0
+        self.pending = None
+
+    def upload(self, pixels_buffer, wait_for=None):
+        """Starts copying pixels_buffer over and puts the previous frame's pixels into the texture"""
+        self.finish_pending()
+
+        # Orphan the slot's storage so mapping it never waits for GL to finish reading it
+        slot = self.next_slot
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pixel_buffers[slot])
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, self.nbytes, None, GL_STREAM_DRAW)
+        pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, self.nbytes,
+                                   GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        mapped = np.ctypeslib.as_array((ctypes.c_ubyte * self.nbytes).from_address(pointer))
+        event = cl.enqueue_copy(self.cl_queue, mapped, pixels_buffer, is_blocking=False, wait_for=wait_for)
+        self.cl_queue.flush()
+
+        self.pending = (slot, event, mapped)
+        self.next_slot = (slot + 1) % len(self.pixel_buffers)
+
+    def finish_pending(self):
+        """Waits for the copy in flight, normally done since the last frame, and has GL upload it"""
+        if self.pending is None:
+            return
+        slot, event, _ = self.pending
+        self.pending = None
+        event.wait()
+
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pixel_buffers[slot])
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE,
+                        ctypes.c_void_p(0))
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
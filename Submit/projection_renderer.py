@@ -0,0 +1,104 @@
+from OpenGL.GL import *
+import numpy as np
+
+
+class ProjectionRenderer:
+    def __init__(self, shader_program, texture_size, aspect_ratio):
+        self.shader_program = shader_program
+        self.texture_size = texture_size
+
+        # One texture per projection axis
+        self.textures = [self.initialize_texture(texture_size) for _ in range(3)]
+
+        # Get rendering buffers
+        self.vao, self.vbo = self.setup_rendering(aspect_ratio)
+
+        self.texture_location = glGetUniformLocation(self.shader_program, "texture1")
+
+    @staticmethod
+    def initialize_texture(texture_size):
+        """Single channel float texture, swizzled so the 2D fragment shader shows it in grey"""
+        texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_SWIZZLE_G, GL_RED)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_SWIZZLE_B, GL_RED)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_SWIZZLE_A, GL_ONE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_R32F, texture_size, texture_size, 0, GL_RED, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        return texture
+
+    def resize(self, texture_size):
+        """Reallocates the textures for projections of a new size"""
+        glDeleteTextures(self.textures)
+        self.texture_size = texture_size
+        self.textures = [self.initialize_texture(texture_size) for _ in range(3)]
+
+    @staticmethod
+    def setup_rendering(aspect_ratio):
+        """Three quads side by side, kept square for the window's aspect ratio"""
+        quad_width = 2.0 / 3.0
+        quad_height = min(quad_width * aspect_ratio, 2.0)
+
+        vertex_data = []
+        for i in range(3):
+            left = -1.0 + i * quad_width
+            right = left + quad_width
+            bottom = -quad_height / 2
+            top = quad_height / 2
+            vertex_data += [
+                left, bottom, 0.0, 0.0,  # Triangle 1, Bottom-left
+                right, bottom, 1.0, 0.0,  # Triangle 1, Bottom-right
+                left, top, 0.0, 1.0,  # Triangle 1, Top-left
+                right, bottom, 1.0, 0.0,  # Triangle 2, Bottom-right
+                left, top, 0.0, 1.0,  # Triangle 2, Top-left
+                right, top, 1.0, 1.0  # Triangle 2, Top-right
+            ]
+        vertex_data = np.array(vertex_data, dtype=np.float32)
+
+        vao = glGenVertexArrays(1)
+        glBindVertexArray(vao)
+
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
+
+        # Position attribute
+        glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(0)
+        # Texture coordinate attribute
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 4 * vertex_data.itemsize, ctypes.c_void_p(2 * vertex_data.itemsize))
+        glEnableVertexAttribArray(1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindVertexArray(0)
+
+        return vao, vbo
+
+    def update_projections(self, projections):
+        """Uploads the (3, size, size) projection images into the textures"""
+        for texture, image in zip(self.textures, projections):
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.texture_size, self.texture_size, GL_RED, GL_FLOAT, image)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def draw(self):
+        """Draws the three projections as textured quads"""
+        glUseProgram(self.shader_program)
+        glActiveTexture(GL_TEXTURE0)
+        glUniform1i(self.texture_location, 0)
+
+        # Projections are flat, so don't let the depth buffer hide them
+        glDisable(GL_DEPTH_TEST)
+
+        glBindVertexArray(self.vao)
+        for i, texture in enumerate(self.textures):
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glDrawArrays(GL_TRIANGLES, i * 6, 6)
+
+        # Clean up
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+        glEnable(GL_DEPTH_TEST)
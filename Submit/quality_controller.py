@@ -0,0 +1,139 @@
+# Knobs the controller may turn: (attribute, side, values from best looking to cheapest).
+# The side says which timing the knob brings down, "simulate" for the stepping and readback, "render" for the rest.
+DEFAULT_KNOBS = [
+    ("sub_steps", "simulate", [4, 3, 2, 1]),
+    ("readback_interval", "simulate", [1, 2, 3, 4]),
+    ("instance_threshold", "render", [0.0, 0.05, 0.1, 0.2, 0.4]),
+    ("render_mode", "render", ["cubes", "points"]),
+]
+
+
+class QualityController:
+    """
+    Holds an engine at its target_framerate by turning quality knobs down under load and back up once there's room.
+
+    Reads the engine's frame_timings every frame and smooths them. When the frame runs over budget for a while, the
+    next knob of the more expensive side is turned one step cheaper. When it runs well under budget for a longer while,
+    the last change is undone. Undoing a change that then had to be made again doubles the wait before the next undo,
+    so the controller settles instead of flipping between two steps.
+    """
+
+    def __init__(self, engine, knobs=None, enabled=True, smoothing=0.1, over_budget=1.05, under_budget=0.6,
+                 degrade_frames=10, restore_frames=90, settle_frames=20, max_restore_frames=1800):
+        self.engine = engine
+        self.knobs = knobs if knobs is not None else DEFAULT_KNOBS
+        self.enabled = enabled
+        self.smoothing = smoothing
+        self.over_budget = over_budget
+        self.under_budget = under_budget
+        self.degrade_frames = degrade_frames
+        self.restore_frames = restore_frames
+        self.settle_frames = settle_frames
+        self.max_restore_frames = max_restore_frames
+
+        self.smoothed = {}
+        self.frames_over = 0
+        self.frames_under = 0
+        self.frames_settling = 0
+        self.frame = 0
+
+        # Attributes turned down, most recent last, and the one last turned back up
+        self.degraded = []
+        self.last_restored = None
+        self.restore_waits = {attribute: restore_frames for attribute, _, _ in self.knobs}
+
+        # Every change as (frame, attribute, old value, new value, smoothed frame time)
+        self.log = []
+
+    def get_budget(self):
+        return 1.0 / self.engine.target_framerate
+
+    def get_costs(self):
+        """Smoothed seconds per frame of the simulation and render sides, and of the frame as a whole"""
+        simulate = self.smoothed.get("simulate", 0.0)
+        frame = self.smoothed.get("frame", 0.0)
+
+        # Unthreaded, the simulation runs inside the frame's update, threaded it runs next to the frame
+        render = frame if self.engine.threaded else max(frame - simulate, 0.0)
+        return simulate, render, max(frame, simulate)
+
+    def update(self):
+        """Call once per frame after the frame_timings were recorded"""
+        self.frame += 1
+        # A snapshot, in threaded mode the simulation thread writes its timing meanwhile
+        for phase, seconds in list(self.engine.frame_timings.items()):
+            previous = self.smoothed.get(phase, seconds)
+            self.smoothed[phase] = previous + (seconds - previous) * self.smoothing
+
+        if not self.enabled:
+            return
+
+        # Give the timings time to show the effect of the last change
+        if self.frames_settling:
+            self.frames_settling -= 1
+            return
+
+        simulate, render, load = self.get_costs()
+        budget = self.get_budget()
+
+        self.frames_over = self.frames_over + 1 if load > budget * self.over_budget else 0
+        self.frames_under = self.frames_under + 1 if load < budget * self.under_budget else 0
+
+        if self.frames_over >= self.degrade_frames:
+            self.degrade("simulate" if simulate >= render else "render")
+        elif self.degraded and self.frames_under >= self.restore_waits[self.degraded[-1]]:
+            self.restore()
+
+    def degrade(self, side):
+        """Turns the first knob that can still go cheaper one step down, preferring the given side"""
+        ordered = sorted(self.knobs, key=lambda knob: knob[1] != side)
+        for attribute, _, values in ordered:
+            value = getattr(self.engine, attribute)
+            # Values the user picked outside the knob's range are left alone
+            if value in values and values.index(value) + 1 < len(values):
+                # Turning straight back down what was just turned up means the room wasn't really there
+                if attribute == self.last_restored:
+                    self.restore_waits[attribute] = min(self.restore_waits[attribute] * 2, self.max_restore_frames)
+                self.last_restored = None
+
+                self.set_knob(attribute, values[values.index(value) + 1])
+                self.degraded.append(attribute)
+                return
+        self.reset_counters()
+
+    def restore(self):
+        """Undoes the most recent degrade"""
+        attribute = self.degraded.pop()
+        values = next(values for name, _, values in self.knobs if name == attribute)
+        value = getattr(self.engine, attribute)
+        if value in values and values.index(value) > 0:
+            self.set_knob(attribute, values[values.index(value) - 1])
+            self.last_restored = attribute
+        else:
+            self.reset_counters()
+
+    def get_undegraded_values(self):
+        """The values the degraded knobs had before the controller turned them down, as attribute: value"""
+        undegraded = {}
+        for attribute, _, values in self.knobs:
+            value = getattr(self.engine, attribute)
+            steps = self.degraded.count(attribute)
+            if steps and value in values:
+                undegraded[attribute] = values[max(values.index(value) - steps, 0)]
+        return undegraded
+
+    def set_knob(self, attribute, value):
+        old_value = getattr(self.engine, attribute)
+        setattr(self.engine, attribute, value)
+
+        simulate, render, load = self.get_costs()
+        self.log.append((self.frame, attribute, old_value, value, load))
+        print(f"Quality: {attribute} {old_value} -> {value} (frame {load * 1000:.1f} ms of "
+              f"{self.get_budget() * 1000:.1f} ms, simulate {simulate * 1000:.1f} ms, render {render * 1000:.1f} ms)")
+
+        self.reset_counters()
+        self.frames_settling = self.settle_frames
+
+    def reset_counters(self):
+        self.frames_over = 0
+        self.frames_under = 0
@@ -0,0 +1,163 @@
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+RING_MAGIC = 0x534C494D  # "SLIM"
+RING_VERSION = 1
+
+RING_HEADER_DTYPE = np.dtype([
+    ('magic', np.uint32),
+    ('version', np.uint32),
+    ('slot_count', np.uint32),
+    ('max_instances', np.uint32),
+    ('latest_frame', np.uint64),  # Newest fully written frame, 0 before the first
+])
+
+# Written before and after the instances of every slot, the sequence is odd while the slot is being written
+SLOT_HEADER_DTYPE = np.dtype([
+    ('sequence', np.uint64),
+    ('frame', np.uint64),
+    ('instance_count', np.uint32),
+    ('simulation_size', np.uint32),
+    ('spore_count', np.uint32),
+    ('step_rate', np.float32),
+    ('spore_speed', np.float32),
+    ('decay_speed', np.float32),
+    ('turn_speed', np.float32),
+    ('sensor_distance', np.float32),
+    ('trail_mass', np.float64),
+    ('occupied_voxels', np.uint64),
+    ('bounce_rate', np.float64),
+])
+
+# Slots start on cache lines
+ALIGNMENT = 64
+
+
+def align(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+class SharedFrameRing:
+    """
+    Ring of frames (culled instances plus their header) in shared memory, written by one simulation server and
+    read zero-copy by any number of viewers.
+
+    Every slot is a seqlock: the writer makes its sequence odd, writes, then makes it even again and never waits
+    for anyone. A reader takes the newest slot, uses its arrays in place and checks afterwards with is_intact that
+    the sequence didn't move, otherwise the frame was overwritten meanwhile and gets dropped.
+    """
+
+    def __init__(self, name, max_instances=0, slot_count=3, create=False):
+        self.name = name
+        self.create = create
+
+        if create:
+            self.slot_count = slot_count
+            self.max_instances = max_instances
+            try:
+                self.shared_memory = shared_memory.SharedMemory(name=name, create=True, size=self.get_size())
+            except FileExistsError:
+                # Left behind by a server that crashed, nobody writes to it anymore
+                print(f"Replacing stale shared memory {name}")
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shared_memory = shared_memory.SharedMemory(name=name, create=True, size=self.get_size())
+        else:
+            self.shared_memory = self.attach(name)
+            header = np.ndarray(1, RING_HEADER_DTYPE, self.shared_memory.buf)[0]
+            if header['magic'] != RING_MAGIC or header['version'] != RING_VERSION:
+                self.shared_memory.close()
+                raise ValueError(f"Shared memory {name} is not a frame ring of version {RING_VERSION}")
+            self.slot_count = int(header['slot_count'])
+            self.max_instances = int(header['max_instances'])
+
+        self.header = np.ndarray(1, RING_HEADER_DTYPE, self.shared_memory.buf)
+        self.slots = [self.get_slot_views(slot) for slot in range(self.slot_count)]
+
+        if create:
+            self.header[0] = (RING_MAGIC, RING_VERSION, self.slot_count, self.max_instances, 0)
+
+    @staticmethod
+    def attach(name):
+        """Maps an existing ring without letting this process's exit unlink it"""
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every process that maps a block registers it for unlinking at exit
+            memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(memory._name, "shared_memory")
+            return memory
+
+    def get_slot_size(self):
+        return align(SLOT_HEADER_DTYPE.itemsize) + align(self.max_instances * 4 * 4)
+
+    def get_size(self):
+        return align(RING_HEADER_DTYPE.itemsize) + self.slot_count * self.get_slot_size()
+
+    def get_slot_views(self, slot):
+        """Header, positions and sizes of a slot, as arrays over the shared memory"""
+        offset = align(RING_HEADER_DTYPE.itemsize) + slot * self.get_slot_size()
+        buffer = self.shared_memory.buf
+
+        header = np.ndarray(1, SLOT_HEADER_DTYPE, buffer, offset)
+        offset += align(SLOT_HEADER_DTYPE.itemsize)
+        positions = np.ndarray((self.max_instances, 3), np.float32, buffer, offset)
+        sizes = np.ndarray(self.max_instances, np.float32, buffer, offset + self.max_instances * 3 * 4)
+        return header, positions, sizes
+
+    def write(self, instance_positions, instance_sizes, **info):
+        """Writes a frame into the next slot, instances past the ring's capacity are dropped"""
+        frame = int(self.header[0]['latest_frame']) + 1
+        header, positions, sizes = self.slots[frame % self.slot_count]
+        count = min(len(instance_sizes), self.max_instances)
+
+        header['sequence'] += 1
+        positions[:count] = instance_positions[:count]
+        sizes[:count] = instance_sizes[:count]
+        header['frame'] = frame
+        header['instance_count'] = count
+        for key, value in info.items():
+            header[key] = value
+        header['sequence'] += 1
+
+        self.header[0]['latest_frame'] = frame
+        return frame
+
+    def read_latest(self):
+        """
+        Newest frame as a dict of its header fields plus 'positions' and 'sizes' arrays that map the shared memory,
+        None if there is no complete frame. Check is_intact after using the arrays.
+        """
+        frame = int(self.header[0]['latest_frame'])
+        if frame == 0:
+            return None
+
+        header, positions, sizes = self.slots[frame % self.slot_count]
+        sequence = int(header[0]['sequence'])
+        if sequence % 2 or int(header[0]['frame']) != frame:
+            return None
+
+        result = {name: header[0][name].item() for name in SLOT_HEADER_DTYPE.names}
+        count = min(result['instance_count'], self.max_instances)
+        result['positions'] = positions[:count]
+        result['sizes'] = sizes[:count]
+
+        # The header might have changed while being copied
+        if int(header[0]['sequence']) != sequence:
+            return None
+        return result
+
+    def is_intact(self, frame):
+        """Whether the frame's slot is still unchanged since read_latest"""
+        header = self.slots[frame['frame'] % self.slot_count][0]
+        return int(header[0]['sequence']) == frame['sequence']
+
+    def close(self):
+        # The views have to go before the mapping can close
+        self.header = None
+        self.slots = []
+        self.shared_memory.close()
+        if self.create:
+            self.shared_memory.unlink()
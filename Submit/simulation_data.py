@@ -0,0 +1,102 @@
+import numpy as np
+
+# Matches the Spore struct in Shaders/3d_simulation.cl
+SPORE_DTYPE = np.dtype([
+    ('x', np.float32),  # Position Vector
+    ('y', np.float32),
+    ('z', np.float32),
+    ('pad', np.float32),  # Padding for data
+    ('dir_x', np.float32),  # Directino Vector
+    ('dir_y', np.float32),
+    ('dir_z', np.float32),
+    ('pad2', np.float32),  # Padding for data
+])
+
+# Matches the Settings struct in Shaders/3d_simulation.cl
+SETTINGS_DTYPE = np.dtype([
+    ('spore_count', np.uint32),
+    ('simulation_size', np.uint32),
+    ('spore_speed', np.float32),
+    ('decay_speed', np.float32),
+    ('turn_speed', np.float32),
+    ('sensor_distance', np.float32),
+    ('boundary_mode', np.uint32),  # Index into BOUNDARY_MODES
+])
+
+# Matches the Spore struct in Shaders/2d_simulation.cl
+SPORE_2D_DTYPE = np.dtype([
+    ('x', np.float32),  # Position Vector
+    ('y', np.float32),
+    ('angle', np.float32),  # Heading in radians
+    ('seed', np.uint32),  # Random state, in what would be padding
+])
+
+# Matches the Settings struct in Shaders/2d_simulation.cl
+SETTINGS_2D_DTYPE = np.dtype([
+    ('spore_count', np.uint32),
+    ('width', np.uint32),
+    ('height', np.uint32),
+    ('spore_speed', np.float32),
+    ('decay_speed', np.float32),
+    ('turn_speed', np.float32),
+    ('sensor_distance', np.float32),
+    ('diffuse_speed', np.float32),
+])
+
+# Spawn distributions of the initialize_spores kernel, in the order of its distribution argument
+SPORE_DISTRIBUTIONS = ["cube", "sphere shell", "point source"]
+
+# Boundary modes of Shaders/3d_simulation.cl, in the order of the Settings boundary_mode values
+BOUNDARY_MODES = ["bounce", "periodic"]
+
+
+def get_empty_volume(simulation_size):
+    """Generates empty volume by the simulation size"""
+    return np.zeros((simulation_size, simulation_size, simulation_size), dtype=np.float32)
+
+
+def get_random_spores(spore_count, simulation_size):
+    """Creates spores with random positions inside the volume and random unit directions"""
+    # Initialize empty array of spores
+    spores = np.zeros(spore_count, dtype=SPORE_DTYPE)
+
+    # Randomize positions within the bounds of the simulation size
+    spores['x'] = np.random.uniform(0, simulation_size, size=spore_count)
+    spores['y'] = np.random.uniform(0, simulation_size, size=spore_count)
+    spores['z'] = np.random.uniform(0, simulation_size, size=spore_count)
+
+    # Generate random direction vectors and normalize them
+    directions = np.random.randn(spore_count, 3)  # Generate random directions
+    norms = np.linalg.norm(directions, axis=1)[:, np.newaxis]  # Calculate norms
+    normalized_directions = directions / norms  # Normalize
+
+    # Assign normalized directions to spores
+    spores['dir_x'] = normalized_directions[:, 0]
+    spores['dir_y'] = normalized_directions[:, 1]
+    spores['dir_z'] = normalized_directions[:, 2]
+
+    return spores
+
+# Matches the BatchSpore struct in Shaders/batch_simulation.cl
+BATCH_SPORE_DTYPE = np.dtype([
+    ('spore', SPORE_DTYPE),
+    ('batch_id', np.uint32),  # Which simulation of the batch the spore belongs to
+    ('pad', np.uint32, 3),  # Padding for data
+])
+
+# Matches the Spore struct in Shaders/3d_simulation.cl when it's built with SPECIES_COUNT
+SPECIES_SPORE_DTYPE = np.dtype([
+    ('spore', SPORE_DTYPE),
+    ('species', np.uint32),  # Which species the spore belongs to
+    ('pad', np.uint32, 3),  # Padding for data
+])
+
+# Matches the SpeciesSettings struct in Shaders/species_simulation.cl
+SPECIES_SETTINGS_DTYPE = np.dtype([
+    ('spore_speed', np.float32),
+    ('decay_speed', np.float32),
+    ('turn_speed', np.float32),
+    ('sensor_distance', np.float32),
+    ('repulsion', np.float32),  # Weight of the other species' trails, pushing away
+    ('pad', np.float32, 3),  # Padding for data
+])
@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+import pyopencl as cl
+
+from kernel_launcher import KernelLauncher
+from time_series import TimeSeriesWriter
+
+# Must match the METRIC_* defines in Shaders/3d_simulation.cl
+METRIC_BOUNCES = 0
+METRIC_OCCUPIED = 1
+METRIC_HISTOGRAM = 2
+METRIC_MAX_BINS = 64
+
+
+class SimulationMetrics:
+    """
+    Streams statistics of a Simulation3D to a time series without reading back the volume.
+
+    Every sample_interval steps work-group reductions on the device fill a few small buffers (per group trail mass
+    and spore sums, occupied and bounce counters, the value histogram). Those are copied back without blocking
+    and written out once the copy has finished, a later step.
+    """
+
+    def __init__(self, simulation, directory="metrics", sample_interval=10, histogram_bins=32,
+                 occupancy_threshold=0.05):
+        if histogram_bins > METRIC_MAX_BINS:
+            raise ValueError(f"At most {METRIC_MAX_BINS} histogram bins are supported")
+
+        self.simulation = simulation
+        self.cl_queue = simulation.cl_queue
+        self.sample_interval = sample_interval
+        self.histogram_bins = histogram_bins
+        self.occupancy_threshold = occupancy_threshold
+
+        # Enough groups to fill the device, each group strides over its share
+        device = self.cl_queue.device
+        max_group_size = min(64, device.max_work_group_size)
+        self.group_size = 1 << (max_group_size.bit_length() - 1)
+        self.group_count = min(256, device.max_compute_units * 4)
+
+        # Device side results and the host arrays they're copied into
+        self.mass_partials = np.zeros(self.group_count, dtype=np.float32)
+        self.spore_partials = np.zeros((self.group_count, 4), dtype=np.float32)
+        self.counters = np.zeros(METRIC_HISTOGRAM + METRIC_MAX_BINS, dtype=np.uint32)
+        context = simulation.cl_context
+        self.mass_partials_buffer = cl.Buffer(context, cl.mem_flags.READ_WRITE, size=self.mass_partials.nbytes)
+        self.spore_partials_buffer = cl.Buffer(context, cl.mem_flags.READ_WRITE, size=self.spore_partials.nbytes)
+
+        # The simulation owns the counters since move_spores counts the bounces into them
+        self.counters_buffer = simulation.metric_counters_buffer
+
+        global_size = (self.group_count * self.group_size,)
+        local_size = (self.group_size,)
+        float_size = np.dtype(np.float32).itemsize
+        self.volume_metrics_launcher = KernelLauncher(self.cl_queue, simulation.program, "reduce_volume_metrics",
+                                                      global_size, local_size)
+        self.volume_metrics_launcher.set_args(None, simulation.settings_buffer, np.float32(occupancy_threshold),
+                                              np.uint32(histogram_bins), self.mass_partials_buffer,
+                                              self.counters_buffer, cl.LocalMemory(self.group_size * float_size))
+        self.spore_metrics_launcher = KernelLauncher(self.cl_queue, simulation.program, "reduce_spore_metrics",
+                                                     global_size, local_size)
+        self.spore_metrics_launcher.set_args(None, simulation.settings_buffer, self.spore_partials_buffer,
+                                             cl.LocalMemory(self.group_size * 4 * float_size))
+
+        self.writer = TimeSeriesWriter(directory, {
+            "step": (np.uint64, 1),
+            "time": (np.float64, 1),
+            "trail_mass": (np.float64, 1),
+            "occupied_voxels": (np.uint64, 1),
+            "centroid": (np.float64, 3),
+            "spread": (np.float64, 1),
+            "bounce_rate": (np.float64, 1),
+            "histogram": (np.uint64, histogram_bins),
+        })
+
+        self.step = 0
+        self.steps_since_sample = 0
+        self.start_time = time.perf_counter()
+        self.pending = None
+        self.latest = None
+
+    def update(self):
+        """Call once per simulation step, after the spores moved"""
+        self.step += 1
+        self.steps_since_sample += 1
+
+        if self.pending is not None and self.pending["event"].command_execution_status == cl.command_execution_status.COMPLETE:
+            self.write_pending()
+
+        if self.steps_since_sample >= self.sample_interval:
+            self.sample()
+
+    def sample(self):
+        """Runs the reductions and starts copying the results back"""
+        # Only one sample in flight, the previous one is nearly always done by now
+        if self.pending is not None:
+            self.pending["event"].wait()
+            self.write_pending()
+
+        simulation = self.simulation
+        self.volume_metrics_launcher.set_arg(0, simulation.volume_buffer)
+        self.volume_metrics_launcher()
+        self.spore_metrics_launcher.set_arg(0, simulation.spores_buffer)
+        self.spore_metrics_launcher()
+
+        # The queue is in order, so the counters are reset only after they've been copied
+        cl.enqueue_copy(self.cl_queue, self.mass_partials, self.mass_partials_buffer, is_blocking=False)
+        cl.enqueue_copy(self.cl_queue, self.spore_partials, self.spore_partials_buffer, is_blocking=False)
+        event = cl.enqueue_copy(self.cl_queue, self.counters, self.counters_buffer, is_blocking=False)
+        cl.enqueue_fill_buffer(self.cl_queue, self.counters_buffer, np.uint32(0), 0, self.counters.nbytes)
+        self.cl_queue.flush()
+
+        self.pending = {
+            "event": event,
+            "step": self.step,
+            "time": time.perf_counter() - self.start_time,
+            "steps": self.steps_since_sample,
+            "simulation_size": simulation.simulation_size,
+            "spore_count": simulation.spore_count,
+        }
+        self.steps_since_sample = 0
+
+    def write_pending(self):
+        """Turns the copied partial results into a row of the time series"""
+        pending, self.pending = self.pending, None
+        spore_count = max(pending["spore_count"], 1)
+        center = pending["simulation_size"] / 2
+
+        # Spore sums are relative to the volume center
+        sums = self.spore_partials.astype(np.float64).sum(axis=0)
+        offset = sums[:3] / spore_count
+        spread = np.sqrt(max(sums[3] / spore_count - np.dot(offset, offset), 0.0))
+
+        # Zero voxels were skipped on the device, they belong in the first bin
+        histogram = self.counters[METRIC_HISTOGRAM:METRIC_HISTOGRAM + self.histogram_bins].astype(np.uint64)
+        histogram[0] += pending["simulation_size"] ** 3 - histogram.sum()
+
+        self.latest = {
+            "step": pending["step"],
+            "time": pending["time"],
+            "trail_mass": self.mass_partials.astype(np.float64).sum(),
+            "occupied_voxels": int(self.counters[METRIC_OCCUPIED]),
+            "centroid": offset + center,
+            "spread": spread,
+            "bounce_rate": self.counters[METRIC_BOUNCES] / (spore_count * pending["steps"]),
+            "histogram": histogram,
+        }
+        self.writer.append(self.latest)
+
+    def close(self):
+        """Writes the sample still in flight and closes the series"""
+        if self.pending is not None:
+            self.pending["event"].wait()
+            self.write_pending()
+        self.writer.close()
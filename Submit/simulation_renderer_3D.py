@@ -1,9 +1,33 @@
 from OpenGL.GL import *
 import numpy as np
 
+# Define the 8 vertices of the cube
+CUBE_VERTICES = np.array([
+    -0.5, -0.5, -0.5,  # Vertex 0
+    0.5, -0.5, -0.5,  # Vertex 1
+    0.5, 0.5, -0.5,  # Vertex 2
+    -0.5, 0.5, -0.5,  # Vertex 3
+    -0.5, -0.5, 0.5,  # Vertex 4
+    0.5, -0.5, 0.5,  # Vertex 5
+    0.5, 0.5, 0.5,  # Vertex 6
+    -0.5, 0.5, 0.5  # Vertex 7
+], dtype=np.float32)
+
+# Define the 12 triangles (2 per face) that make up the cube
+CUBE_INDICES = np.array([
+    0, 1, 2, 2, 3, 0,  # Front face
+    1, 5, 6, 6, 2, 1,  # Right face
+    7, 6, 5, 5, 4, 7,  # Back face
+    4, 0, 3, 3, 7, 4,  # Left face
+    4, 5, 1, 1, 0, 4,  # Bottom face
+    3, 2, 6, 6, 7, 3  # Top face
+], dtype=np.uint32)
+
+
 class SimulationRenderer3D:
-    def __init__(self, shader_program, instance_positions, instance_sizes, vertices, indices):
+    def __init__(self, shader_program, instance_positions, instance_sizes, vertices, indices, point_shader_program=None):
         self.shader_program = shader_program
+        self.point_shader_program = point_shader_program
 
         # Get instance Buffers
         instances = self.get_instance_buffers(instance_positions, instance_sizes)
@@ -11,16 +35,23 @@ class SimulationRenderer3D:
 
         # Get rendering buffers
         self.vao, self.vbo, self.ebo = self.setup_rendering(vertices, indices)
+        self.point_vao = self.setup_point_rendering()
 
-        # Dict for storing the uniform locations
+        # Dicts for storing the uniform locations of the cube and point programs
         self.uniform_locations = {}
+        self.point_uniform_locations = {}
 
         glEnable(GL_DEPTH_TEST)  # Enable depth test
+        glEnable(GL_PROGRAM_POINT_SIZE)  # Let the point vertex shader set the sprite size
 
     def add_uniform_location(self, location_name):
         """Adds a uniform location to the Dict"""
         self.uniform_locations[location_name] = glGetUniformLocation(self.shader_program, location_name)
 
+    def add_point_uniform_location(self, location_name):
+        """Adds a uniform location of the point shader program to the Dict"""
+        self.point_uniform_locations[location_name] = glGetUniformLocation(self.point_shader_program, location_name)
+
     def get_instance_buffers(self, instance_positions, instance_sizes):
         # Generate and bind the buffer for instance positions
         instance_positions_vbo = glGenBuffers(1)
@@ -67,6 +98,34 @@ class SimulationRenderer3D:
 
         return vao, vbo, ebo
 
+    def setup_point_rendering(self):
+        """VAO for drawing each instance as a single point, reading the same instance buffers per vertex"""
+        point_vao = glGenVertexArrays(1)
+        glBindVertexArray(point_vao)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.position_instance_vbo)
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), ctypes.c_void_p(0))
+        glEnableVertexAttribArray(1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.size_instance_vbo)
+        glVertexAttribPointer(2, 1, GL_FLOAT, GL_FALSE, sizeof(GLfloat), ctypes.c_void_p(0))
+        glEnableVertexAttribArray(2)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        return point_vao
+
+    def draw_points(self, num_instances):
+        """Preview render function, draws every instance as one point sprite instead of 36 cube vertices"""
+        glBindVertexArray(self.point_vao)
+
+        glDrawArrays(GL_POINTS, 0, num_instances)
+
+        # Clean up
+        glBindVertexArray(0)
+        glUseProgram(0)
+
     def draw(self, num_instances):
         """Actual render function, num_instances is the number of cube instances being rendered"""
         # Bind VAO
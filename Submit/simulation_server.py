@@ -0,0 +1,146 @@
+import importlib
+import json
+import selectors
+import socket
+import time
+
+from shared_frame_ring import SharedFrameRing
+
+# The module name starts with a digit, so it can't be imported with a plain import statement
+Simulation3D = importlib.import_module("3D_simulation").Simulation3D
+
+RING_NAME = "slime_mold_frames"
+SETTINGS_PORT = 50007
+
+# Settings a viewer may change besides the spore count and simulation size
+FLOAT_SETTINGS = ("spore_speed", "decay_speed", "turn_speed", "sensor_distance")
+
+
+class SimulationServer:
+    """
+    Runs a headless Simulation3D and publishes every step's instances and metrics into a SharedFrameRing.
+
+    Viewers send settings back as lines of json over a local socket. The socket is only ever polled without
+    waiting, so viewers attaching, stalling or crashing never hold up the simulation.
+    """
+
+    def __init__(self, simulation_size=100, spore_count=100000, max_instances=2_000_000, ring_name=RING_NAME,
+                 port=SETTINGS_PORT, metrics_directory=None):
+        self.simulation = Simulation3D(800, 800, simulation_size, spore_count, headless=True,
+                                       metrics_directory=metrics_directory)
+        self.ring = SharedFrameRing(ring_name, max_instances, create=True)
+
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", port))
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.pending_lines = {}
+
+        self.step_rate = 0.0
+        self.running = False
+
+    def poll_settings(self):
+        """Accepts viewers and applies whatever settings they sent, never waits"""
+        for key, _ in self.selector.select(timeout=0):
+            if key.fileobj is self.listener:
+                connection, address = self.listener.accept()
+                connection.setblocking(False)
+                self.selector.register(connection, selectors.EVENT_READ)
+                self.pending_lines[connection] = b""
+                print("Viewer connected from", address)
+                continue
+
+            connection = key.fileobj
+            try:
+                data = connection.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                data = b""
+
+            if not data:
+                self.selector.unregister(connection)
+                del self.pending_lines[connection]
+                connection.close()
+                print("Viewer disconnected")
+                continue
+
+            *lines, self.pending_lines[connection] = (self.pending_lines[connection] + data).split(b"\n")
+            for line in lines:
+                try:
+                    self.apply_settings(json.loads(line))
+                except (ValueError, TypeError) as error:
+                    print("Ignoring bad settings message:", error)
+
+    def apply_settings(self, settings):
+        simulation = self.simulation
+        for name, value in settings.items():
+            if name in FLOAT_SETTINGS:
+                setattr(simulation, name, float(value))
+                simulation.update_settings_buffer()
+            elif name == "spore_count":
+                simulation.set_spore_count(int(value))
+            elif name == "simulation_size":
+                simulation.resize_simulation(int(value))
+            else:
+                print("Ignoring unknown setting:", name)
+
+    def publish(self, instance_positions, instance_sizes):
+        simulation = self.simulation
+        latest = simulation.metrics.latest if simulation.metrics and simulation.metrics.latest else {}
+        self.ring.write(instance_positions, instance_sizes,
+                        simulation_size=simulation.simulation_size, spore_count=simulation.spore_count,
+                        step_rate=self.step_rate, spore_speed=simulation.spore_speed,
+                        decay_speed=simulation.decay_speed, turn_speed=simulation.turn_speed,
+                        sensor_distance=simulation.sensor_distance, trail_mass=latest.get("trail_mass", 0.0),
+                        occupied_voxels=latest.get("occupied_voxels", 0), bounce_rate=latest.get("bounce_rate", 0.0))
+
+    def run(self, steps=None):
+        """Steps until stopped (or for the given number of steps), publishing every step"""
+        print(f"Serving frames in shared memory '{self.ring.name}', settings on port "
+              f"{self.listener.getsockname()[1]}")
+        last_step_time = time.perf_counter()
+        step = 0
+        self.running = True
+
+        try:
+            while self.running and (steps is None or step < steps):
+                self.poll_settings()
+
+                current_time = time.perf_counter()
+                delta_time = current_time - last_step_time
+                last_step_time = current_time
+                if delta_time > 0:
+                    self.step_rate = 0.9 * self.step_rate + 0.1 / delta_time
+
+                # Steps without a readback (readback_interval above 1) have nothing new to publish
+                result = self.simulation.simulate(delta_time)
+                if result is not None:
+                    _, (instance_positions, instance_sizes), _ = result
+                    self.publish(instance_positions, instance_sizes)
+                step += 1
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        """Ends run after the current step, for servers running on another thread"""
+        self.running = False
+
+    def close(self):
+        for connection in list(self.pending_lines):
+            connection.close()
+        self.selector.close()
+        self.listener.close()
+        self.ring.close()
+        if self.simulation.metrics:
+            self.simulation.metrics.close()
+
+
+if __name__ == '__main__':
+    server = SimulationServer(simulation_size=100, spore_count=100000)
+    server.run()
@@ -0,0 +1,185 @@
+import json
+import socket
+
+import glfw
+import glm
+import imgui
+import numpy as np
+from OpenGL.GL import *
+
+from camera_mover import CameraHandler3D
+from game_engine import GameEngine
+from shader_program import ShaderProgram
+from shared_frame_ring import SharedFrameRing
+from simulation_renderer_3D import CUBE_INDICES, CUBE_VERTICES, SimulationRenderer3D
+from simulation_server import RING_NAME, SETTINGS_PORT
+
+
+class SimulationViewer(GameEngine):
+    """
+    Window onto a running simulation_server.py. Frames are read straight out of the server's shared memory ring
+    and settings go back over its socket, the viewer can come and go without the server noticing.
+    """
+
+    def __init__(self, window_width, window_height, ring_name=RING_NAME, port=SETTINGS_PORT, title="Slime Mold Viewer",
+                 target_framerate=60):
+        super().__init__(window_width, window_height, title, None, target_framerate)
+        self.ring_name = ring_name
+        self.port = port
+        self.ring = None
+        self.connection = None
+        self.last_attach_time = -1.0
+
+        # Latest frame header, the GUI edits these and sends the changes
+        self.frame = None
+        self.settings = {"spore_speed": 17.0, "decay_speed": 0.4, "sensor_distance": 14.0, "turn_speed": 11.0,
+                         "spore_count": 0, "simulation_size": 0}
+        self.render_modes = ["cubes", "points"]
+        self.render_mode = "cubes"
+        self.framebuffer_width, self.framebuffer_height = glfw.get_framebuffer_size(self.window)
+
+        self.shader_program = ShaderProgram("Shaders/3D_vertex_shader.glsl", "Shaders/3D_fragment_shader.glsl")
+        self.point_shader_program = ShaderProgram("Shaders/3D_point_vertex_shader.glsl",
+                                                  "Shaders/3D_point_fragment_shader.glsl")
+
+        self.instance_count = 0
+        self.renderer = SimulationRenderer3D(self.shader_program.program, np.zeros((0, 3), dtype=np.float32),
+                                             np.zeros(0, dtype=np.float32), CUBE_VERTICES, CUBE_INDICES,
+                                             self.point_shader_program.program)
+        for name in ("simulationSize", "model", "view", "projection"):
+            self.renderer.add_uniform_location(name)
+            self.renderer.add_point_uniform_location(name)
+        self.renderer.add_point_uniform_location("viewportHeight")
+
+        self.model = glm.mat4(1.0)
+        self.simulation_size = 0
+        self.projection = glm.mat4(1.0)
+        self.camera_mover = CameraHandler3D(45.0, 45.0, glm.vec3(0), 1.0, 3, self.window)
+
+    def attach(self):
+        """Maps the ring and connects the settings socket, retried every second while the server isn't up"""
+        current_time = glfw.get_time()
+        if current_time - self.last_attach_time < 1.0:
+            return
+        self.last_attach_time = current_time
+
+        if self.ring is None:
+            try:
+                self.ring = SharedFrameRing(self.ring_name)
+            except (FileNotFoundError, ValueError):
+                return
+
+        if self.connection is None:
+            try:
+                self.connection = socket.create_connection(("127.0.0.1", self.port), timeout=0.1)
+                self.connection.setblocking(False)
+            except OSError:
+                self.connection = None
+
+    def send_settings(self, **settings):
+        """Sends settings to the server, dropped if it isn't reachable right now"""
+        if self.connection is None:
+            return
+        try:
+            self.connection.sendall((json.dumps(settings) + "\n").encode())
+        except OSError:
+            self.connection.close()
+            self.connection = None
+
+    def set_simulation_size(self, simulation_size):
+        """Points the camera at a simulation of the new size"""
+        self.simulation_size = simulation_size
+        camera_distance = simulation_size * 2.5
+        self.camera_mover.set_target(glm.vec3(simulation_size / 2), camera_distance)
+        self.projection = glm.perspective(glm.radians(45), self.window_width / self.window_height, 0.1,
+                                          camera_distance * 2)
+
+    def update(self):
+        self.attach()
+        self.camera_mover.update_view(self.delta_time)
+
+        if self.ring is None:
+            return
+
+        frame = self.ring.read_latest()
+        if frame is None or (self.frame and frame['frame'] == self.frame['frame']):
+            return
+
+        # Copied out of the shared memory first and dropped if the server overwrote the slot meanwhile, so a torn
+        # frame never reaches the VBO
+        positions, sizes = frame['positions'].copy(), frame['sizes'].copy()
+        if not self.ring.is_intact(frame):
+            return
+
+        self.renderer.update_instance_data(positions, sizes)
+        self.instance_count = len(sizes)
+        self.frame = {name: value for name, value in frame.items() if name not in ('positions', 'sizes')}
+        if self.frame['simulation_size'] != self.simulation_size:
+            self.set_simulation_size(self.frame['simulation_size'])
+            self.settings["simulation_size"] = self.simulation_size
+        if self.settings["spore_count"] == 0:
+            self.settings.update({name: self.frame[name] for name in self.settings})
+
+    def render(self):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        if not self.simulation_size:
+            return
+
+        if self.render_mode == "points":
+            glUseProgram(self.point_shader_program.program)
+            uniform_locations = self.renderer.point_uniform_locations
+            glUniform1f(uniform_locations["viewportHeight"], float(self.framebuffer_height))
+        else:
+            glUseProgram(self.shader_program.program)
+            uniform_locations = self.renderer.uniform_locations
+
+        glUniform1f(uniform_locations["simulationSize"], float(self.simulation_size))
+        glUniformMatrix4fv(uniform_locations["model"], 1, GL_FALSE, glm.value_ptr(self.model))
+        glUniformMatrix4fv(uniform_locations["view"], 1, GL_FALSE, glm.value_ptr(self.camera_mover.view))
+        glUniformMatrix4fv(uniform_locations["projection"], 1, GL_FALSE, glm.value_ptr(self.projection))
+
+        if self.render_mode == "points":
+            self.renderer.draw_points(self.instance_count)
+        else:
+            self.renderer.draw(self.instance_count)
+
+    def render_gui(self):
+        imgui.push_style_var(imgui.STYLE_ALPHA, 0.8)
+
+        if imgui.begin("Simulation Server"):
+            if self.frame is None:
+                imgui.text("Waiting for the server...")
+            else:
+                # Sliders send their change to the server, the next frames show the result
+                for name, label, low, high in (("spore_speed", "Spore Speed", 0.1, 30.0),
+                                               ("decay_speed", "Decay Speed", 0.01, 2.0),
+                                               ("sensor_distance", "Sensor Distance", 1.0, 20.0),
+                                               ("turn_speed", "Turn Speed", 0.0, 25.0)):
+                    changed, self.settings[name] = imgui.slider_float(label, self.settings[name], low, high)
+                    if changed:
+                        self.send_settings(**{name: self.settings[name]})
+
+                _, self.settings["spore_count"] = imgui.input_int("Spore Count", self.settings["spore_count"], 1000)
+                _, self.settings["simulation_size"] = imgui.input_int("Simulation Size",
+                                                                      self.settings["simulation_size"], 1)
+                if imgui.button("Apply"):
+                    self.send_settings(spore_count=self.settings["spore_count"],
+                                       simulation_size=self.settings["simulation_size"])
+
+                changed, mode_index = imgui.combo("Render Mode", self.render_modes.index(self.render_mode),
+                                                  self.render_modes)
+                if changed:
+                    self.render_mode = self.render_modes[mode_index]
+
+                imgui.text(f"Frame: {self.frame['frame']}  Server Steps/s: {self.frame['step_rate']:.0f}")
+                imgui.text(f"Instances: {self.instance_count}  Spores: {self.frame['spore_count']}")
+                imgui.text(f"Trail Mass: {self.frame['trail_mass']:.1f}  Bounce Rate: {self.frame['bounce_rate']:.4f}")
+                imgui.text("Settings: connected" if self.connection else "Settings: not connected")
+
+        imgui.end()
+        imgui.pop_style_var()
+
+
+if __name__ == '__main__':
+    viewer = SimulationViewer(800, 800)
+    viewer.run()
@@ -0,0 +1,396 @@
+import math
+import tempfile
+import time
+
+import numpy as np
+import pyopencl as cl
+
+from game_engine import GameEngine
+from kernel_launcher import KernelLauncher
+from simulation_data import BOUNDARY_MODES, SETTINGS_DTYPE, SPORE_DTYPE
+
+# Must match Shaders/sparse_simulation.cl
+BRICK_SIZE = 8
+BRICK_VOLUME = BRICK_SIZE ** 3
+BRICK_RESERVED = 0xFFFFFFFC
+BRICK_SPILLED = 0xFFFFFFFE
+BRICK_EMPTY = 0xFFFFFFFF
+STATUS_FREE_COUNT = 0
+STATUS_OVERFLOWS = 1
+STATUS_REQUESTS = 2
+
+
+class SparseVolume:
+    """
+    Trail volume stored as bricks of BRICK_SIZE^3 voxels, only bricks with trail in them take memory.
+
+    The device holds a page table with one entry per brick of the domain, a pool of brick slots, the brick each slot
+    holds, a stack of free slots and the step each slot was last drawn into. The kernels take slots off the stack on
+    the first deposit into a brick and put them back once it decays to zero. Between steps maintain() grows the pool
+    up to max_device_bricks, and past that spills the coldest bricks to a memory-mapped file on the host. Spilled
+    bricks read as empty and take no deposits until a sensor or spore asks for them, they're brought back by the next
+    maintain(), with the decay they missed taken off.
+    """
+
+    def __init__(self, cl_context, cl_queue, program, settings_buffer, simulation_size, initial_bricks=4096,
+                 max_device_bricks=None, request_capacity=4096, cold_steps=30):
+        self.cl_context = cl_context
+        self.cl_queue = cl_queue
+        self.settings_buffer = settings_buffer
+        self.simulation_size = simulation_size
+        self.bricks_per_axis = math.ceil(simulation_size / BRICK_SIZE)
+        self.brick_count = self.bricks_per_axis ** 3
+        self.max_device_bricks = max_device_bricks or self.brick_count
+        self.request_capacity = request_capacity
+        self.cold_steps = cold_steps
+
+        self.page_table_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.brick_count * 4)
+        cl.enqueue_fill_buffer(cl_queue, self.page_table_buffer, np.uint32(BRICK_EMPTY), 0, self.brick_count * 4)
+
+        self.status = np.zeros(3, dtype=np.int32)
+        self.status_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=self.status.nbytes)
+        self.requests_buffer = cl.Buffer(cl_context, cl.mem_flags.READ_WRITE, size=request_capacity * 4)
+
+        # Work-group per brick for the brick kernels
+        self.brick_group_size = min(BRICK_VOLUME, cl_queue.device.max_work_group_size)
+        self.decay_trails_launcher = KernelLauncher(cl_queue, program, "sparse_decay_trails", (1,),
+                                                    (self.brick_group_size,))
+        self.spill_bricks_launcher = KernelLauncher(cl_queue, program, "sparse_spill_bricks", (1,),
+                                                    (self.brick_group_size,))
+        self.restore_bricks_launcher = KernelLauncher(cl_queue, program, "sparse_restore_bricks", (1,),
+                                                      (self.brick_group_size,))
+        self.set_pages_launcher = KernelLauncher(cl_queue, program, "sparse_set_pages", (1,))
+
+        # The pool starts empty and is grown to the initial size like any later growth
+        self.capacity = 0
+        self.pool_buffer = self.slot_bricks_buffer = self.free_slots_buffer = self.brick_stamps_buffer = None
+        self.grow(min(initial_bricks, self.max_device_bricks))
+
+        # Host side of spilled bricks: brick -> (row in the spill file, total decay when spilled, peak value)
+        self.spill_file = tempfile.TemporaryFile()
+        self.spill_capacity = 0
+        self.spill_rows = None
+        self.free_spill_rows = []
+        self.spilled = {}
+
+        # Decay applied to the volume since the start, what a spilled brick missed is the difference
+        self.total_decay = 0.0
+        self.step = 0
+
+    def grow(self, capacity):
+        """Reallocates the pool for capacity slots, the bricks and free slots there already are kept"""
+        old_capacity = self.capacity
+        free_count = int(self.status[STATUS_FREE_COUNT])
+
+        pool_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * BRICK_VOLUME * 4)
+        slot_bricks_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * 4)
+        free_slots_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * 4)
+        brick_stamps_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE, size=capacity * 4)
+
+        # New slots are zero and free
+        cl.enqueue_fill_buffer(self.cl_queue, pool_buffer, np.float32(0), 0, pool_buffer.size)
+        cl.enqueue_fill_buffer(self.cl_queue, slot_bricks_buffer, np.uint32(BRICK_EMPTY), 0, slot_bricks_buffer.size)
+        cl.enqueue_fill_buffer(self.cl_queue, brick_stamps_buffer, np.uint32(0), 0, brick_stamps_buffer.size)
+        if old_capacity:
+            cl.enqueue_copy(self.cl_queue, pool_buffer, self.pool_buffer, byte_count=self.pool_buffer.size)
+            cl.enqueue_copy(self.cl_queue, slot_bricks_buffer, self.slot_bricks_buffer,
+                            byte_count=self.slot_bricks_buffer.size)
+            cl.enqueue_copy(self.cl_queue, brick_stamps_buffer, self.brick_stamps_buffer,
+                            byte_count=self.brick_stamps_buffer.size)
+            if free_count:
+                cl.enqueue_copy(self.cl_queue, free_slots_buffer, self.free_slots_buffer, byte_count=free_count * 4)
+
+        # Lowest slots on top of the stack, so the pool fills from the front
+        new_slots = np.arange(capacity - 1, old_capacity - 1, -1, dtype=np.uint32)
+        cl.enqueue_copy(self.cl_queue, free_slots_buffer, new_slots, dst_offset=free_count * 4)
+
+        self.pool_buffer = pool_buffer
+        self.slot_bricks_buffer = slot_bricks_buffer
+        self.free_slots_buffer = free_slots_buffer
+        self.brick_stamps_buffer = brick_stamps_buffer
+        self.capacity = capacity
+
+        self.status[STATUS_FREE_COUNT] = free_count + len(new_slots)
+        cl.enqueue_copy(self.cl_queue, self.status_buffer, self.status).wait()
+
+        self.decay_trails_launcher.set_args(self.pool_buffer, self.page_table_buffer, self.slot_bricks_buffer,
+                                            self.free_slots_buffer, self.status_buffer, self.settings_buffer,
+                                            np.float32(0), cl.LocalMemory(4))
+        self.decay_trails_launcher.set_global_size((capacity * self.brick_group_size,))
+
+        if old_capacity:
+            print(f"Grew the brick pool to {capacity} bricks ({self.get_device_bytes() / 2 ** 20:.0f} MB)")
+
+    def decay(self, decay_speed, delta_time):
+        self.decay_trails_launcher.set_arg(6, np.float32(delta_time))
+        self.decay_trails_launcher()
+        self.total_decay += decay_speed * delta_time
+
+    def maintain(self):
+        """
+        Between steps: brings back the bricks sensors asked for, drops spilled bricks that decayed away on the host,
+        and makes room in the pool by growing it or spilling cold bricks when it ran out or is about to.
+        Returns whether the pool buffers were replaced, kernels outside the volume have to bind them again then.
+        """
+        cl.enqueue_copy(self.cl_queue, self.status, self.status_buffer).wait()
+        overflows = int(self.status[STATUS_OVERFLOWS])
+        request_count = min(int(self.status[STATUS_REQUESTS]), self.request_capacity)
+        requests = np.empty(request_count, dtype=np.uint32)
+        if request_count:
+            cl.enqueue_copy(self.cl_queue, requests, self.requests_buffer).wait()
+
+        self.drop_decayed_spills()
+        requests = np.array([brick for brick in requests if int(brick) in self.spilled], dtype=np.uint32)
+
+        # Room for what was asked back plus an eighth of the pool for new bricks, never more than there are bricks
+        # without a slot
+        free_count = int(self.status[STATUS_FREE_COUNT])
+        headroom = min(self.capacity // 8, self.brick_count - (self.capacity - free_count))
+        needed = len(requests) + headroom
+        grown = False
+        if overflows or free_count < needed:
+            grown = self.make_room(needed + overflows)
+
+        restored = min(len(requests), int(self.status[STATUS_FREE_COUNT]))
+        if restored:
+            self.restore(requests[:restored])
+        if restored < len(requests):
+            # Asked for again the next time they're sensed
+            self.set_pages(requests[restored:], BRICK_SPILLED)
+
+        self.status[STATUS_OVERFLOWS] = 0
+        self.status[STATUS_REQUESTS] = 0
+        cl.enqueue_copy(self.cl_queue, self.status_buffer, self.status).wait()
+        return grown
+
+    def make_room(self, needed):
+        """Grows the pool by doubling while the budget allows, spills the coldest bricks after that"""
+        free_count = int(self.status[STATUS_FREE_COUNT])
+        if self.capacity < self.max_device_bricks:
+            capacity = self.capacity
+            while capacity - self.capacity + free_count < needed and capacity < self.max_device_bricks:
+                capacity = min(capacity * 2, self.max_device_bricks)
+            self.grow(capacity)
+            return True
+
+        self.spill_cold_bricks(needed - free_count)
+        return False
+
+    def spill_cold_bricks(self, count):
+        """Moves up to count bricks nobody drew into for cold_steps steps to the host, least recently drawn first"""
+        slot_bricks = np.empty(self.capacity, dtype=np.uint32)
+        stamps = np.empty(self.capacity, dtype=np.uint32)
+        cl.enqueue_copy(self.cl_queue, slot_bricks, self.slot_bricks_buffer)
+        cl.enqueue_copy(self.cl_queue, stamps, self.brick_stamps_buffer).wait()
+
+        age = (np.uint32(self.step) - stamps).astype(np.int64)
+        candidates = np.flatnonzero((slot_bricks != BRICK_EMPTY) & (age >= self.cold_steps))
+        slots = candidates[np.argsort(-age[candidates], kind="stable")][:max(count, 0)].astype(np.uint32)
+        if not len(slots):
+            return
+
+        slots_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=slots)
+        spilled_buffer = cl.Buffer(self.cl_context, cl.mem_flags.WRITE_ONLY, size=len(slots) * BRICK_VOLUME * 4)
+        self.spill_bricks_launcher.set_args(self.pool_buffer, self.page_table_buffer, self.slot_bricks_buffer,
+                                            self.free_slots_buffer, self.status_buffer, slots_buffer, spilled_buffer)
+        self.spill_bricks_launcher.set_global_size((len(slots) * self.brick_group_size,))
+        self.spill_bricks_launcher()
+
+        bricks = np.empty((len(slots), BRICK_VOLUME), dtype=np.float32)
+        cl.enqueue_copy(self.cl_queue, bricks, spilled_buffer).wait()
+        self.status[STATUS_FREE_COUNT] += len(slots)
+
+        rows = self.get_spill_rows(len(slots))
+        self.spill_rows[rows] = bricks
+        for row, brick, values in zip(rows, slot_bricks[slots], bricks):
+            self.spilled[int(brick)] = (row, self.total_decay, float(values.max()))
+
+    def get_spill_rows(self, count):
+        """Free rows of the spill file, the file is extended when there aren't enough"""
+        if len(self.free_spill_rows) < count:
+            spill_capacity = max(self.spill_capacity * 2, self.spill_capacity + count, 1024)
+            self.spill_file.truncate(spill_capacity * BRICK_VOLUME * 4)
+            self.spill_rows = np.memmap(self.spill_file, dtype=np.float32, mode="r+",
+                                        shape=(spill_capacity, BRICK_VOLUME))
+            self.free_spill_rows.extend(range(self.spill_capacity, spill_capacity))
+            self.spill_capacity = spill_capacity
+
+        rows = self.free_spill_rows[-count:]
+        del self.free_spill_rows[-count:]
+        return rows
+
+    def restore(self, bricks):
+        """Puts spilled bricks back into free slots, with the decay they missed on the host"""
+        values = np.empty((len(bricks), BRICK_VOLUME), dtype=np.float32)
+        for i, brick in enumerate(bricks):
+            row, decay_at_spill, _ = self.spilled.pop(int(brick))
+            values[i] = np.maximum(self.spill_rows[row] - np.float32(self.total_decay - decay_at_spill), 0.0)
+            self.free_spill_rows.append(row)
+
+        bricks_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=bricks)
+        values_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=values)
+        self.restore_bricks_launcher.set_args(self.pool_buffer, self.page_table_buffer, self.slot_bricks_buffer,
+                                              self.free_slots_buffer, self.status_buffer, self.brick_stamps_buffer,
+                                              bricks_buffer, values_buffer, np.uint32(self.step), cl.LocalMemory(4))
+        self.restore_bricks_launcher.set_global_size((len(bricks) * self.brick_group_size,))
+        self.restore_bricks_launcher().wait()
+        self.status[STATUS_FREE_COUNT] -= len(bricks)
+
+    def drop_decayed_spills(self):
+        """Spilled bricks whose peak has decayed away are empty, their rows are freed"""
+        decayed = [brick for brick, (_, decay_at_spill, peak) in self.spilled.items()
+                   if peak <= self.total_decay - decay_at_spill]
+        for brick in decayed:
+            self.free_spill_rows.append(self.spilled.pop(brick)[0])
+        if decayed:
+            self.set_pages(np.array(decayed, dtype=np.uint32), BRICK_EMPTY)
+
+    def set_pages(self, bricks, value):
+        bricks_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY | cl.mem_flags.COPY_HOST_PTR, hostbuf=bricks)
+        self.set_pages_launcher.set_args(self.page_table_buffer, bricks_buffer, np.uint32(len(bricks)),
+                                         np.uint32(value))
+        self.set_pages_launcher.set_global_size((len(bricks),))
+        self.set_pages_launcher().wait()
+
+    def get_device_bytes(self):
+        """Device memory of the volume, the page table plus the pool and its bookkeeping"""
+        return self.brick_count * 4 + self.capacity * (BRICK_VOLUME + 3) * 4 + (self.request_capacity + 3) * 4
+
+    def get_active_bricks(self):
+        """Bricks in the pool and bricks spilled to the host"""
+        cl.enqueue_copy(self.cl_queue, self.status, self.status_buffer).wait()
+        return self.capacity - int(self.status[STATUS_FREE_COUNT]), len(self.spilled)
+
+    def get_volume(self):
+        """Dense copy of the volume, indexed [z, y, x], spilled bricks included. Only for domains that fit."""
+        size = self.simulation_size
+        padded_size = self.bricks_per_axis * BRICK_SIZE
+        volume = np.zeros((padded_size, padded_size, padded_size), dtype=np.float32)
+
+        page_table = np.empty(self.brick_count, dtype=np.uint32)
+        pool = np.empty((self.capacity, BRICK_VOLUME), dtype=np.float32)
+        cl.enqueue_copy(self.cl_queue, page_table, self.page_table_buffer)
+        cl.enqueue_copy(self.cl_queue, pool, self.pool_buffer).wait()
+
+        bricks = {brick: pool[slot] for brick, slot in enumerate(page_table) if slot < BRICK_RESERVED}
+        for brick, (row, decay_at_spill, _) in self.spilled.items():
+            bricks[brick] = np.maximum(self.spill_rows[row] - np.float32(self.total_decay - decay_at_spill), 0.0)
+
+        for brick, values in bricks.items():
+            brick_z, rest = divmod(brick, self.bricks_per_axis ** 2)
+            brick_y, brick_x = divmod(rest, self.bricks_per_axis)
+            z, y, x = brick_z * BRICK_SIZE, brick_y * BRICK_SIZE, brick_x * BRICK_SIZE
+            volume[z:z + BRICK_SIZE, y:y + BRICK_SIZE, x:x + BRICK_SIZE] = values.reshape((BRICK_SIZE,) * 3)
+        return volume[:size, :size, :size]
+
+
+class SparseSimulation3D:
+    """The 3D simulation on a SparseVolume, for domains whose dense volume wouldn't fit on the device"""
+
+    def __init__(self, simulation_size=1024, spore_count=100000, spawn_size=128, max_device_bricks=None,
+                 maintenance_interval=8):
+        self.simulation_size = simulation_size
+        self.spore_count = spore_count
+        self.maintenance_interval = maintenance_interval
+
+        self.spore_speed = 17
+        self.decay_speed = 0.4
+        self.sensor_distance = 14
+        self.turn_speed = 11
+
+        self.cl_context, self.cl_queue = GameEngine.initialize_opencl()
+        source = GameEngine.load_file("Shaders/3d_simulation.cl") + GameEngine.load_file("Shaders/sparse_simulation.cl")
+        self.program = cl.Program(self.cl_context, source).build()
+
+        self.settings = np.zeros(1, dtype=SETTINGS_DTYPE)
+        self.settings_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_ONLY, size=self.settings.nbytes)
+        self.update_settings_buffer()
+
+        self.volume = SparseVolume(self.cl_context, self.cl_queue, self.program, self.settings_buffer,
+                                   simulation_size, max_device_bricks=max_device_bricks)
+
+        # Spores start in a cube of spawn_size around the center, the domain around it fills as they spread
+        self.spores = self.get_spawned_spores(spawn_size)
+        self.spores_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
+                                       hostbuf=self.spores)
+        random_seeds = np.random.randint(0, 2 ** 32 - 1, size=spore_count + 1, dtype=np.uint32)
+        self.random_seeds_buffer = cl.Buffer(self.cl_context, cl.mem_flags.READ_WRITE | cl.mem_flags.COPY_HOST_PTR,
+                                             hostbuf=random_seeds)
+
+        spore_shape = (max(spore_count, 1),)
+        self.allocate_bricks_launcher = KernelLauncher(self.cl_queue, self.program, "sparse_allocate_bricks",
+                                                       spore_shape)
+        self.draw_spores_launcher = KernelLauncher(self.cl_queue, self.program, "sparse_draw_spores", spore_shape)
+        self.move_spores_launcher = KernelLauncher(self.cl_queue, self.program, "sparse_move_spores", spore_shape)
+        self.bind_volume()
+
+    def get_spawned_spores(self, spawn_size):
+        spores = np.zeros(self.spore_count, dtype=SPORE_DTYPE)
+        low = max(self.simulation_size - spawn_size, 0) / 2
+        high = min(low + spawn_size, self.simulation_size - 0.001)
+        for axis in ("x", "y", "z"):
+            spores[axis] = np.random.uniform(low, high, size=self.spore_count)
+
+        directions = np.random.randn(self.spore_count, 3)
+        directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+        spores["dir_x"], spores["dir_y"], spores["dir_z"] = directions.T
+        return spores
+
+    def bind_volume(self):
+        """Binds the volume's buffers, again whenever its pool was grown"""
+        volume = self.volume
+        bricks_per_axis = np.uint32(volume.bricks_per_axis)
+        request_capacity = np.uint32(volume.request_capacity)
+
+        self.allocate_bricks_launcher.set_args(self.spores_buffer, self.settings_buffer, volume.page_table_buffer,
+                                               bricks_per_axis, volume.slot_bricks_buffer, volume.free_slots_buffer,
+                                               volume.status_buffer, volume.requests_buffer, request_capacity)
+        self.draw_spores_launcher.set_args(self.spores_buffer, self.settings_buffer, volume.page_table_buffer,
+                                           bricks_per_axis, volume.pool_buffer, volume.brick_stamps_buffer,
+                                           np.uint32(0))
+        self.move_spores_launcher.set_args(self.spores_buffer, self.random_seeds_buffer, self.settings_buffer,
+                                           volume.page_table_buffer, bricks_per_axis, volume.pool_buffer,
+                                           volume.status_buffer, volume.requests_buffer, request_capacity,
+                                           np.float32(0))
+
+    def update_settings_buffer(self):
+        self.settings[0] = (self.spore_count, self.simulation_size, self.spore_speed, self.decay_speed,
+                            self.turn_speed, self.sensor_distance, BOUNDARY_MODES.index("bounce"))
+        cl.enqueue_copy(self.cl_queue, self.settings_buffer, self.settings).wait()
+
+    def step(self, delta_time):
+        """Decays, draws and moves like Simulation3D.simulate, with the volume maintained every few steps"""
+        self.volume.decay(self.decay_speed, delta_time)
+        self.allocate_bricks_launcher()
+        self.draw_spores_launcher.set_arg(6, np.uint32(self.volume.step))
+        self.draw_spores_launcher()
+        self.move_spores_launcher.set_arg(9, np.float32(delta_time))
+        self.move_spores_launcher()
+
+        self.volume.step += 1
+        if self.volume.step % self.maintenance_interval == 0 and self.volume.maintain():
+            self.bind_volume()
+
+    def get_spores(self):
+        spores = np.empty(self.spore_count, dtype=SPORE_DTYPE)
+        cl.enqueue_copy(self.cl_queue, spores, self.spores_buffer).wait()
+        return spores
+
+
+if __name__ == '__main__':
+    # A 1024^3 dense volume would be 4 GB, the sparse one holds only the bricks the spores have reached
+    simulation = SparseSimulation3D(simulation_size=1024, spore_count=200000, spawn_size=96)
+
+    steps = 200
+    start = time.perf_counter()
+    for step in range(steps):
+        simulation.step(1 / 30)
+        if (step + 1) % 50 == 0:
+            device_bricks, spilled_bricks = simulation.volume.get_active_bricks()
+            print(f"Step {step + 1}: {device_bricks} bricks on the device, {spilled_bricks} spilled, "
+                  f"{simulation.volume.get_device_bytes() / 2 ** 20:.0f} MB of device memory")
+    simulation.cl_queue.finish()
+    elapsed = time.perf_counter() - start
+
+    print(f"{steps} steps in {elapsed:.2f}s ({steps / elapsed:.1f} steps/s)")
+    print(f"Dense volume would take {simulation.simulation_size ** 3 * 4 / 2 ** 30:.1f} GB")
@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+
+
+class TimeSeriesWriter:
+    """
+    Appends rows to a columnar time series, one raw binary file per column in a directory.
+
+    columns.json next to the column files lists each column's dtype and width, load_time_series reads them back.
+    Every row is flushed straight away so a crashed run still leaves its series behind.
+    """
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = {name: (np.dtype(dtype), width) for name, (dtype, width) in columns.items()}
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, "columns.json"), 'w') as file:
+            json.dump({name: {"dtype": dtype.str, "width": width} for name, (dtype, width) in self.columns.items()},
+                      file, indent=2)
+
+        self.files = {name: open(os.path.join(directory, name + ".bin"), 'ab') for name in self.columns}
+
+    def append(self, row):
+        for name, (dtype, width) in self.columns.items():
+            values = np.asarray(row[name], dtype=dtype).reshape(width)
+            self.files[name].write(values.tobytes())
+            self.files[name].flush()
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+
+def load_time_series(directory):
+    """Reads a series written by TimeSeriesWriter into a dict of arrays, one row per sample"""
+    with open(os.path.join(directory, "columns.json"), 'r') as file:
+        columns = json.load(file)
+
+    series = {}
+    for name, column in columns.items():
+        values = np.fromfile(os.path.join(directory, name + ".bin"), dtype=np.dtype(column["dtype"]))
+        series[name] = values.reshape(-1, column["width"]) if column["width"] > 1 else values
+    return series
@@ -0,0 +1,33 @@
+import threading
+
+
+class TripleBuffer:
+    """
+    Hands the newest value from one producer thread to one consumer thread.
+
+    The producer fills its own back slot and the consumer reads its own front slot, only the swap of slot indices is
+    guarded, so neither side ever waits for the other to finish writing or reading. Values the consumer never got
+    to are simply overwritten by newer ones.
+    """
+
+    def __init__(self):
+        self.slots = [None, None, None]
+        self.back, self.middle, self.front = 0, 1, 2
+        self.fresh = False
+        self.swap_lock = threading.Lock()
+
+    def publish(self, value):
+        """Producer side, makes value the newest one"""
+        self.slots[self.back] = value
+        with self.swap_lock:
+            self.back, self.middle = self.middle, self.back
+            self.fresh = True
+
+    def acquire(self):
+        """Consumer side, the newest value published since the last call or None if there is nothing new"""
+        with self.swap_lock:
+            if not self.fresh:
+                return None
+            self.front, self.middle = self.middle, self.front
+            self.fresh = False
+        return self.slots[self.front]
@@ -0,0 +1,183 @@
+import ctypes
+import os
+import queue
+import threading
+
+import numpy as np
+from OpenGL.GL import *
+
+
+class VideoExporter:
+    """
+    Renders frames offscreen at any resolution and writes them out as a video without stalling the GPU.
+
+    Frames are drawn into a framebuffer object between begin_frame and end_frame. end_frame only queues a glReadPixels
+    into a pixel buffer object of the ring and a fence behind it, the pixels are mapped ring_size - 1 frames later,
+    when the GPU is long done with them. A writer thread flips and writes them out, as one PPM image per frame into
+    a directory, or appended to a single raw RGB stream when raw is set.
+    """
+
+    def __init__(self, width, height, path, frame_rate=30, raw=False, ring_size=3, queue_size=8):
+        self.width = width
+        self.height = height
+        self.path = path
+        self.frame_rate = frame_rate
+        self.raw = raw
+        self.nbytes = width * height * 4
+
+        self.framebuffer, self.renderbuffers = self.initialize_framebuffer(width, height)
+
+        # Ring of pixel buffer objects the frames are read into, each with the fence of its pending read
+        self.pixel_buffers = [glGenBuffers(1) for _ in range(ring_size)]
+        for pixel_buffer in self.pixel_buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pixel_buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.nbytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.fences = [None] * ring_size
+        self.next_slot = 0
+
+        # Output, a directory of numbered images or one stream file
+        if raw:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.stream = open(path, "wb")
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.stream = None
+
+        self.frames_captured = 0
+        self.frames_written = 0
+        self.previous_viewport = None
+
+        # The queue is bounded, a writer that falls behind slows the capture down instead of filling the memory
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.writer_error = None
+        self.writer = threading.Thread(target=self.write_frames, name="video writer", daemon=True)
+        self.writer.start()
+
+    @staticmethod
+    def initialize_framebuffer(width, height):
+        """Framebuffer with a colour and a depth renderbuffer of the export resolution"""
+        framebuffer = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+
+        color, depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, color)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, depth)
+
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Export framebuffer of {width}x{height} is incomplete, status {status}")
+
+        return framebuffer, (color, depth)
+
+    def begin_frame(self):
+        """Points drawing at the export framebuffer"""
+        if self.writer_error:
+            raise self.writer_error
+
+        self.previous_viewport = glGetIntegerv(GL_VIEWPORT)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glViewport(0, 0, self.width, self.height)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    def end_frame(self):
+        """Queues the read of the frame just drawn, hands over the oldest one in the ring and goes back to the window"""
+        slot = self.next_slot
+        if self.fences[slot] is not None:
+            self.read_slot(slot)
+
+        # With a pack buffer bound glReadPixels returns right away, the copy happens on the GPU
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pixel_buffers[slot])
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.fences[slot] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.next_slot = (slot + 1) % len(self.pixel_buffers)
+        self.frames_captured += 1
+
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(*self.previous_viewport)
+
+    def blit(self, window_width, window_height):
+        """Shows the last exported frame in the window, scaled to fit at its aspect ratio"""
+        scale = min(window_width / self.width, window_height / self.height)
+        width, height = int(self.width * scale), int(self.height * scale)
+        left, bottom = (window_width - width) // 2, (window_height - height) // 2
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        glBlitFramebuffer(0, 0, self.width, self.height, left, bottom, left + width, bottom + height,
+                          GL_COLOR_BUFFER_BIT, GL_LINEAR)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, 0)
+
+    def read_slot(self, slot):
+        """Waits for the slot's read, normally finished frames ago, and queues a copy of its pixels for the writer"""
+        fence = self.fences[slot]
+        self.fences[slot] = None
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1_000_000_000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pixel_buffers[slot])
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.nbytes, GL_MAP_READ_BIT)
+        frame = np.ctypeslib.as_array((ctypes.c_ubyte * self.nbytes).from_address(pointer)).copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.frames.put(frame)
+
+    def write_frames(self):
+        """Writer thread: flips the frames upright, drops the alpha and writes them until it gets None"""
+        header = f"P6\n{self.width} {self.height}\n255\n".encode()
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    return
+
+                # GL reads rows bottom up
+                pixels = frame.reshape(self.height, self.width, 4)[::-1, :, :3].tobytes()
+                if self.raw:
+                    self.stream.write(pixels)
+                else:
+                    with open(os.path.join(self.path, f"frame_{self.frames_written:06d}.ppm"), "wb") as file:
+                        file.write(header)
+                        file.write(pixels)
+                self.frames_written += 1
+        except Exception as error:
+            # Raised again on the render thread, the queue is drained so it never blocks on a dead writer
+            self.writer_error = error
+            while self.frames.get() is not None:
+                pass
+
+    def close(self):
+        """Reads the frames still in the ring, waits for the writer and frees the GL objects"""
+        for offset in range(len(self.pixel_buffers)):
+            slot = (self.next_slot + offset) % len(self.pixel_buffers)
+            if self.fences[slot] is not None:
+                self.read_slot(slot)
+
+        self.frames.put(None)
+        self.writer.join()
+        if self.stream:
+            self.stream.close()
+
+        glDeleteBuffers(len(self.pixel_buffers), self.pixel_buffers)
+        glDeleteRenderbuffers(len(self.renderbuffers), self.renderbuffers)
+        glDeleteFramebuffers(1, [self.framebuffer])
+
+        if self.writer_error:
+            raise self.writer_error
+
+        print(f"Exported {self.frames_written} frames of {self.width}x{self.height} to {self.path}")
+        source = (f"-f rawvideo -pix_fmt rgb24 -s {self.width}x{self.height} -r {self.frame_rate} -i {self.path}"
+                  if self.raw else f"-r {self.frame_rate} -i {os.path.join(self.path, 'frame_%06d.ppm')}")
+        print(f"Encode with: ffmpeg {source} -pix_fmt yuv420p video.mp4")
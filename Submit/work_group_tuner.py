@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import pyopencl as cl
+
+
+class WorkGroupTuner:
+    """
+    Benchmarks local sizes for kernel launchers on the current device and remembers the fastest one.
+
+    Results are kept in a json table keyed by device and then by kernel name and global size, so later runs
+    on the same device only look the local size up.
+    """
+
+    def __init__(self, cl_queue, table_path="work_group_sizes.json", repeats=5, max_candidates=32):
+        self.cl_queue = cl_queue
+        self.device = cl_queue.device
+        self.table_path = table_path
+        self.repeats = repeats
+        self.max_candidates = max_candidates
+        self.table = self.load_table()
+
+    def get_device_key(self):
+        return f"{self.device.platform.name} / {self.device.name} / {self.device.driver_version}"
+
+    @staticmethod
+    def get_kernel_key(launcher):
+        return f"{launcher.kernel_name} {'x'.join(str(size) for size in launcher.global_size)}"
+
+    def load_table(self):
+        if not os.path.exists(self.table_path):
+            return {}
+        try:
+            with open(self.table_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            print("Ignoring unreadable work-group table:", error)
+            return {}
+
+    def save_table(self):
+        # Write then rename so an interrupted save never leaves a broken table behind
+        temporary_path = self.table_path + ".tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump(self.table, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.table_path)
+
+    def get_candidates(self, launcher):
+        """Local sizes the device accepts for the kernel, largest work-groups first"""
+        max_group_size = launcher.kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, self.device)
+        multiple = launcher.kernel.get_work_group_info(
+            cl.kernel_work_group_info.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, self.device)
+        max_item_sizes = self.device.max_work_item_sizes
+
+        # Powers of two per dimension, no larger than the next power of two of the global size
+        dimension_sizes = []
+        for dimension, global_size in enumerate(launcher.global_size):
+            limit = min(max_item_sizes[dimension], max_group_size, 1 << (max(global_size, 1) - 1).bit_length())
+            dimension_sizes.append([1 << power for power in range(limit.bit_length()) if 1 << power <= limit])
+
+        candidates = [()]
+        for sizes in dimension_sizes:
+            candidates = [candidate + (size,) for candidate in candidates for size in sizes]
+
+        def get_group_size(candidate):
+            group_size = 1
+            for size in candidate:
+                group_size *= size
+            return group_size
+
+        candidates = [candidate for candidate in candidates if get_group_size(candidate) <= max_group_size]
+
+        # Prefer whole multiples of the device's preferred size, fall back to everything if none fit
+        preferred = [candidate for candidate in candidates if get_group_size(candidate) % multiple == 0]
+        candidates = preferred or candidates
+
+        # Big groups and a wide first dimension (coalesced along x) first
+        candidates.sort(key=lambda candidate: (-get_group_size(candidate), [-size for size in candidate]))
+        return candidates[:self.max_candidates]
+
+    def benchmark(self, launcher, local_size):
+        """Average seconds per launch, None if the driver refused the local size"""
+        launcher.set_local_size(local_size)
+        try:
+            launcher()
+            self.cl_queue.finish()
+
+            start = time.perf_counter()
+            for _ in range(self.repeats):
+                launcher()
+            self.cl_queue.finish()
+        except cl.Error:
+            return None
+        return (time.perf_counter() - start) / self.repeats
+
+    def tune(self, launcher, preserved_buffers=()):
+        """
+        Finds the fastest local size for the launcher, None if the driver's own choice wins.
+
+        The kernel runs many times while benchmarking, buffers it changes can be listed in preserved_buffers
+        to have them restored afterwards.
+        """
+        backups = []
+        for buffer in preserved_buffers:
+            backup = cl.Buffer(self.cl_queue.context, cl.mem_flags.READ_WRITE, size=buffer.size)
+            cl.enqueue_copy(self.cl_queue, backup, buffer)
+            backups.append(backup)
+
+        best_local_size, best_time = None, self.benchmark(launcher, None)
+        for local_size in self.get_candidates(launcher):
+            launch_time = self.benchmark(launcher, local_size)
+            if launch_time is not None and (best_time is None or launch_time < best_time):
+                best_local_size, best_time = local_size, launch_time
+
+        for buffer, backup in zip(preserved_buffers, backups):
+            cl.enqueue_copy(self.cl_queue, buffer, backup)
+        self.cl_queue.finish()
+
+        launcher.set_local_size(best_local_size)
+        return best_local_size
+
+    def apply(self, launcher, preserved_buffers=()):
+        """Sets the launcher's local size from the table, tuning and saving it first if it isn't known yet"""
+        device_table = self.table.setdefault(self.get_device_key(), {})
+        kernel_key = self.get_kernel_key(launcher)
+
+        if kernel_key in device_table:
+            local_size = device_table[kernel_key]
+            launcher.set_local_size(local_size)
+            return launcher.local_size
+
+        print("Tuning work-group size for", kernel_key)
+        local_size = self.tune(launcher, preserved_buffers)
+        print("  using", "driver default" if local_size is None else local_size)
+
+        device_table[kernel_key] = None if local_size is None else list(local_size)
+        self.save_table()
+        return local_size